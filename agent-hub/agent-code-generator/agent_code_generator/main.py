@@ -4,6 +4,7 @@ import os
 from dotenv import load_dotenv
 from openai import OpenAI
 from mofa.agent_build.base.base_agent import MofaAgent, run_agent
+from request_correlation import receive_request_parameters
 from mofa.utils.ai.conn import generate_json_from_llm, structor_llm
 from mofa.utils.files.dir import make_dir
 from mofa.utils.files.read import read_yaml
@@ -44,12 +45,11 @@ def generate_agent_config(user_query:str,agent_config_path:str,env_file_path:str
     return response
 
 
-
 @run_agent
 def run(agent: MofaAgent):
     env_file_path = os.path.join(agent_config_dir_path, '.env.secret')
     agent_config_path = os.path.join(agent_config_dir_path, 'configs', 'agent.yml')
-    receive_data = agent.receive_parameters(['query','agent_config'])
+    receive_data = receive_request_parameters(agent, ['query','agent_config'])
     agent_name = json.loads(receive_data.get('agent_config')).get('agent_name',None)
     module_name = json.loads(receive_data.get('agent_config')).get('module_name',None)
 
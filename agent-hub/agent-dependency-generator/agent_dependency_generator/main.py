@@ -1,6 +1,7 @@
 import json
 import os
 from mofa.agent_build.base.base_agent import MofaAgent, run_agent
+from request_correlation import receive_request_parameters
 from mofa.utils.ai.conn import generate_json_from_llm, structor_llm
 from mofa.utils.files.dir import make_dir
 from mofa.utils.files.read import read_yaml
@@ -78,7 +79,7 @@ def add_toml_info(file_path:str):
 def run(agent: MofaAgent):
     env_file_path = os.path.join(agent_config_dir_path, '.env.secret')
     agent_config_path = os.path.join(agent_config_dir_path, 'configs', 'agent.yml')
-    receive_data = agent.receive_parameters(['query','agent_config','agent_code'])
+    receive_data = receive_request_parameters(agent, ['query','agent_config','agent_code'])
     print('receive_data   : ',receive_data)
     agent_name = json.loads(receive_data.get('agent_config')).get('agent_name',None)
     module_name = json.loads(receive_data.get('agent_config')).get('module_name',None)
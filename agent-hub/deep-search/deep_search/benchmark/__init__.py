@@ -0,0 +1,5 @@
+"""
+Offline end-to-end benchmark of deep-search against local stubs of the
+OpenAI streaming API and the Serper search API: `python -m deep_search.benchmark`.
+"""
+from deep_search.benchmark.stubs import FakeOpenAIServer, FakeSerperServer
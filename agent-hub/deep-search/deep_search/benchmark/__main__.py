@@ -0,0 +1,3 @@
+from deep_search.benchmark.run import main
+
+main()
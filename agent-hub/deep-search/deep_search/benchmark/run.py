@@ -0,0 +1,211 @@
+"""
+Offline end-to-end benchmark of deep-search: runs the node's search
+(search_articles: search cache, Serper client, ranking and deduplication)
+and ResearchGenerator.generate_stream against a fake OpenAI-compatible
+streaming server and a fake Serper endpoint, and reports wall time, time
+to first chunk, LLM calls, searches, prompt and completion tokens, chunks
+emitted and peak RSS.
+
+    python -m deep_search.benchmark --runs 3 --output before.json
+    python -m deep_search.benchmark --runs 3 --output after.json --baseline before.json
+
+The stage settings (DEEP_SEARCH_LLM_CONCURRENCY, DEEP_SEARCH_ARTICLE_TOKENS,
+DEEP_SEARCH_EMIT_BYTES, ...) are read from the environment as in the node.
+Every run searches unless --search-cache keeps the node's search cache
+(SERPER_CACHE_TTL, in memory) across runs. The node's log goes to stderr.
+"""
+import contextlib
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from deep_search.benchmark.stubs import FakeOpenAIServer, FakeSerperServer
+
+# Settings of deep_search.main recorded with every report, so reports are only compared like for like.
+SETTINGS = ("MAX_ARTICLES", "ARTICLE_TOKENS", "PRIOR_TOKENS", "LLM_CONCURRENCY", "LLM_MAX_CONNECTIONS",
+            "ARTICLE_REFS", "EMIT_MAX_BYTES", "EMIT_MAX_MS", "MAP_REDUCE", "MAP_BATCH_TOKENS", "MAP_SUMMARY_TOKENS")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, stubs included."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_once(main, llm_client, llm: FakeOpenAIServer, serper: FakeSerperServer, query: str,
+             map_reduce: bool) -> dict:
+    """One request from the search to the last chunk, timed like the node runs it."""
+    llm.reset()
+    searches = serper.searches
+    sizes = []
+    emitter = main.ChunkEmitter(lambda message: sizes.append(len(message.encode("utf-8"))),
+                                max_bytes=main.EMIT_MAX_BYTES, max_delay=main.EMIT_MAX_MS / 1000)
+    first_chunk = first_content = None
+    chunks = 0
+    started = time.perf_counter()
+    articles = main.search_articles(query)
+    generator = main.ResearchGenerator(articles=articles, llm_client=llm_client, article_refs=main.ARTICLE_REFS,
+                                       map_reduce=map_reduce)
+    for chunk in generator.generate_stream(user_query=query, on_idle=emitter.flush):
+        elapsed = time.perf_counter() - started
+        if first_chunk is None:
+            first_chunk = elapsed
+        if first_content is None and chunk.get("content"):
+            first_content = elapsed
+        chunks += 1
+        emitter.push(chunk)
+    emitter.flush()
+    wall = time.perf_counter() - started
+    stats = llm.stats()
+    return {
+        "wall_s": round(wall, 3),
+        "first_chunk_ms": None if first_chunk is None else round(first_chunk * 1000, 1),
+        "first_content_ms": None if first_content is None else round(first_content * 1000, 1),
+        "articles": len(articles),
+        "searches": serper.searches - searches,
+        **stats,
+        "completion_tokens_per_s": round(stats["completion_tokens"] / wall, 1) if wall else None,
+        "chunks": chunks,
+        "messages": len(sizes),
+        "message_bytes": sum(sizes),
+    }
+
+
+def summarize(runs: List[dict]) -> dict:
+    """The median of every metric over the runs; the lower median for counts."""
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run.get(key) is not None]
+        if not values:
+            summary[key] = None
+        elif all(isinstance(value, int) for value in values):
+            summary[key] = statistics.median_low(values)  # counts stay counts
+        else:
+            summary[key] = round(statistics.median(values), 3)
+    return summary
+
+
+def benchmark(args) -> dict:
+    llm = FakeOpenAIServer(tokens_per_s=args.tokens_per_s, latency=args.llm_latency_ms / 1000,
+                           completion_tokens=args.completion_tokens, model=args.model)
+    serper = FakeSerperServer(results_count=args.results, latency=args.search_latency_ms / 1000)
+    with llm, serper:
+        os.environ["LLM_BASE_URL"] = llm.url + "/v1"
+        os.environ["LLM_API_KEY"] = "benchmark"
+        os.environ["SERPER_URL"] = serper.url + "/search"
+        os.environ["SERPER_API_KEY"] = "benchmark"
+        os.environ["SERPER_CACHE_DIR"] = ""  # never reuse results of an earlier benchmark
+        if not args.search_cache:
+            os.environ["SERPER_CACHE_TTL"] = "0"
+        # Imported once the environment points at the stubs; .env.secret does not override it.
+        from deep_search import main
+        map_reduce = main.MAP_REDUCE if args.map_reduce is None else args.map_reduce
+        # The LLM response cache is left out: every run calls the fake LLM.
+        llm_client = main.LLMClient(model_name=args.model, cache=None)
+        with contextlib.redirect_stdout(sys.stderr):
+            for _ in range(args.warmup):
+                run_once(main, llm_client, llm, serper, args.query, map_reduce)
+            runs = [run_once(main, llm_client, llm, serper, args.query, map_reduce) for _ in range(args.runs)]
+        settings = {name: getattr(main, name) for name in SETTINGS}
+    settings["MAP_REDUCE"] = map_reduce
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "config": {
+            "query": args.query,
+            "results": args.results,
+            "tokens_per_s": args.tokens_per_s,
+            "llm_latency_ms": args.llm_latency_ms,
+            "completion_tokens": args.completion_tokens,
+            "search_latency_ms": args.search_latency_ms,
+            "search_cache": args.search_cache,
+            "model": args.model,
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "settings": settings,
+        },
+        "summary": dict(summarize(runs), peak_rss_mb=peak_rss_mb()),
+        "runs": runs,
+    }
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Lines comparing the summary of `report` with the one of `baseline`."""
+    lines = [f"{'metric':<26}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for key, current in report["summary"].items():
+        before = baseline.get("summary", {}).get(key)
+        if before is None or current is None:
+            change = ""
+        elif before == 0:
+            change = "" if current == 0 else "new"
+        else:
+            change = f"{(current - before) / before * 100:+.1f}%"
+        lines.append(f"{key:<26}{str(before):>12}{str(current):>12}{change:>10}")
+    def setup(r):  # the number of runs does not change what is measured
+        return {k: v for k, v in r.get("config", {}).items() if k not in ("runs", "warmup")}
+
+    if setup(report) != setup(baseline):
+        lines.append("note: the baseline was run with a different configuration")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--query", default="What is DeepSeek?")
+    parser.add_argument("--results", type=int, default=20, help="search results returned by the fake Serper")
+    parser.add_argument("--tokens-per-s", type=float, default=200, help="rate of the fake LLM, 0 for no limit")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="delay before the first token of a call")
+    parser.add_argument("--completion-tokens", type=int, default=200,
+                        help="tokens of every completion, capped by the call's max_tokens")
+    parser.add_argument("--search-latency-ms", type=float, default=500)
+    parser.add_argument("--search-cache", action="store_true",
+                        help="keep the search cache across runs, so only the first run searches")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--map-reduce", action="store_true", default=None,
+                        help="use the map-reduce mode regardless of DEEP_SEARCH_MAP_REDUCE")
+    parser.add_argument("--runs", type=int, default=3, help="measured runs; the summary holds their medians")
+    parser.add_argument("--warmup", type=int, default=0, help="runs before the measured ones")
+    parser.add_argument("--output", help="save the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare with")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    report = benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+    else:
+        summary = report["summary"]
+        print(f"{args.runs} runs, {summary['articles']} articles, medians:")
+        print(f"wall time            {summary['wall_s']} s")
+        print(f"first chunk          {summary['first_chunk_ms']} ms (first content {summary['first_content_ms']} ms)")
+        print(f"searches             {summary['searches']}")
+        print(f"LLM calls            {summary['llm_calls']}, at most {summary['peak_llm_concurrency']} at once")
+        print(f"tokens               {summary['prompt_tokens']} prompt, {summary['completion_tokens']} completion")
+        print(f"chunks               {summary['chunks']} chunks, {summary['messages']} messages, "
+              f"{summary['message_bytes']} bytes")
+        print(f"peak RSS             {summary['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from deep_search.context import count_tokens
+
+# Words the fake LLM and the fake search results are made of.
+VOCABULARY = (
+    "model training inference latency throughput benchmark dataset parameters open source release "
+    "research paper evaluation accuracy reasoning architecture experts tokens context window "
+    "hardware cluster cost efficiency company startup market investors regulation privacy security "
+    "database leak report analysts growth users application assistant chatbot api pricing license "
+    "community github weights distillation reinforcement learning alignment safety benchmark results "
+    "competition performance comparison china united states export chips gpu nvidia cloud deployment"
+).split()
+
+
+class _StubServer:
+    """An HTTP server on a free local port, serving on a daemon thread."""
+
+    handler = None
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        stub = self
+
+        class Handler(self.handler):
+            pass
+
+        Handler.stub = stub
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "_StubServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client's connection pool is exercised
+    stub = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        request = self._json_body()
+        if not request.get("stream"):
+            self._send_json(400, {"error": {"message": "the stub only serves streaming completions"}})
+            return
+        self.stub.stream(self, request)
+
+
+class FakeOpenAIServer(_StubServer):
+    """
+    OpenAI-compatible chat completions endpoint that streams made-up text.
+
+    Every call waits `latency` seconds before its first token and then
+    streams `completion_tokens` tokens (or `max_tokens`, when smaller) at
+    `tokens_per_s`, one token per SSE event; 0 streams as fast as possible.
+    The text is deterministic for a prompt. Calls, prompt and completion
+    tokens (counted like the context packer counts them) and the peak
+    number of concurrent calls are recorded in `stats()`.
+    """
+
+    handler = _OpenAIHandler
+
+    def __init__(self, tokens_per_s: float = 200, latency: float = 0.3, completion_tokens: int = 200,
+                 model: str = "gpt-4o", **kwargs):
+        super().__init__(**kwargs)
+        self.tokens_per_s = tokens_per_s
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+        self.model = model
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.generated_tokens = 0
+            self.active = 0
+            self.peak_active = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "llm_calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.generated_tokens,
+                "peak_llm_concurrency": self.peak_active,
+            }
+
+    def stream(self, handler: _Handler, request: dict):
+        messages = request.get("messages") or []
+        prompt = "".join(str(m.get("content") or "") for m in messages)
+        tokens = self.completion_tokens
+        if request.get("max_tokens"):
+            tokens = min(tokens, int(request["max_tokens"]))
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += count_tokens(prompt, self.model)
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            self._stream(handler, prompt, tokens)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client closed the stream early
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _stream(self, handler: _Handler, prompt: str, tokens: int):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            handler.wfile.flush()
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None):
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": self.model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            })
+
+        completion_id = "chatcmpl-" + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        created = int(time.time())
+        words = random.Random(completion_id)
+        time.sleep(self.latency)
+        event(chunk({"role": "assistant", "content": ""}))
+        started = time.perf_counter()
+        for i in range(tokens):
+            if self.tokens_per_s > 0:
+                # Keep to the schedule rather than sleeping a fixed time per token, so the rate does not drift.
+                delay = started + i / self.tokens_per_s - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            event(chunk({"content": words.choice(VOCABULARY) + " "}))
+            with self.lock:
+                self.generated_tokens += 1
+        event(chunk({}, "stop" if tokens < self.completion_tokens else "length"))
+        event("[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+
+
+class _SerperHandler(_Handler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/search"):
+            self._send_json(404, {"message": f"unknown path {self.path}"})
+            return
+        request = self._json_body()
+        with self.stub.lock:
+            self.stub.searches += 1
+        time.sleep(self.stub.latency)
+        self._send_json(200, self.stub.results(str(request.get("q", "")), int(request.get("num") or self.stub.results_count)))
+
+
+class FakeSerperServer(_StubServer):
+    """
+    Serper-compatible `/search` endpoint answering every query after
+    `latency` seconds with `results_count` organic results whose snippets
+    mix the query with random words, seeded by the query, so runs are
+    comparable and the near-duplicate filter keeps them.
+    """
+
+    handler = _SerperHandler
+
+    def __init__(self, results_count: int = 20, latency: float = 0.5, snippet_words: int = 40, **kwargs):
+        super().__init__(**kwargs)
+        self.results_count = results_count
+        self.latency = latency
+        self.snippet_words = snippet_words
+        self.searches = 0
+
+    def results(self, query: str, num: int) -> dict:
+        rng = random.Random(query)
+        query_words = query.split() or ["research"]
+        organic = []
+        for i in range(num):
+            words = [rng.choice(query_words if rng.random() < 0.15 else VOCABULARY) for _ in range(self.snippet_words)]
+            slug = "-".join(rng.sample(VOCABULARY, 3))
+            organic.append({
+                "title": f"{' '.join(query_words[:3]).title()}: {' '.join(words[:6])}",
+                "link": f"https://example.com/{slug}/{i}",
+                "snippet": " ".join(words).capitalize() + ".",
+                "position": i + 1,
+            })
+        return {"searchParameters": {"q": query, "num": num}, "organic": organic}
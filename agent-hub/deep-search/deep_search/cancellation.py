@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from request_correlation import event_request_id
+
+
+def event_value(event):
+    """The value of an input event: the first element of its Arrow array, None when it is empty."""
+    value = event.get("value")
+    return value[0].as_py() if value is not None and len(value) else None
+
+
+class CancellationWatcher:
+    """
+    Reads the Dora events that arrive while a query is being answered.
+
+    MofaAgent only reads events when it waits for the next query, so a
+    cancellation sent by the server would sit in the queue until the run is
+    over. The watcher polls the node between chunks instead: ids from the
+    `cancel` input are remembered, every other event (e.g. the next query)
+    is kept and handed out again by `receive_parameter`, in order. Only the
+    agent's public `node`, `event` and `receive_parameter` are used.
+
+    Polling happens at most every `poll_interval` seconds and never blocks.
+    At most `max_cancelled` cancelled ids are remembered.
+    """
+
+    def __init__(self, agent, cancel_input: str = "cancel", poll_interval: float = 0.2,
+                 max_cancelled: int = 1024):
+        self.agent = agent
+        self.cancel_input = cancel_input
+        self.poll_interval = poll_interval
+        self.max_cancelled = max_cancelled
+        self.cancelled = OrderedDict()  # request id -> None, oldest first
+        self.deferred = deque()
+        self.closed = False  # the event stream ended, nothing more to poll
+        self._polled_at = 0.0
+
+    def poll(self, force: bool = False):
+        now = time.monotonic()
+        if self.closed or (not force and now - self._polled_at < self.poll_interval):
+            return
+        self._polled_at = now
+        while True:
+            event = self.agent.node.next(timeout=0.001)
+            if event is None:
+                self.closed = True
+                return
+            if event["type"] == "ERROR":
+                # `node.next` timed out: no more events for now
+                return
+            if event["type"] == "INPUT" and event["id"] == self.cancel_input:
+                self._cancel(event)
+            else:
+                self.deferred.append(event)
+
+    def is_cancelled(self, request_id: Optional[str]) -> bool:
+        if request_id is None:
+            return False
+        self.poll()
+        return str(request_id) in self.cancelled
+
+    def receive_parameter(self, parameter_name: str):
+        """
+        Like `MofaAgent.receive_parameter`, but events deferred during the
+        previous run are handled first. Sets `agent.event` to the event of
+        the returned value, so outputs carry its metadata.
+        """
+        while self.deferred:
+            event = self.deferred.popleft()
+            if event["type"] == "INPUT" and event["id"] == parameter_name:
+                self.agent.event = event
+                return event_value(event)
+        return self.agent.receive_parameter(parameter_name)
+
+    def _cancel(self, event):
+        request_id = event_request_id(event)
+        if request_id is None:
+            request_id = event_value(event)
+        if not request_id:
+            return
+        self.cancelled[str(request_id)] = None
+        while len(self.cancelled) > self.max_cancelled:
+            self.cancelled.popitem(last=False)
@@ -0,0 +1,53 @@
+from typing import List, Sequence
+
+# Token counting is shared with the OpenAI servers: exact with tiktoken, approximate without it.
+from openai_server_common.tokens import TRUNCATION_MARK, count_tokens, truncate_tokens
+
+
+class ContextPacker:
+    """
+    Fits the context of a prompt into a token budget.
+
+    `articles` packs article snippets greedily by relevance into
+    `article_tokens`: snippets are added while they fit, and the first one
+    that does not is cut to the tokens left. `fit` packs earlier stage
+    outputs, given oldest first, into `prior_tokens`: the newest outputs
+    are kept whole and the older ones are cut, or dropped once the budget
+    is used up.
+    """
+
+    def __init__(self, model: str = "gpt-4o", article_tokens: int = 2000, prior_tokens: int = 6000,
+                 min_piece: int = 32):
+        self.model = model
+        self.article_tokens = article_tokens
+        self.prior_tokens = prior_tokens
+        self.min_piece = min_piece  # a piece is only cut when at least this many tokens of it fit
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def articles(self, articles: Sequence, budget: int = None) -> str:
+        budget = self.article_tokens if budget is None else budget
+        pieces = []
+        for article in sorted(articles, key=lambda a: a.relevance, reverse=True):
+            tokens = self.count(article.snippet) + 1  # the separating space
+            if tokens <= budget:
+                pieces.append(article.snippet)
+                budget -= tokens
+            elif budget >= self.min_piece:
+                pieces.append(truncate_tokens(article.snippet, budget - 1, self.model))
+                budget = 0
+        return " ".join(pieces)
+
+    def fit(self, sections: Sequence[str], budget: int = None) -> List[str]:
+        budget = self.prior_tokens if budget is None else budget
+        fitted = [""] * len(sections)
+        for i in reversed(range(len(sections))):
+            tokens = self.count(sections[i])
+            if tokens <= budget:
+                fitted[i] = sections[i]
+                budget -= tokens
+            elif budget >= self.min_piece:
+                fitted[i] = truncate_tokens(sections[i], budget, self.model)
+                budget = 0
+        return fitted
@@ -0,0 +1,73 @@
+import json
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+def encode_chunk(chunk: dict) -> str:
+    """Compact JSON for a chunk: no indentation, no escaped non-ASCII text."""
+    return json.dumps(chunk, ensure_ascii=False, separators=(",", ":"))
+
+
+class ChunkEmitter:
+    """
+    Batches the deltas of a streamed report before they are sent as Dora
+    outputs.
+
+    Consecutive deltas of the same stage (same type, stage name and stage
+    id) are merged into one chunk: it keeps the fields of the first delta,
+    i.e. its id and articles, with the contents joined. A stage's buffer is
+    sent once it holds `max_bytes` of content or its first delta is
+    `max_delay` seconds old, and every buffer is sent by `flush`. Chunks
+    that carry `end`, or that have no text content (e.g. the articles
+    table), are sent right away, after the buffers before them, so the
+    order of the stream is kept.
+
+    `send` is called with the encoded chunk.
+    """
+
+    def __init__(self, send: Callable[[str], None], max_bytes: int = 2048, max_delay: float = 0.2):
+        self.send = send
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.sent = 0
+        self._buffers: Dict[Tuple, list] = {}  # stage key -> [chunk, content parts, size, started], oldest first
+
+    @staticmethod
+    def _key(chunk: dict) -> Tuple:
+        stage_id = str(chunk.get("id", "")).split("-", 1)[0]
+        return chunk.get("type"), (chunk.get("metadata") or {}).get("stage"), stage_id
+
+    def push(self, chunk: dict):
+        content = chunk.get("content")
+        if chunk.get("end") is not None or not isinstance(content, str) or chunk.get("type") == "articles":
+            self.flush()
+            self._send(chunk)
+            return
+        key = self._key(chunk)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = [chunk, [], 0, time.monotonic()]
+        buffer[1].append(content)
+        buffer[2] += len(content.encode("utf-8"))
+        if buffer[2] >= self.max_bytes:
+            self._flush_key(key)
+        self.flush_due()
+
+    def flush_due(self):
+        """Send the buffers whose first delta is older than `max_delay`."""
+        now = time.monotonic()
+        for key in [k for k, buffer in self._buffers.items() if now - buffer[3] >= self.max_delay]:
+            self._flush_key(key)
+
+    def flush(self):
+        """Send every buffered delta."""
+        for key in list(self._buffers):
+            self._flush_key(key)
+
+    def _flush_key(self, key: Tuple):
+        chunk, parts, _, _ = self._buffers.pop(key)
+        self._send(dict(chunk, content="".join(parts)))
+
+    def _send(self, chunk: dict):
+        self.sent += 1
+        self.send(encode_chunk(chunk))
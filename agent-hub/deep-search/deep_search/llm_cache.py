@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def prompt_key(model: str, messages: List[Dict], max_tokens: Optional[int]) -> str:
+    """Content address of an LLM call: the exact model, messages and max_tokens."""
+    payload = json.dumps({"model": model, "messages": messages, "max_tokens": max_tokens},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Completions of earlier LLM calls, stored as one JSON file per prompt in
+    `directory`, so they survive restarts and can be shared by several
+    processes.
+
+    An entry keeps the streamed deltas of the completion, so a hit is
+    replayed with the same chunking as the original stream. Entries expire
+    after `ttl` seconds; when the files take more than `max_bytes`, the
+    least recently used ones are removed. Only completions that streamed
+    to the end are stored.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0  # completion bytes replayed from the cache instead of generated
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> file size, least recently used first
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """The deltas of the cached completion, None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and entry.get("expires_at", 0) < time.time():
+            self._remove(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += sum(len(chunk.encode("utf-8")) for chunk in entry["chunks"])
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            # The modification time orders entries for eviction after a restart.
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["chunks"]
+
+    def put(self, key: str, chunks: List[str], model: str = None):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        entry = {"model": model, "created": time.time(), "expires_at": time.time() + self.ttl, "chunks": chunks}
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, separators=(",", ":"))
+            size = os.path.getsize(tmp_path)
+            # Readers in other processes only ever see complete files.
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("Could not write LLM cache entry:", e)
+            return
+        with self._lock:
+            self._size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self.stores += 1
+            evicted = []
+            while self._size > self.max_bytes and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._unlink(old_key)
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+        self._unlink(key)
+
+    def _unlink(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._size,
+            }
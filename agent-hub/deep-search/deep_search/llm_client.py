@@ -0,0 +1,150 @@
+import asyncio
+import os
+import queue
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+from openai import AsyncOpenAI
+
+from deep_search.llm_cache import LLMCache, prompt_key
+
+T = TypeVar("T")
+
+
+class AsyncLLMClient:
+    """
+    Streaming OpenAI-compatible chat client on a single keep-alive connection
+    pool.
+
+    All calls share one `httpx.AsyncClient` holding at most `max_connections`
+    connections, idle ones kept open for `keepalive_expiry` seconds, so
+    concurrent stages and consecutive runs reuse connections instead of
+    opening a TCP/TLS connection per call. Streams are read on the event
+    loop without blocking it. The pool is bound to the event loop of the
+    first call; synchronous code uses it through an `EventLoopThread`.
+
+    With a cache, the completion of an identical earlier call is replayed
+    instead of calling the LLM; only completions that streamed to the end
+    are stored.
+    """
+
+    def __init__(self, model_name: str = "gpt-4o", api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: int = 16, keepalive_expiry: float = 60, timeout: float = 600,
+                 cache: Optional[LLMCache] = None):
+        self.model_name = model_name
+        self.api_key = api_key or os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("LLM_BASE_URL") or None
+        self.max_connections = max(1, max_connections)
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.cache = cache
+        self._client = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=self.keepalive_expiry),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+            )
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+        return self._client
+
+    async def stream(self, messages: List[Dict], max_tokens: int = 3200) -> AsyncIterator[str]:
+        """The deltas of the completion of `messages`, as they arrive."""
+        key = None
+        if self.cache is not None:
+            key = prompt_key(self.model_name, messages, max_tokens)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                for content in cached:
+                    yield content
+                return
+        chunks = []
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        try:
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content or ""
+                chunks.append(content)
+                yield content
+        finally:
+            # Closing the stream early (e.g. a cancelled request) stops the completion upstream
+            # and returns the connection to the pool.
+            await response.close()
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, chunks, self.model_name)
+
+    async def complete(self, messages: List[Dict], max_tokens: int = 3200) -> str:
+        """The whole completion of `messages`."""
+        return "".join([content async for content in self.stream(messages, max_tokens)])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+class EventLoopThread:
+    """
+    An event loop running on a daemon thread, so that synchronous code on
+    any thread can share coroutines and async clients bound to that loop.
+    """
+
+    def __init__(self, name: str = "deep-search-llm"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """Run `coroutine` on the loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def iterate(self, iterable: AsyncIterator[T]) -> Iterator[T]:
+        """
+        Iterate over an async generator from synchronous code. Items are
+        read on the loop as they arrive; closing the returned generator
+        cancels the async one.
+        """
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in iterable:
+                    items.put(item)
+                items.put(_DONE)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                items.put(_Failure(e))
+            finally:
+                await iterable.aclose()
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            future.cancel()
@@ -1,9 +1,11 @@
+import hashlib
 import json
 import random
 import time
 import os
+import urllib.request
 import uuid
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import openai
 import numpy as np
 from dotenv import load_dotenv
@@ -11,7 +13,18 @@ from playwright.sync_api import expect
 
 from mofa.agent_build.base.base_agent import MofaAgent, run_agent
 from mofa.kernel.tools.web_search import search_web_with_serper
-from openai import OpenAI
+from request_correlation import REQUEST_ID_KEY, event_request_id
+from request_deadline import deadline_passed
+from search_cache import SearchCache
+
+from deep_search.cancellation import CancellationWatcher
+from deep_search.context import ContextPacker
+from deep_search.emitter import ChunkEmitter, encode_chunk
+from deep_search.llm_cache import LLMCache
+from deep_search.llm_client import AsyncLLMClient, EventLoopThread
+from deep_search.map_reduce import MapReduce, source_text
+from deep_search.ranking import bm25_scores, drop_near_duplicates
+from deep_search.stage_graph import StageGraph
 
 # 加载环境变量
 load_dotenv('.env.secret')
@@ -21,37 +34,60 @@ DEFAULT_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-4o")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
 # 配置项
-MAX_ARTICLES = 50  # 最大处理文章数
-DEFAULT_STREAM_DELAY = 0.1  # 流式延迟
+MAX_ARTICLES = int(os.getenv('DEEP_SEARCH_MAX_ARTICLES', 50))  # 最大处理文章数
+# SimHash 相差不超过该位数的文章视为近似重复，负数表示不去重
+DUPLICATE_BITS = int(os.getenv('DEEP_SEARCH_DUPLICATE_BITS', 10))
+# 每个阶段提示词的 token 预算：文章片段按相关度装入 ARTICLE_TOKENS，之前阶段的输出装入 PRIOR_TOKENS（较早的输出先被截断）
+ARTICLE_TOKENS = int(os.getenv('DEEP_SEARCH_ARTICLE_TOKENS', 2000))
+PRIOR_TOKENS = int(os.getenv('DEEP_SEARCH_PRIOR_TOKENS', 6000))
+# map-reduce 模式：文章按 MAP_BATCH_TOKENS 分批并发总结（每份总结最多 MAP_SUMMARY_TOKENS），总结再逐层合并为一份摘要，
+# 各阶段使用摘要而不是文章片段，因此文章数量增加时每个阶段的 token 数不变
+MAP_REDUCE = os.getenv('DEEP_SEARCH_MAP_REDUCE', 'false').lower() in ('1', 'true', 'yes')
+MAP_BATCH_TOKENS = int(os.getenv('DEEP_SEARCH_MAP_BATCH_TOKENS', 3000))
+MAP_SUMMARY_TOKENS = int(os.getenv('DEEP_SEARCH_MAP_SUMMARY_TOKENS', 400))
+# 同时进行的 LLM 调用数：相互独立的研究阶段并发运行
+LLM_CONCURRENCY = int(os.getenv('DEEP_SEARCH_LLM_CONCURRENCY', 4))
+# LLM 连接池：所有阶段和多次运行共享保持连接的 HTTP 连接，最多 LLM_MAX_CONNECTIONS 个，空闲连接保留 LLM_KEEPALIVE_S 秒
+LLM_MAX_CONNECTIONS = int(os.getenv('DEEP_SEARCH_LLM_MAX_CONNECTIONS', 16))
+LLM_KEEPALIVE_S = float(os.getenv('DEEP_SEARCH_LLM_KEEPALIVE_S', 60))
+# 文章表模式：先发送一次全部文章，之后各阶段只通过 article_ids 引用文章。
+# 需要能展开引用的消费者（如 openai-server-stream），默认关闭以兼容直接读取 articles 的消费者
+ARTICLE_REFS = os.getenv('DEEP_SEARCH_ARTICLE_REFS', 'false').lower() in ('1', 'true', 'yes')
+# 同一阶段的增量合并后再发送：内容达到 EMIT_MAX_BYTES 字节或最早的增量等待超过 EMIT_MAX_MS 毫秒时发送
+EMIT_MAX_BYTES = int(os.getenv('DEEP_SEARCH_EMIT_BYTES', 2048))
+EMIT_MAX_MS = float(os.getenv('DEEP_SEARCH_EMIT_MS', 200))
+# LLM 响应缓存：相同模型、消息和 max_tokens 的调用直接回放磁盘上缓存的补全，目录为空时不启用
+LLM_CACHE_DIR = os.getenv('DEEP_SEARCH_LLM_CACHE_DIR', '')
+LLM_CACHE_MAX_MB = float(os.getenv('DEEP_SEARCH_LLM_CACHE_MAX_MB', 256))
+LLM_CACHE_TTL = float(os.getenv('DEEP_SEARCH_LLM_CACHE_TTL', 7 * 24 * 3600))
+# Serper 搜索缓存：相同查询在有效期内直接使用缓存结果，并发的相同查询只搜索一次；目录可与 serper-search 共享
+SERPER_CACHE_DIR = os.getenv('SERPER_CACHE_DIR', '')
+SERPER_CACHE_TTL = float(os.getenv('SERPER_CACHE_TTL', 3600))
+# Serper 兼容的搜索端点（例如自建代理或基准测试的模拟服务），为空时通过 mofa 调用 Serper
+SERPER_URL = os.getenv('SERPER_URL', '')
 
 
 class LLMClient:
-    def __init__(self, file_path: str = '.env.secret', model_name: str = 'gpt-4o'):
+    """
+    同步接口的 LLM 客户端：在后台事件循环上用 AsyncLLMClient 流式调用 LLM，
+    各阶段的线程只等待增量，所有调用共享一个保持连接的连接池。
+    """
+
+    def __init__(self, file_path: str = '.env.secret', model_name: str = 'gpt-4o', cache: Optional[LLMCache] = None,
+                 max_connections: int = LLM_MAX_CONNECTIONS, loop: Optional[EventLoopThread] = None):
         self.model_name = model_name
-        load_dotenv('.env.secret')
-        if os.getenv('LLM_API_KEY') is not None:
-            os.environ['OPENAI_API_KEY'] = os.getenv('LLM_API_KEY')
-        if os.getenv('LLM_BASE_URL', None) is None:
-            client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-        else:
-            client = OpenAI(api_key=os.environ['OPENAI_API_KEY'], base_url=os.getenv('LLM_BASE_URL'))
-        self.client = client
+        self.cache = cache
+        self.async_client = AsyncLLMClient(model_name, max_connections=max_connections,
+                                           keepalive_expiry=LLM_KEEPALIVE_S, cache=cache)
+        self.loop = loop or EventLoopThread()
 
     def generate_response(self, messages: List[Dict], max_tokens: int = 3200, stream: bool = True):
         """
-        Generate responses in a streaming fashion
+        Generate responses in a streaming fashion. With a cache, the completion of an identical
+        earlier call is replayed chunk by chunk instead of calling the LLM. Closing the generator
+        early (e.g. a cancelled request) stops the completion upstream.
         """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            max_tokens=max_tokens,
-            stream=stream  # Enable streaming responses
-        )
-
-        for chunk in response:
-            # Each chunk contains a portion of content
-            content = chunk.choices[0].delta.content
-            yield "" if content is None else content  # Ensure we always yield a string
+        return self.loop.iterate(self.async_client.stream(messages, max_tokens))
 
 
 class ArticleRef:
@@ -62,6 +98,11 @@ class ArticleRef:
         self.source = source
         self.relevance = relevance
 
+    @property
+    def id(self) -> str:
+        """由 URL 得到的稳定 ID，在文章表和 article_ids 中使用"""
+        return hashlib.sha1((self.url or self.title).encode("utf-8")).hexdigest()[:12]
+
     def dict(self) -> dict:
         return {
             "title": self.title,
@@ -74,13 +115,15 @@ class ArticleRef:
 
 class ArticleProcessor:
     """
-    简化版文章处理器：
+    文章处理器：
     1. 将 serper 返回的结果转换为 ArticleRef 对象
-    2. 基于 URL 去重
-    3. 根据 snippet 长度降序排序
+    2. 基于 URL 去重，再用 SimHash 去掉转载、镜像等近似重复的文章（保留相关度最高的一篇）
+    3. 按 BM25 相关度（标题和 snippet 对用户查询）降序排序；没有查询时按 snippet 长度排序
     """
 
-    def __init__(self, serper_results: List[Dict]):
+    def __init__(self, serper_results: List[Dict], query: str = '', duplicate_bits: int = DUPLICATE_BITS):
+        self.query = query
+        self.duplicate_bits = duplicate_bits
         self.articles = [
             ArticleRef(
                 title=article.get("name", ""),
@@ -91,11 +134,15 @@ class ArticleProcessor:
             )
             for article in serper_results
         ]
+        if query and self.articles:
+            scores = bm25_scores(query, [f"{a.title} {a.snippet}" for a in self.articles])
+            for article, score in zip(self.articles, scores):
+                article.relevance = round(float(score), 3)
 
     def process(self) -> List[ArticleRef]:
         unique = self._remove_duplicates(self.articles)
         filtered = self._filter_quality(unique)
-        return filtered
+        return self._remove_near_duplicates(filtered)
 
     def _remove_duplicates(self, articles: List[ArticleRef]) -> List[ArticleRef]:
         seen_urls = set()
@@ -107,17 +154,31 @@ class ArticleProcessor:
         return unique_articles
 
     def _filter_quality(self, articles: List[ArticleRef]) -> List[ArticleRef]:
-        return sorted(articles, key=lambda a: a.relevance, reverse=True)
+        # 相关度相同时（例如都不含查询词）snippet 较长的在前
+        return sorted(articles, key=lambda a: (a.relevance, len(a.snippet)), reverse=True)
+
+    def _remove_near_duplicates(self, articles: List[ArticleRef]) -> List[ArticleRef]:
+        if self.duplicate_bits < 0:
+            return articles
+        # 转载和镜像的标题常常不同，只比较 snippet
+        kept = drop_near_duplicates([a.snippet or a.title for a in articles], self.duplicate_bits)
+        return [articles[i] for i in kept]
 
 
 class ResearchGenerator:
     """研究生成器，使用 LLMClient 根据文章和思考阶段生成输出（流式版本）"""
 
-    def __init__(self, articles: List[ArticleRef], llm_client: Optional[LLMClient] = None, max_output: int = 20):
+    def __init__(self, articles: List[ArticleRef], llm_client: Optional[LLMClient] = None, max_output: int = 20,
+                 article_refs: bool = False, map_reduce: bool = False):
         self.articles = articles
         self.max_output = max_output
+        self.article_refs = article_refs
+        self.map_reduce = map_reduce
         self.used_articles = set()
-        self.llm_client = llm_client or LLMClient()
+        self.llm_client = llm_client or shared_llm_client()
+        self.context = ContextPacker(self.llm_client.model_name, article_tokens=ARTICLE_TOKENS, prior_tokens=PRIOR_TOKENS)
+        self.should_stop = None
+        self.cancelled = False
         self.thinking_stages = [
             {
                 "name": "context_extraction",
@@ -159,9 +220,31 @@ class ResearchGenerator:
             return filtered
         return articles
 
+    def _stopped(self) -> bool:
+        if not self.cancelled and self.should_stop is not None and self.should_stop():
+            self.cancelled = True
+        return self.cancelled
+
+    def _article_fields(self, articles: List[ArticleRef]) -> dict:
+        """阶段首个数据块中的文章：文章表模式下只带 ID，否则带完整文章"""
+        if self.article_refs:
+            return {"articles": [], "article_ids": [a.id for a in articles]}
+        return {"articles": [a.dict() for a in articles]}
+
+    def _articles_table(self) -> dict:
+        """文章表数据块，在流的开头发送一次"""
+        return {
+            "type": "articles",
+            "content": "",
+            "articles": [dict(a.dict(), id=a.id) for a in self.articles],
+            "metadata": {"stage": "articles"},
+            'id': "articles"
+        }
+
     def _llm_think(self, stage_description: str, selected_articles: List[ArticleRef], stage_id: int, substep_id: int,
-                   stage_name: str = None):
-        context = " ".join([a.snippet for a in selected_articles])
+                   stage_name: str = None, context: str = None):
+        if context is None:
+            context = self.context.articles(selected_articles)
         messages = [
             {"role": "system", "content": stage_description},
             {"role": "user", "content": f"Analyze the following context: {context}"}
@@ -173,7 +256,7 @@ class ResearchGenerator:
                 data = {
                 "type": "thinking",
                 "content": chunk,
-                "articles": [a.dict() for a in selected_articles],
+                **self._article_fields(selected_articles),
                 "metadata": {"stage": stage_name},
                 'id': f"{stage_id}-{sub_stage_id}"  # 当前阶段的 ID 和子步骤 ID
             }
@@ -215,8 +298,9 @@ class ResearchGenerator:
             }
 
     def _llm_generate_content(self, prompt: str, related_articles: List[ArticleRef], stage_id: int, substep_id: int,
-                              stage: str = None, type_content: str = None):
-        context = " ".join([a.snippet for a in related_articles])
+                              stage: str = None, type_content: str = None, context: str = None):
+        if context is None:
+            context = self.context.articles(related_articles)
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": f"Generate content based on the context: {context}"}
@@ -231,7 +315,7 @@ class ResearchGenerator:
                 data = {
                 "type": type_content,
                 "content": chunk,
-                "articles": [a.dict() for a in related_articles],
+                **self._article_fields(related_articles),
                 "metadata": {"stage": stage},
                 'id': f"{stage_id}-{sub_stage_id}",  # 当前阶段的 ID 和子步骤 ID
             }
@@ -255,55 +339,45 @@ class ResearchGenerator:
 
             }
 
-    def generate_stream(self, user_query: str = ''):
-        content_outputs = []  # 用于收集各阶段生成的内容
-        substep_id = 0  # 初始子步骤ID
-        think_outputs = []
-        # 生成各个思考阶段的输出（同步方式）
-        for stage_id, stage in enumerate(self.thinking_stages):
-            selected = stage["article_selector"](self.articles)
-            context_articles = selected[:min(3, len(selected))]
-            for article in context_articles:
-                self.used_articles.add(article.url)
-            for chunk in self._llm_think(stage["description"], context_articles, stage_id, substep_id, stage['name']):
-                content = chunk.get('content', '')
-                if content is not None:  # Ensure we only append string values
-                    think_outputs.append(content)
-                yield chunk
-            substep_id += 1  # Increment substep
-            stage_id += 1  # Increment stage ID
-
-        # Filter out any None values before joining
-        think_outputs = [output for output in think_outputs if output is not None]
-        think_summary = ''
-        for chunk in self._think_summary(''.join(think_outputs)):
-            think_summary += chunk.get('content', '')
-            yield chunk
+    def _article_digest(self, user_query: str, stage_id: str = 'digest'):
+        """
+        map-reduce 模式的文章摘要：在后台事件循环上并发总结各批文章并逐层合并，每层完成时输出一个内容为空的进度块
+        （metadata 中带层级和批次数），最后一层的总结以流式输出，其内容即为摘要。
+        """
+        reducer = MapReduce(self.llm_client.async_client.complete, self.context, batch_tokens=MAP_BATCH_TOKENS,
+                            summary_tokens=MAP_SUMMARY_TOKENS, max_concurrency=LLM_CONCURRENCY)
+        level, batches = 0, []
+        sub_stage_id = 0
+        for level, batches in self.llm_client.loop.iterate(reducer.levels([source_text(a) for a in self.articles], user_query)):
+            yield {
+                "type": "thinking",
+                "content": "",
+                **(self._article_fields(self.articles) if sub_stage_id == 0 else {"articles": []}),
+                "metadata": {"stage": "article digest", "level": level, "batches": len(batches)},
+                'id': f"{stage_id}-{sub_stage_id}"
+            }
+            sub_stage_id += 1
+        if not batches:
+            return
+        messages = reducer.messages(batches[0], user_query, level)
+        for chunk in self.llm_client.generate_response(messages, max_tokens=self.context.article_tokens):
+            yield {
+                "type": "thinking",
+                "content": chunk,
+                "articles": [],
+                "metadata": {"stage": "article digest"},
+                'id': f"{stage_id}-{sub_stage_id}"
+            }
+            sub_stage_id += 1
 
-        num_articles = len(self.articles)
-        chunk_size = max(1, num_articles // len(self.phase_prompts))
+    def _digest_context(self, results: Dict[str, str]) -> Optional[str]:
+        """map-reduce 模式下各阶段使用的上下文：装入文章预算的摘要；否则为 None，即使用文章片段"""
+        if not self.map_reduce:
+            return None
+        return self.context.fit([results['article digest']], self.context.article_tokens)[0]
 
-        # 修复：按每个小部分返回并包括正确的stage和id
-        for i, prompt in enumerate(self.phase_prompts):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if i < len(self.phase_prompts) - 1 else num_articles
-            related = self.articles[start:end]
-            for article in related:
-                self.used_articles.add(article.url)
-            llm_content = ''
-            for chunk in self._llm_generate_content(
-                    prompt + '\n This is the content of the previous Think Summary' + think_summary + f'\n This is question {user_query}',
-                    related, stage_id, substep_id, stage=prompt.replace('...', '')):
-                llm_content += chunk.get('content')
-                yield chunk
-            content_outputs.append(llm_content)
-            time.sleep(DEFAULT_STREAM_DELAY)
-            substep_id += 1  # 子步骤递增
-            stage_id += 1  # 增加阶段ID
-
-        # 最后进行最终综合：调用 LLM 对所有内容输出做总结
-        final_context = "\n".join(content_outputs)
-        final_prompt = (
+    def _final_prompt(self, final_context: str, think_summary: str) -> str:
+        return (
                 "Context: The aggregated content below contains insights gathered from multiple analysis stages—namely, context extraction, intent analysis, "
                 "source evaluation, contradiction check, and preliminary synthesis—pertaining to the subject under investigation.\n\n"
                 "Objective: Generate a comprehensive final synthesis that integrates all key insights from the provided content.\n\n"
@@ -323,35 +397,201 @@ class ResearchGenerator:
                                                           "Aggregated Thinking Data: \n" + think_summary + "\n\n"
 
         )
-        final_synthesis = self._llm_generate_content(final_prompt, self.articles, 0, 0, 'Complete the report',
-                                                     'completion')
-        yield from final_synthesis
 
+    def _final_context(self, think_summary: str, content_outputs: List[str]):
+        """最终综合的提示词：各阶段输出和思考总结一起装入 PRIOR_TOKENS，较早的思考总结先被截断"""
+        think_summary, *content_outputs = self.context.fit([think_summary] + content_outputs)
+        return self._final_prompt("\n".join(content_outputs), think_summary)
 
-@run_agent
-def run(agent: MofaAgent):
-    user_query = agent.receive_parameter('user_query')
-    load_dotenv('.env.secret')
-    print('user_query:', user_query)
+    def _stage_graph(self, user_query: str) -> StageGraph:
+        """
+        各阶段的依赖图：五个思考阶段只依赖文章，思考总结依赖全部思考阶段，
+        三个阶段提示词只依赖思考总结，最终综合依赖思考总结和全部阶段提示词。
+        map-reduce 模式下所有阶段还依赖文章摘要，并用摘要代替文章片段。
+        """
+        graph = StageGraph(max_concurrency=LLM_CONCURRENCY)
+        article_deps = []
+        if self.map_reduce:
+            graph.add('article digest', lambda results: self._article_digest(user_query))
+            article_deps = ['article digest']
+        think_names = []
+        for stage_id, stage in enumerate(self.thinking_stages):
+            selected = stage["article_selector"](self.articles)
+            context_articles = selected[:min(3, len(selected))]
+            for article in context_articles:
+                self.used_articles.add(article.url)
+            graph.add(stage['name'], lambda results, stage=stage, articles=context_articles, stage_id=stage_id:
+                      self._llm_think(stage["description"], articles, stage_id, stage_id, stage['name'],
+                                      self._digest_context(results)), deps=article_deps)
+            think_names.append(stage['name'])
+
+        graph.add('thinking summary', lambda results: self._think_summary(
+            ''.join(self.context.fit([results[name] for name in think_names]))), deps=think_names)
+
+        num_articles = len(self.articles)
+        chunk_size = max(1, num_articles // len(self.phase_prompts))
+        phase_names = []
+        for i, prompt in enumerate(self.phase_prompts):
+            start = i * chunk_size
+            end = (i + 1) * chunk_size if i < len(self.phase_prompts) - 1 else num_articles
+            related = self.articles[start:end]
+            for article in related:
+                self.used_articles.add(article.url)
+            stage_id = len(self.thinking_stages) + i
+            graph.add(f'phase {i}', lambda results, prompt=prompt, related=related, stage_id=stage_id: self._llm_generate_content(
+                prompt + '\n This is the content of the previous Think Summary' + self.context.fit([results['thinking summary']])[0] + f'\n This is question {user_query}',
+                related, stage_id, stage_id, stage=prompt.replace('...', ''), context=self._digest_context(results)),
+                deps=['thinking summary'] + article_deps)
+            phase_names.append(f'phase {i}')
 
-    raw_articles = search_web_with_serper(query=user_query, subscription_key=os.getenv("SERPER_API_KEY"))
+        # 最后进行最终综合：调用 LLM 对所有内容输出做总结
+        graph.add('final synthesis', lambda results: self._llm_generate_content(
+            self._final_context(results['thinking summary'], [results[name] for name in phase_names]),
+            self.articles, 0, 0, 'Complete the report', 'completion', self._digest_context(results)),
+            deps=['thinking summary'] + phase_names + article_deps)
+        return graph
+
+    def generate_stream(self, user_query: str = '', should_stop: Optional[Callable[[], bool]] = None,
+                        on_idle: Optional[Callable[[], None]] = None):
+        """
+        按阶段流式生成研究报告。相互独立的阶段并发运行（最多 LLM_CONCURRENCY 个 LLM 调用），
+        各阶段的数据块交错输出，通过 metadata.stage 和 id 区分。`should_stop` 在数据块之间被调用，
+        返回 True 时（例如客户端已断开，请求被取消）提前结束，关闭进行中的 LLM 调用，并把 `cancelled` 置为 True。
+        `on_idle` 在某个阶段结束或暂时没有新数据块时被调用（例如发送已缓冲的增量）。
+        """
+        self.should_stop = should_stop
+        if self._stopped():
+            return
+        if self.article_refs:
+            yield self._articles_table()
+        yield from self._stage_graph(user_query).stream(should_stop=self._stopped, on_idle=on_idle)
+
+
+def stopped_chunk(request_id: Optional[str], reason: str) -> dict:
+    """请求被取消（cancelled）或超过截止时间（timeout）时发送的结束块，服务端据此释放该请求的流"""
+    chunk = {
+        "type": "completion",
+        "content": "",
+        "articles": [],
+        "metadata": {"stage": reason},
+        "id": reason,
+        "end": "yes",
+        reason: True,
+    }
+    if request_id is not None:
+        chunk[REQUEST_ID_KEY] = request_id
+    return chunk
+
+
+_watcher = None
+_llm_cache = None
+_llm_client = None
+_search_cache = None
+
+
+def search_cache() -> SearchCache:
+    """每个进程一个 Serper 搜索缓存，未配置 SERPER_CACHE_DIR 时只在内存中缓存"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(SERPER_CACHE_DIR, ttl=SERPER_CACHE_TTL)
+    return _search_cache
+
+
+def llm_cache() -> Optional[LLMCache]:
+    """每个进程一个 LLM 响应缓存，未配置 DEEP_SEARCH_LLM_CACHE_DIR 时为 None"""
+    global _llm_cache
+    if _llm_cache is None and LLM_CACHE_DIR:
+        _llm_cache = LLMCache(LLM_CACHE_DIR, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024), ttl=LLM_CACHE_TTL)
+    return _llm_cache
+
+
+def shared_llm_client() -> LLMClient:
+    """每个进程一个 LLM 客户端：连接池和后台事件循环在多次运行之间复用，.env.secret 只在导入时读取一次"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient(model_name=DEFAULT_MODEL_NAME, cache=llm_cache())
+    return _llm_client
+
+
+def serper_search(query: str) -> List[Dict]:
+    """搜索 Serper；设置了 SERPER_URL 时直接请求该端点，返回与 search_web_with_serper 相同的字段"""
+    if not SERPER_URL:
+        return search_web_with_serper(query=query, subscription_key=os.getenv("SERPER_API_KEY"))
+    request = urllib.request.Request(
+        SERPER_URL,
+        data=json.dumps({"q": query}).encode('utf-8'),
+        headers={"X-API-KEY": os.getenv("SERPER_API_KEY") or "", "Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        organic = json.load(response).get('organic', [])
+    return [{"name": r.get("title", ""), "url": r.get("link", ""), "snippet": r.get("snippet", "")} for r in organic]
+
+
+def search_articles(user_query: str) -> List[ArticleRef]:
+    """经过搜索缓存搜索 Serper，按 BM25 排序并去除重复和近似重复的结果，返回最多 MAX_ARTICLES 篇文章"""
+    raw_articles = search_cache().search(user_query, lambda: serper_search(user_query))
     print("Serper search returned:")
     print(json.dumps(raw_articles, indent=2))
+    print('Search cache:', search_cache().stats())
+    processor = ArticleProcessor(raw_articles, query=user_query)
+    return processor.process()[:MAX_ARTICLES]  # 同步调用
+
 
-    processor = ArticleProcessor(raw_articles)
-    processed_articles = processor.process()  # 同步调用
-    selected_articles = processed_articles[:20]
+def cancellation_watcher(agent: MofaAgent) -> CancellationWatcher:
+    """每个进程一个监视器，在多次运行之间保留暂存的输入和已取消的请求 ID"""
+    global _watcher
+    if _watcher is None or _watcher.agent is not agent:
+        _watcher = CancellationWatcher(agent, cancel_input='cancel')
+    return _watcher
 
-    llm_client = LLMClient(model_name=os.getenv("LLM_MODEL_NAME", DEFAULT_MODEL_NAME))
 
-    generator = ResearchGenerator(articles=selected_articles, llm_client=llm_client)
+@run_agent
+def run(agent: MofaAgent):
+    watcher = cancellation_watcher(agent)
+    user_query = watcher.receive_parameter('user_query')
+    print('user_query:', user_query)
+
+    # MofaAgent forwards the request metadata with every output; the request id is also echoed
+    # in each chunk so the OpenAI server can route it even if a hop in the dataflow drops metadata.
+    request_id = event_request_id(agent.event or {})
+
+    # 客户端断开后服务端会通过 cancel 输入取消请求，已取消的请求不再搜索和调用 LLM
+    watcher.poll(force=True)
+    if watcher.is_cancelled(request_id):
+        print('Request cancelled before it started:', request_id)
+        agent.send_output(agent_output_name='deep_search_result', agent_result=encode_chunk(stopped_chunk(request_id, 'cancelled')))
+        return
+    # 截止时间是首个数据块的期限：过期的请求不再搜索，也不再调用 LLM
+    if deadline_passed(agent):
+        print('Request deadline passed before it started:', request_id)
+        agent.send_output(agent_output_name='deep_search_result', agent_result=encode_chunk(stopped_chunk(request_id, 'timeout')))
+        return
+
+    selected_articles = search_articles(user_query)
+    if deadline_passed(agent):
+        print('Request deadline passed during the search:', request_id)
+        agent.send_output(agent_output_name='deep_search_result', agent_result=encode_chunk(stopped_chunk(request_id, 'timeout')))
+        return
+
+    generator = ResearchGenerator(articles=selected_articles, llm_client=shared_llm_client(), article_refs=ARTICLE_REFS,
+                                  map_reduce=MAP_REDUCE)
 
     print("\n--- Generating output ---\n")
-    results = []
-    for chunk in generator.generate_stream(user_query=user_query):
-        results.append(json.dumps(chunk, indent=2))
-        agent.send_output(agent_output_name='deep_search_result', agent_result=json.dumps(chunk, indent=2))
-        time.sleep(0.005)
+    # 每个 LLM token 不再单独作为一条 Dora 消息发送：同一阶段的增量合并后以紧凑 JSON 发送
+    emitter = ChunkEmitter(lambda result: agent.send_output(agent_output_name='deep_search_result', agent_result=result),
+                           max_bytes=EMIT_MAX_BYTES, max_delay=EMIT_MAX_MS / 1000)
+    for chunk in generator.generate_stream(user_query=user_query,
+                                           should_stop=lambda: watcher.is_cancelled(request_id),
+                                           on_idle=emitter.flush):
+        if request_id is not None:
+            chunk[REQUEST_ID_KEY] = request_id
+        emitter.push(chunk)
+    emitter.flush()
+    if generator.cancelled:
+        print('Request cancelled:', request_id)
+        emitter.push(stopped_chunk(request_id, 'cancelled'))
+    if llm_cache() is not None:
+        print('LLM cache:', llm_cache().stats())
 
 def main():
     agent = MofaAgent(agent_name='DeepInquire')
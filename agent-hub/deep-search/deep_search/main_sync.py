@@ -1,6 +1,5 @@
 import json
 import asyncio
-import hashlib
 import os
 import time
 import uuid
@@ -10,9 +9,15 @@ from mofa.agent_build.base.base_agent import MofaAgent, run_agent
 import openai
 import numpy as np
 from dotenv import load_dotenv
-from openai import OpenAI
 
 from mofa.kernel.tools.web_search import search_web_with_serper
+from search_cache import SearchCache
+
+from deep_search.context import ContextPacker
+from deep_search.llm_cache import LLMCache
+from deep_search.llm_client import AsyncLLMClient
+from deep_search.map_reduce import MapReduce, source_text
+from deep_search.ranking import bm25_scores, drop_near_duplicates
 
 # 模拟 serper 搜索接口（请替换为真实实现）
 # def search_web_with_serper(query: str, subscription_key: str) -> List[Dict]:
@@ -70,37 +75,46 @@ from mofa.kernel.tools.web_search import search_web_with_serper
 
 load_dotenv('.env.secret')
 # 配置项
-MAX_ARTICLES = 50  # 最大处理文章数
+MAX_ARTICLES = int(os.getenv('DEEP_SEARCH_MAX_ARTICLES', 50))  # 最大处理文章数
+# SimHash 相差不超过该位数的文章视为近似重复，负数表示不去重
+DUPLICATE_BITS = int(os.getenv('DEEP_SEARCH_DUPLICATE_BITS', 10))
+# 每个阶段提示词的 token 预算（与 main.py 相同的配置）
+ARTICLE_TOKENS = int(os.getenv('DEEP_SEARCH_ARTICLE_TOKENS', 2000))
+PRIOR_TOKENS = int(os.getenv('DEEP_SEARCH_PRIOR_TOKENS', 6000))
+# map-reduce 模式（与 main.py 相同的配置）：各阶段使用文章分批总结、逐层合并得到的摘要，最多同时进行 LLM_CONCURRENCY 个总结
+MAP_REDUCE = os.getenv('DEEP_SEARCH_MAP_REDUCE', 'false').lower() in ('1', 'true', 'yes')
+MAP_BATCH_TOKENS = int(os.getenv('DEEP_SEARCH_MAP_BATCH_TOKENS', 3000))
+MAP_SUMMARY_TOKENS = int(os.getenv('DEEP_SEARCH_MAP_SUMMARY_TOKENS', 400))
+LLM_CONCURRENCY = int(os.getenv('DEEP_SEARCH_LLM_CONCURRENCY', 4))
 DEFAULT_STREAM_DELAY = 0.1  # 流式延迟
 openai.api_key = os.getenv("LLM_API_KEY")
 openai.api_base = os.getenv("LLM_BASE_URL")
 DEFAULT_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-4o")
+# LLM 响应缓存（与 main.py 相同的配置），目录为空时不启用
+LLM_CACHE_DIR = os.getenv('DEEP_SEARCH_LLM_CACHE_DIR', '')
+LLM_CACHE_MAX_MB = float(os.getenv('DEEP_SEARCH_LLM_CACHE_MAX_MB', 256))
+LLM_CACHE_TTL = float(os.getenv('DEEP_SEARCH_LLM_CACHE_TTL', 7 * 24 * 3600))
+# LLM 连接池（与 main.py 相同的配置）
+LLM_MAX_CONNECTIONS = int(os.getenv('DEEP_SEARCH_LLM_MAX_CONNECTIONS', 16))
+LLM_KEEPALIVE_S = float(os.getenv('DEEP_SEARCH_LLM_KEEPALIVE_S', 60))
+# Serper 搜索缓存（与 main.py 相同的配置）
+SERPER_CACHE_DIR = os.getenv('SERPER_CACHE_DIR', '')
+SERPER_CACHE_TTL = float(os.getenv('SERPER_CACHE_TTL', 3600))
 
 
 class LLMClient:
-    """封装 OpenAI LLM 的客户端，缓存模型名称及相关配置"""
+    """封装 OpenAI LLM 的异步客户端：流式读取补全而不阻塞事件循环，所有调用共享一个保持连接的连接池"""
 
-    def __init__(self,file_path:str='.env.secret', model_name: str = 'gpt-4o'):
+    def __init__(self, file_path: str = '.env.secret', model_name: str = 'gpt-4o', cache: Optional[LLMCache] = None,
+                 max_connections: int = LLM_MAX_CONNECTIONS):
         self.model_name = model_name
-        load_dotenv('.env.secret')
-        if os.getenv('LLM_API_KEY') is not None:
-            os.environ['OPENAI_API_KEY'] = os.getenv('LLM_API_KEY')
-        if os.getenv('LLM_BASE_URL', None) is None:
-            client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-        else:
-            client = OpenAI(api_key=os.environ['OPENAI_API_KEY'], base_url=os.getenv('LLM_BASE_URL'), )
-        self.client = client
+        self.cache = cache
+        # 相同的模型、消息和 max_tokens 直接使用缓存的补全
+        self.async_client = AsyncLLMClient(model_name, max_connections=max_connections,
+                                           keepalive_expiry=LLM_KEEPALIVE_S, cache=cache)
 
     async def generate_response(self, messages: List[Dict], max_tokens: int=3200) -> str:
-        def sync_call():
-            return self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                max_tokens=max_tokens
-            )
-
-        response = await asyncio.to_thread(sync_call)
-        return response.choices[0].message.content
+        return await self.async_client.complete(messages, max_tokens)
 
 
 # --- 数据模型 ---
@@ -135,13 +149,15 @@ class ChatRequest:
 # --- 简化版文章处理器 ---
 class ArticleProcessor:
     """
-    简化版文章处理器：
+    文章处理器：
     1. 将 serper 返回的结果转换为 ArticleRef 对象
-    2. 基于 URL 去重
-    3. 根据 snippet 长度降序排序
+    2. 基于 URL 去重，再用 SimHash 去掉转载、镜像等近似重复的文章（保留相关度最高的一篇）
+    3. 按 BM25 相关度（标题和 snippet 对用户查询）降序排序；没有查询时按 snippet 长度排序
     """
 
-    def __init__(self, serper_results: List[Dict]):
+    def __init__(self, serper_results: List[Dict], query: str = '', duplicate_bits: int = DUPLICATE_BITS):
+        self.query = query
+        self.duplicate_bits = duplicate_bits
         self.articles = [
             ArticleRef(
                 title=article.get("name", ""),
@@ -152,11 +168,15 @@ class ArticleProcessor:
             )
             for article in serper_results
         ]
+        if query and self.articles:
+            scores = bm25_scores(query, [f"{a.title} {a.snippet}" for a in self.articles])
+            for article, score in zip(self.articles, scores):
+                article.relevance = round(float(score), 3)
 
     async def process(self) -> List[ArticleRef]:
         unique = self._remove_duplicates(self.articles)
         filtered = self._filter_quality(unique)
-        return filtered
+        return self._remove_near_duplicates(filtered)
 
     def _remove_duplicates(self, articles: List[ArticleRef]) -> List[ArticleRef]:
         seen_urls = set()
@@ -168,18 +188,30 @@ class ArticleProcessor:
         return unique_articles
 
     def _filter_quality(self, articles: List[ArticleRef]) -> List[ArticleRef]:
-        return sorted(articles, key=lambda a: a.relevance, reverse=True)
+        # 相关度相同时（例如都不含查询词）snippet 较长的在前
+        return sorted(articles, key=lambda a: (a.relevance, len(a.snippet)), reverse=True)
+
+    def _remove_near_duplicates(self, articles: List[ArticleRef]) -> List[ArticleRef]:
+        if self.duplicate_bits < 0:
+            return articles
+        # 转载和镜像的标题常常不同，只比较 snippet
+        kept = drop_near_duplicates([a.snippet or a.title for a in articles], self.duplicate_bits)
+        return [articles[i] for i in kept]
 
 
 # --- 研究生成器（整合 OpenAI LLM 思考） ---
 class ResearchGenerator:
     """研究生成器，使用 LLMClient 根据文章和思考阶段生成输出"""
 
-    def __init__(self, articles: List[ArticleRef], llm_client: Optional[LLMClient] = None, max_output: int = 20):
+    def __init__(self, articles: List[ArticleRef], llm_client: Optional[LLMClient] = None, max_output: int = 20,
+                 map_reduce: bool = False):
         self.articles = articles
         self.max_output = max_output
+        self.map_reduce = map_reduce
+        self.digest = None  # map-reduce 模式下的文章摘要
         self.used_articles = set()
-        self.llm_client = llm_client or LLMClient()
+        self.llm_client = llm_client or shared_llm_client()
+        self.context = ContextPacker(self.llm_client.model_name, article_tokens=ARTICLE_TOKENS, prior_tokens=PRIOR_TOKENS)
         self.thinking_stages = [
             {
                 "name": "context_extraction",
@@ -216,11 +248,24 @@ class ResearchGenerator:
             return filtered
         return articles
 
+    def _article_context(self, articles: List[ArticleRef]) -> str:
+        """阶段的上下文：map-reduce 模式下为装入文章预算的摘要，否则为按相关度装入的文章片段"""
+        if self.digest is not None:
+            return self.context.fit([self.digest], self.context.article_tokens)[0]
+        return self.context.articles(articles)
+
+    async def _article_digest(self, user_query: str) -> str:
+        """并发总结各批文章并逐层合并为一份摘要"""
+        reducer = MapReduce(self.llm_client.async_client.complete, self.context, batch_tokens=MAP_BATCH_TOKENS,
+                            summary_tokens=MAP_SUMMARY_TOKENS, max_concurrency=LLM_CONCURRENCY)
+        return await reducer.digest([source_text(a) for a in self.articles], user_query,
+                                    max_tokens=self.context.article_tokens)
+
     async def _llm_think(self, stage_description: str, selected_articles: List[ArticleRef]) -> str:
         """
         使用 LLMClient 生成思考输出。
         """
-        context = " ".join([a.snippet for a in selected_articles])
+        context = self._article_context(selected_articles)
         messages = [
             {"role": "system", "content": stage_description},
             {"role": "user", "content": f"Analyze the following context and provide your insights: {context}"}
@@ -231,14 +276,23 @@ class ResearchGenerator:
         """
         使用 LLMClient 生成内容输出。
         """
-        context = " ".join([a.snippet for a in related_articles])
+        context = self._article_context(related_articles)
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": f"Generate a comprehensive answer based on the following context: {context}"}
         ]
         return await self.llm_client.generate_response(messages, max_tokens=4800)
 
-    async def generate_stream(self) -> AsyncGenerator[Dict, None]:
+    async def generate_stream(self, user_query: str = '') -> AsyncGenerator[Dict, None]:
+        if self.map_reduce:
+            self.digest = await self._article_digest(user_query)
+            yield {
+                "type": "thinking",
+                "content": self.digest,
+                "articles": [a.dict() for a in self.articles],
+                "metadata": {"stage": "article_digest"}
+            }
+
         # 生成各个思考阶段的输出
         for stage in self.thinking_stages:
             selected = stage["article_selector"](self.articles)
@@ -284,7 +338,8 @@ class ResearchGenerator:
             }
 
         # 最后进行最终综合：调用 LLM 对所有内容输出做总结
-        final_context = "\n".join(content_outputs)
+        # 各阶段输出装入 PRIOR_TOKENS，较早的输出先被截断
+        final_context = "\n".join(self.context.fit(content_outputs))
         final_prompt = (
             "Context: The aggregated content below contains insights gathered from multiple analysis stages—namely, context extraction, intent analysis, "
             "source evaluation, contradiction check, and preliminary synthesis—pertaining to the subject under investigation.\n\n"
@@ -316,27 +371,51 @@ class ResearchGenerator:
             }
         }
 
+_llm_client = None
+_search_cache = None
+
+
+def search_cache() -> SearchCache:
+    """每个进程一个 Serper 搜索缓存，未配置 SERPER_CACHE_DIR 时只在内存中缓存"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(SERPER_CACHE_DIR, ttl=SERPER_CACHE_TTL)
+    return _search_cache
+
+
+def shared_llm_client() -> LLMClient:
+    """每个进程一个 LLM 客户端，连接池在同一事件循环中的多次运行之间复用"""
+    global _llm_client
+    if _llm_client is None:
+        cache = LLMCache(LLM_CACHE_DIR, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024), ttl=LLM_CACHE_TTL) if LLM_CACHE_DIR else None
+        _llm_client = LLMClient(model_name=DEFAULT_MODEL_NAME, cache=cache)
+    return _llm_client
+
+
 async def run(agent:MofaAgent):
     # 模拟用户查询
     user_query = agent.receive_parameter('task')
-    raw_articles = search_web_with_serper(query=user_query, subscription_key=os.getenv("SERPER_API_KEY"))
+    raw_articles = search_cache().search(user_query, lambda: search_web_with_serper(
+        query=user_query, subscription_key=os.getenv("SERPER_API_KEY")))
     print("Serper search returned:")
     print(json.dumps(raw_articles, indent=2))
 
     # 使用 ArticleProcessor 处理搜索结果
-    processor = ArticleProcessor(raw_articles)
+    processor = ArticleProcessor(raw_articles, query=user_query)
     processed_articles = await processor.process()
-    selected_articles = processed_articles[:20]
+    selected_articles = processed_articles[:MAX_ARTICLES]
 
-    # 初始化 LLMClient（使用 .env 中配置的模型名称）
-    llm_client = LLMClient(model_name=os.getenv("LLM_MODEL_NAME", DEFAULT_MODEL_NAME))
+    # 共享的 LLMClient（使用 .env 中配置的模型名称）
+    llm_client = shared_llm_client()
 
     # 使用 ResearchGenerator 生成输出
-    generator = ResearchGenerator(articles=selected_articles, llm_client=llm_client)
+    generator = ResearchGenerator(articles=selected_articles, llm_client=llm_client, map_reduce=MAP_REDUCE)
 
     print("\n--- Generating output ---\n")
-    async for chunk in generator.generate_stream():
+    async for chunk in generator.generate_stream(user_query):
         print(json.dumps(chunk, indent=2))
+    if llm_client.cache is not None:
+        print('LLM cache:', llm_client.cache.stats())
 
 
 if __name__ == "__main__":
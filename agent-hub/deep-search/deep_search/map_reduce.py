@@ -0,0 +1,105 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from deep_search.context import ContextPacker, truncate_tokens
+
+MAP_PROMPT = (
+    "You condense web search results for a research report. Summarize the sources below as they relate "
+    "to the question. Keep facts, figures, names, dates and disagreements between sources, and note "
+    "which source each point comes from. Do not add anything that is not in the sources."
+)
+REDUCE_PROMPT = (
+    "You merge partial research notes into one. Combine the notes below as they relate to the question, "
+    "removing repetition. Keep facts, figures, names, dates, source attributions and disagreements "
+    "between sources. Do not add anything that is not in the notes."
+)
+
+
+def source_text(article) -> str:
+    """The text of an article as a source of the map step: title, URL and snippet."""
+    return f"{article.title} ({article.url}): {article.snippet}"
+
+
+class MapReduce:
+    """
+    Condenses any number of sources into a digest with prompts of bounded size.
+
+    The sources are split into batches of at most `batch_tokens` and each
+    batch is summarized in at most `summary_tokens` (map). The summaries are
+    then batched and summarized again, level after level, until they fit
+    in one batch (reduce). Calls of a level run concurrently, at most
+    `max_concurrency` at a time. Every prompt stays under `batch_tokens` of
+    sources, however many there are, and the number of levels grows with
+    the logarithm of the number of sources.
+
+    `complete(messages, max_tokens)` is a coroutine returning the
+    completion, e.g. `AsyncLLMClient.complete`.
+    """
+
+    def __init__(self, complete: Callable[[List[Dict], int], Awaitable[str]], packer: ContextPacker,
+                 batch_tokens: int = 3000, summary_tokens: int = 400, max_concurrency: int = 4):
+        self.complete = complete
+        self.packer = packer
+        self.batch_tokens = batch_tokens
+        self.summary_tokens = summary_tokens
+        self.max_concurrency = max(1, max_concurrency)
+
+    def batches(self, texts: Sequence[str], min_size: int = 1) -> List[List[str]]:
+        """
+        Consecutive batches of `texts` that fit in `batch_tokens`. Texts are
+        cut so that at least `min_size` of them fit in a batch; a reduce
+        level uses 2, so that every level at least halves the summaries.
+        """
+        separator = 2  # the blank line between texts
+        limit = max(1, self.batch_tokens // min_size - separator)
+        batches, current, used = [], [], 0
+        for text in texts:
+            text = truncate_tokens(text, limit, self.packer.model)
+            tokens = self.packer.count(text) + separator
+            if current and used + tokens > self.batch_tokens:
+                batches.append(current)
+                current, used = [], 0
+            current.append(text)
+            used += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def messages(self, texts: Sequence[str], query: str, level: int) -> List[Dict]:
+        """The prompt summarizing `texts`: sources on level 0, summaries of an earlier level above."""
+        numbered = "\n\n".join(f"[{i + 1}] {text}" for i, text in enumerate(texts))
+        kind = "Sources" if level == 0 else "Notes"
+        return [
+            {"role": "system", "content": MAP_PROMPT if level == 0 else REDUCE_PROMPT},
+            {"role": "user", "content": f"Question: {query}\n\n{kind}:\n{numbered}"},
+        ]
+
+    async def _summarize(self, texts: List[str], query: str, level: int, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            return await self.complete(self.messages(texts, query, level), self.summary_tokens)
+
+    async def levels(self, texts: Sequence[str], query: str) -> AsyncIterator[Tuple[int, List[List[str]]]]:
+        """
+        Yields `(level, batches)` for the sources (level 0) and the
+        summaries of every level after it. The last batches are a single
+        batch, to be summarized into the digest with `messages(batch,
+        query, level)`.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        level = 0
+        while True:
+            batches = self.batches(texts, min_size=1 if level == 0 else 2)
+            yield level, batches
+            if len(batches) <= 1:
+                return
+            texts = await asyncio.gather(*[self._summarize(batch, query, level, semaphore) for batch in batches])
+            level += 1
+
+    async def digest(self, texts: Sequence[str], query: str, max_tokens: int = 2000) -> str:
+        """The digest of all `texts`: the summary of the last level's single batch."""
+        if not texts:
+            return ""
+        level, batches = 0, []
+        async for level, batches in self.levels(texts, query):
+            pass
+        return await self.complete(self.messages(batches[0], query, level), max_tokens)
@@ -0,0 +1,66 @@
+import hashlib
+import re
+from typing import List, Sequence
+
+import numpy as np
+
+# Latin words and digits, or single CJK characters, which carry a word's worth of meaning each.
+_TOKEN = re.compile(r"[一-鿿぀-ヿ가-힯]|[^\W_]+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    Okapi BM25 score of every document against `query`, computed on a
+    documents x query terms matrix of term frequencies.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    docs = [tokenize(d) for d in documents]
+    if not terms or not docs:
+        return np.zeros(len(docs))
+    column = {term: j for j, term in enumerate(terms)}
+    tf = np.zeros((len(docs), len(terms)))
+    for i, tokens in enumerate(docs):
+        for token in tokens:
+            j = column.get(token)
+            if j is not None:
+                tf[i, j] += 1
+    lengths = np.array([len(tokens) for tokens in docs], dtype=float)
+    avg_length = lengths.mean() or 1.0
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def simhash(text: str, bits: int = 64, shingle: int = 3) -> int:
+    """SimHash of the word shingles of `text`; near-duplicate texts differ in few bits."""
+    tokens = tokenize(text)
+    shingles = [" ".join(tokens[i:i + shingle]) for i in range(max(1, len(tokens) - shingle + 1))]
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=bits // 8).digest() for s in shingles)
+    bit_matrix = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), bits // 8), axis=1)
+    votes = (2 * bit_matrix.astype(np.int64) - 1).sum(axis=0)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def drop_near_duplicates(texts: Sequence[str], max_distance: int = 10) -> List[int]:
+    """
+    Indices of the texts to keep, in order: a text is dropped when its
+    SimHash is within `max_distance` bits of an earlier kept text, so pass
+    the texts best first. Unrelated texts differ in about half of the 64
+    bits; on snippet-sized texts, editing a few words flips about ten.
+    """
+    kept, fingerprints = [], []
+    for i, text in enumerate(texts):
+        fingerprint = simhash(text)
+        if all(hamming(fingerprint, other) > max_distance for other in fingerprints):
+            kept.append(i)
+            fingerprints.append(fingerprint)
+    return kept
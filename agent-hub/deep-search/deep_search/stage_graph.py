@@ -0,0 +1,108 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+class Stage:
+    def __init__(self, name: str, run: Callable[[Dict[str, str]], Iterable[dict]], deps: Sequence[str] = ()):
+        self.name = name
+        self.run = run  # called with the texts of the finished stages, returns the chunks of this stage
+        self.deps = list(deps)
+
+
+class StageGraph:
+    """
+    Runs the stages of a research report as a dependency graph.
+
+    A stage starts as soon as all the stages it depends on have finished, so
+    independent stages (e.g. the thinking stages, which only need the
+    articles) run at the same time, on at most `max_concurrency` threads,
+    which caps the concurrent LLM calls. `stream` yields the chunks of all
+    running stages as they are produced; chunks keep their own stage ids, so
+    consumers can tell the interleaved stages apart. The text of a stage,
+    its chunk contents joined, is passed to the stages that depend on it and
+    kept in `results`.
+
+    `stream` must be consumed from a single thread; `should_stop` and
+    `on_idle` are only called from that thread, so they may use the Dora
+    node.
+    """
+
+    def __init__(self, max_concurrency: int = 4, poll_interval: float = 0.2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.poll_interval = poll_interval
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, str] = {}
+
+    def add(self, name: str, run: Callable[[Dict[str, str]], Iterable[dict]], deps: Sequence[str] = ()) -> "StageGraph":
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            # Stages are added after their dependencies, which also rules out cycles.
+            raise ValueError(f"stage {name!r} depends on unknown stages {missing}")
+        self.stages[name] = Stage(name, run, deps)
+        return self
+
+    def _ready(self, started: set) -> List[Stage]:
+        return [stage for name, stage in self.stages.items()
+                if name not in started and all(dep in self.results for dep in stage.deps)]
+
+    def _run_stage(self, stage: Stage, events: queue.Queue, stop: threading.Event):
+        if stop.is_set():
+            return
+        parts = []
+        try:
+            chunks = stage.run({dep: self.results[dep] for dep in stage.deps})
+            with closing(iter(chunks)) as chunks:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    parts.append(chunk.get("content") or "")
+                    events.put(("chunk", stage.name, chunk))
+        except BaseException as e:
+            events.put(("error", stage.name, e))
+            return
+        events.put(("done", stage.name, "".join(parts)))
+
+    def stream(self, should_stop: Optional[Callable[[], bool]] = None,
+               on_idle: Optional[Callable[[], None]] = None) -> Iterator[dict]:
+        """
+        Run all stages and yield their chunks; returns early once
+        `should_stop()` is true. `on_idle` is called when a stage finishes
+        and when no chunk arrived for `poll_interval` seconds.
+        """
+        events = queue.Queue()
+        stop = threading.Event()
+        started = set()
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="deep-search-stage")
+
+        def start_ready():
+            for stage in self._ready(started):
+                started.add(stage.name)
+                pool.submit(self._run_stage, stage, events, stop)
+
+        try:
+            start_ready()
+            while len(self.results) < len(self.stages):
+                if should_stop is not None and should_stop():
+                    return
+                try:
+                    kind, name, value = events.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    if on_idle is not None:
+                        on_idle()
+                    continue
+                if kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    self.results[name] = value
+                    start_ready()
+                    if on_idle is not None:
+                        on_idle()
+                else:
+                    raise value
+        finally:
+            # Stages still running stop before their next chunk and close their LLM stream.
+            stop.set()
+            pool.shutdown(wait=False)
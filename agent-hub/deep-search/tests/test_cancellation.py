@@ -0,0 +1,65 @@
+import pyarrow as pa
+
+from deep_search.cancellation import CancellationWatcher
+
+
+class Node:
+    def __init__(self, events):
+        self.events = list(events)
+
+    def next(self, timeout=None):
+        if self.events:
+            return self.events.pop(0)
+        return {"type": "ERROR", "error": "timeout"}
+
+
+class Agent:
+    def __init__(self, events):
+        self.node = Node(events)
+        self.event = None
+        self.received = []
+
+    def receive_parameter(self, name):
+        self.received.append(name)
+        return "from agent"
+
+
+def input_event(input_id, value, **metadata):
+    return {"type": "INPUT", "id": input_id, "value": pa.array([value]), "metadata": metadata}
+
+
+def test_cancel_ids_from_metadata_or_value():
+    agent = Agent([input_event("cancel", "ignored", request_id="a"), input_event("cancel", "b")])
+    watcher = CancellationWatcher(agent)
+    assert watcher.is_cancelled("a")
+    assert watcher.is_cancelled("b")
+    assert not watcher.is_cancelled("c")
+    assert not watcher.is_cancelled(None)
+
+
+def test_other_events_are_deferred_in_order():
+    first = input_event("user_query", "first", request_id="1")
+    second = input_event("user_query", "second", request_id="2")
+    agent = Agent([first, input_event("cancel", "x"), second])
+    watcher = CancellationWatcher(agent)
+    watcher.poll(force=True)
+    assert watcher.receive_parameter("user_query") == "first"
+    assert agent.event is first
+    assert watcher.receive_parameter("user_query") == "second"
+    assert agent.event is second
+    assert watcher.receive_parameter("user_query") == "from agent"
+
+
+def test_closed_event_stream_stops_polling():
+    agent = Agent([])
+    agent.node.next = lambda timeout=None: None
+    watcher = CancellationWatcher(agent)
+    watcher.poll(force=True)
+    assert watcher.closed
+
+
+def test_remembers_at_most_max_cancelled():
+    agent = Agent([input_event("cancel", str(i)) for i in range(5)])
+    watcher = CancellationWatcher(agent, max_cancelled=2)
+    watcher.poll(force=True)
+    assert list(watcher.cancelled) == ["3", "4"]
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from deep_search.context import TRUNCATION_MARK, ContextPacker, count_tokens, truncate_tokens
+
+
+def words(count, word="alpha"):
+    return " ".join([word] * count)
+
+
+def article(snippet, relevance):
+    return SimpleNamespace(snippet=snippet, relevance=relevance)
+
+
+def test_truncate_tokens_marks_the_cut():
+    text = words(100)
+    assert truncate_tokens(text, 200) == text
+    cut = truncate_tokens(text, 20)
+    assert cut.endswith(TRUNCATION_MARK) and text.startswith(cut[:-len(TRUNCATION_MARK)])
+    assert count_tokens(cut) <= 20
+    assert truncate_tokens(text, 1) == ""
+
+
+def test_articles_are_packed_by_relevance_into_the_budget():
+    packer = ContextPacker(article_tokens=100, min_piece=5)
+    articles = [article(words(30, "low"), 1), article(words(60, "high"), 3), article(words(30, "mid"), 2)]
+    packed = packer.articles(articles)
+    assert packer.count(packed) <= 100
+    # The most relevant snippets come whole and first, the one that no longer fits is cut
+    assert packed.startswith(words(60, "high") + " " + words(30, "mid"))
+    assert "low" in packed and packed.endswith(TRUNCATION_MARK)
+
+
+def test_articles_below_min_piece_are_left_out():
+    packer = ContextPacker(article_tokens=65, min_piece=10)
+    packed = packer.articles([article(words(60, "high"), 3), article(words(30, "low"), 1)])
+    assert packed == words(60, "high")
+    assert packer.articles([article(words(60), 1)], budget=0) == ""
+
+
+def test_fit_keeps_the_newest_sections_whole():
+    packer = ContextPacker(prior_tokens=100, min_piece=10)
+    sections = [words(50, "oldest"), words(70, "older"), words(50, "newest")]
+    fitted = packer.fit(sections)
+    assert len(fitted) == 3
+    assert fitted[2] == sections[2]
+    # The older section is cut to what is left, and nothing is left for the oldest
+    assert fitted[1].endswith(TRUNCATION_MARK) and packer.count(fitted[1]) <= 50
+    assert fitted[0] == ""
+    assert sum(packer.count(section) for section in fitted) <= 100
+
+
+def test_fit_keeps_everything_within_the_budget():
+    packer = ContextPacker(prior_tokens=1000)
+    sections = [words(10), "", words(20)]
+    assert packer.fit(sections) == sections
@@ -0,0 +1,66 @@
+import json
+import time
+
+from deep_search.emitter import ChunkEmitter, encode_chunk
+
+
+def delta(content, stage="research", chunk_id="1-0", **extra):
+    return dict({"type": "content", "content": content, "id": chunk_id, "metadata": {"stage": stage}}, **extra)
+
+
+def emitter(**kwargs):
+    sent = []
+    return ChunkEmitter(lambda message: sent.append(json.loads(message)), **kwargs), sent
+
+
+def test_encode_chunk_is_compact_and_keeps_unicode():
+    assert encode_chunk({"content": "深度 搜索", "id": 1}) == '{"content":"深度 搜索","id":1}'
+
+
+def test_deltas_of_a_stage_are_merged():
+    chunks, sent = emitter(max_bytes=1024, max_delay=60)
+    chunks.push(delta("a", chunk_id="1-0", articles=[{"url": "u"}]))
+    chunks.push(delta("b", chunk_id="1-1"))
+    assert sent == []
+    chunks.flush()
+    # The merged chunk keeps the fields of the first delta
+    assert sent == [delta("ab", chunk_id="1-0", articles=[{"url": "u"}])]
+    assert chunks.sent == 1
+
+
+def test_buffer_is_sent_at_max_bytes():
+    chunks, sent = emitter(max_bytes=4, max_delay=60)
+    chunks.push(delta("ab"))
+    assert sent == []
+    chunks.push(delta("cd"))
+    assert [chunk["content"] for chunk in sent] == ["abcd"]
+
+
+def test_buffer_is_sent_after_max_delay():
+    chunks, sent = emitter(max_bytes=1024, max_delay=0.01)
+    chunks.push(delta("a"))
+    time.sleep(0.02)
+    chunks.flush_due()
+    assert [chunk["content"] for chunk in sent] == ["a"]
+
+
+def test_stages_are_buffered_separately():
+    chunks, sent = emitter(max_bytes=1024, max_delay=60)
+    chunks.push(delta("a", stage="plan", chunk_id="1-0"))
+    chunks.push(delta("b", stage="write", chunk_id="2-0"))
+    chunks.push(delta("c", stage="plan", chunk_id="1-1"))
+    chunks.flush()
+    assert [(chunk["metadata"]["stage"], chunk["content"]) for chunk in sent] == [("plan", "ac"), ("write", "b")]
+
+
+def test_final_chunk_flushes_the_buffers_first():
+    chunks, sent = emitter(max_bytes=1024, max_delay=60)
+    chunks.push(delta("a"))
+    chunks.push({"type": "articles", "articles": [{"url": "u"}]})
+    chunks.push(delta("b"))
+    chunks.push(delta("", chunk_id="9-0", end="yes"))
+    # Nothing is held back after the final chunk, and the order of the stream is kept
+    assert [(chunk["type"], chunk.get("content"), chunk.get("end")) for chunk in sent] == [
+        ("content", "a", None), ("articles", None, None), ("content", "b", None), ("content", "", "yes")]
+    chunks.flush()
+    assert chunks.sent == 4
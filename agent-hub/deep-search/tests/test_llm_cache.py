@@ -0,0 +1,59 @@
+import os
+import time
+
+from deep_search.llm_cache import LLMCache, prompt_key
+
+MESSAGES = [{"role": "user", "content": "What is DeepSeek?"}]
+
+
+def test_prompt_key_covers_model_messages_and_max_tokens():
+    key = prompt_key("gpt-4o", MESSAGES, 100)
+    assert key == prompt_key("gpt-4o", [dict(MESSAGES[0])], 100)
+    assert key != prompt_key("gpt-4o-mini", MESSAGES, 100)
+    assert key != prompt_key("gpt-4o", MESSAGES, 200)
+    assert key != prompt_key("gpt-4o", [{"role": "user", "content": "What is DeepSeek"}], 100)
+
+
+def test_hit_replays_the_deltas_and_miss_is_counted(tmp_path):
+    cache = LLMCache(str(tmp_path))
+    key = prompt_key("gpt-4o", MESSAGES, 100)
+    assert cache.get(key) is None
+    cache.put(key, ["Deep", "Seek ", "是"], model="gpt-4o")
+    # The deltas come back with the chunking of the original stream
+    assert cache.get(key) == ["Deep", "Seek ", "是"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes_saved"] == len("DeepSeek 是".encode("utf-8"))
+
+
+def test_entries_survive_a_restart(tmp_path):
+    key = prompt_key("gpt-4o", MESSAGES, 100)
+    LLMCache(str(tmp_path)).put(key, ["answer"])
+    cache = LLMCache(str(tmp_path))
+    assert cache.stats()["entries"] == 1
+    assert cache.get(key) == ["answer"]
+
+
+def test_expired_entries_are_misses_and_removed(tmp_path):
+    cache = LLMCache(str(tmp_path), ttl=0.01)
+    cache.put("key", ["answer"])
+    time.sleep(0.02)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path))
+    cache.put("a", ["x" * 100])
+    size = cache.stats()["bytes"]
+    cache.max_bytes = 2 * size + 20  # room for two entries, whose timestamps may differ in length
+    cache.put("b", ["y" * 100])
+    assert cache.get("a") is not None  # a is now used more recently than b
+    cache.put("c", ["z" * 100])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2 and stats["bytes"] <= cache.max_bytes
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
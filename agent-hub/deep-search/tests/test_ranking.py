@@ -0,0 +1,52 @@
+from deep_search.ranking import bm25_scores, drop_near_duplicates, hamming, simhash, tokenize
+
+SNIPPET = ("DeepSeek released an open source reasoning model trained with reinforcement learning, "
+           "matching larger models on math and coding benchmarks at a fraction of the training cost.")
+
+
+def test_tokenize_splits_words_and_cjk_characters():
+    assert tokenize("DeepSeek-R1, v3!") == ["deepseek", "r1", "v3"]
+    assert tokenize("深度搜索 AI") == ["深", "度", "搜", "索", "ai"]
+    assert tokenize(None) == []
+
+
+def test_bm25_ranks_documents_with_query_terms_first():
+    documents = [
+        "Weather forecast for the weekend",
+        "DeepSeek model release",
+        "DeepSeek model release notes and DeepSeek model benchmarks",
+        "A new model from another lab",
+    ]
+    scores = bm25_scores("DeepSeek model", documents)
+    assert scores.shape == (4,)
+    assert scores[0] == 0
+    assert min(scores[1], scores[2]) > scores[3] > 0
+    # A term found in fewer documents weighs more
+    assert bm25_scores("deepseek model", ["deepseek", "model", "model"]).argmax() == 0
+
+
+def test_bm25_without_query_terms_scores_zero():
+    assert bm25_scores("", ["a", "b"]).tolist() == [0, 0]
+    assert bm25_scores("!!", ["a"]).tolist() == [0]
+    assert bm25_scores("query", []).tolist() == []
+
+
+def test_simhash_of_near_duplicates_differs_in_few_bits():
+    edited = SNIPPET.replace("a fraction of", "much less than")
+    unrelated = "The city council approved the new budget for public transport and road repairs next year."
+    assert simhash(SNIPPET) == simhash(SNIPPET.upper())
+    assert hamming(simhash(SNIPPET), simhash(edited)) <= 10
+    assert hamming(simhash(SNIPPET), simhash(unrelated)) > 10
+
+
+def test_drop_near_duplicates_keeps_the_first_of_each_group():
+    texts = [
+        SNIPPET,
+        "The city council approved the new budget for public transport and road repairs next year.",
+        SNIPPET.replace("a fraction of", "much less than"),
+        SNIPPET,
+    ]
+    assert drop_near_duplicates(texts) == [0, 1]
+    # A distance of 0 only drops exact duplicates, 64 bits drops everything after the first text
+    assert drop_near_duplicates(texts, max_distance=0) == [0, 1, 2]
+    assert drop_near_duplicates(texts, max_distance=64) == [0]
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from deep_search.stage_graph import StageGraph
+
+
+def stage(*contents):
+    """A stage producing one chunk per content, which records the texts it was started with."""
+    calls = []
+
+    def run(inputs):
+        calls.append(inputs)
+        for content in contents:
+            yield {"content": content}
+
+    run.calls = calls
+    return run
+
+
+def test_dependencies_must_be_added_first():
+    graph = StageGraph().add("articles", stage("a"))
+    with pytest.raises(ValueError):
+        graph.add("report", stage("r"), deps=["articles", "outline"])
+
+
+def test_stages_start_after_their_dependencies_with_their_texts():
+    articles, outline, report = stage("a", "b"), stage("o"), stage("r1", "r2")
+    graph = (StageGraph(poll_interval=0.01)
+             .add("articles", articles)
+             .add("outline", outline, deps=["articles"])
+             .add("report", report, deps=["articles", "outline"]))
+    contents = [chunk["content"] for chunk in graph.stream()]
+    assert contents == ["a", "b", "o", "r1", "r2"]
+    assert outline.calls == [{"articles": "ab"}]
+    assert report.calls == [{"articles": "ab", "outline": "o"}]
+    assert graph.results == {"articles": "ab", "outline": "o", "report": "r1r2"}
+
+
+def test_independent_stages_run_at_the_same_time():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def thinking(inputs):
+        barrier.wait()  # only passes when both stages are running
+        yield {"content": "t"}
+
+    graph = StageGraph(max_concurrency=2, poll_interval=0.01).add("one", thinking).add("two", thinking)
+    assert [chunk["content"] for chunk in graph.stream()] == ["t", "t"]
+    assert not barrier.broken
+
+
+def test_stage_error_is_raised_by_stream():
+    def failing(inputs):
+        yield {"content": "partial"}
+        raise RuntimeError("LLM call failed")
+
+    report = stage("r")
+    graph = StageGraph(poll_interval=0.01).add("outline", failing).add("report", report, deps=["outline"])
+    chunks = graph.stream()
+    assert next(chunks)["content"] == "partial"
+    with pytest.raises(RuntimeError, match="LLM call failed"):
+        next(chunks)
+    # Stages depending on the failed one never start
+    assert report.calls == []
+
+
+def test_should_stop_ends_the_stream_and_closes_running_stages():
+    closed = threading.Event()
+
+    def endless(inputs):
+        try:
+            while True:
+                yield {"content": "x"}
+        finally:
+            closed.set()
+
+    graph = StageGraph(poll_interval=0.01).add("endless", endless)
+    received = []
+    for chunk in graph.stream(should_stop=lambda: len(received) >= 3):
+        received.append(chunk)
+    assert len(received) == 3
+    assert closed.wait(5)
@@ -5,18 +5,25 @@ from dotenv import load_dotenv
 from openai import OpenAI
 from deepseek import agent_config_dir_path
 from mofa.utils.files.read import read_yaml
+from request_deadline import TIMEOUT_RESULT, deadline_passed
 
 
 def main():
     agent = MofaAgent(agent_name='deepseek')
     while True:
+        query = agent.receive_parameter(parameter_name='query')
+        serper_result = agent.receive_parameter(parameter_name='serper_result')
+        if deadline_passed(agent):
+            # The caller stopped waiting, skip the LLM call
+            agent.send_output(agent_output_name='deepseek_result', agent_result=TIMEOUT_RESULT)
+            continue
         load_dotenv(agent_config_dir_path + '/.env.secret')
         client = OpenAI(api_key=os.getenv('LLM_API_KEY'), base_url="https://api.deepseek.com")
         response = client.chat.completions.create(
             model="deepseek-chat",
             messages=[
                 {"role": "system", "content": json.dumps(read_yaml(file_path = agent_config_dir_path + '/configs/agent.yml').get('agent').get('prompt'))},
-                {"role": "user", "content":  f"user query: {agent.receive_parameter(parameter_name='query')}  serper search data : {json.dumps(agent.receive_parameter(parameter_name='serper_result'))}"},
+                {"role": "user", "content":  f"user query: {query}  serper search data : {json.dumps(serper_result)}"},
             ],
             stream=False
         )
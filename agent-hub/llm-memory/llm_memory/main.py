@@ -6,15 +6,25 @@ from mofa.kernel.base import MemoryAgent
 from openai import OpenAI
 from mofa.utils.files.read import read_yaml
 from mem0 import Memory
+from request_deadline import TIMEOUT_RESULT, deadline_passed
+
+
 @run_agent
 def run(agent: MofaAgent,memory,messages:list=[]):
     query = agent.receive_parameter(parameter_name='query')
+    if deadline_passed(agent):
+        # The caller stopped waiting, skip the memory search and the LLM call
+        agent.send_output(agent_output_name='llm-memory-result', agent_result=TIMEOUT_RESULT)
+        return
     os.environ['OPENAI_API_KEY'] = os.getenv('LLM_API_KEY')
 
     user_id = os.getenv('MEMORY_ID', 'mofa-memory-user')
 
     relevant_memories = memory.search(query=query, user_id=user_id, limit=os.getenv('MEMORY_LIMIT', 5))
     print('relevant_memories : ',relevant_memories)
+    if deadline_passed(agent):
+        agent.send_output(agent_output_name='llm-memory-result', agent_result=TIMEOUT_RESULT)
+        return
     base_url = os.getenv('LLM_BASE_URL', 'https://api.openai.com/v1')
 
     client = OpenAI(api_key=os.environ['OPENAI_API_KEY'], base_url=base_url)
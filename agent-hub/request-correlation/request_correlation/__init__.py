@@ -0,0 +1,43 @@
+import json
+from collections import OrderedDict
+from typing import Optional
+
+# Metadata key the OpenAI servers use to correlate a request, the inputs it causes and the replies to it.
+REQUEST_ID_KEY = 'request_id'
+# Requests whose inputs are only partly received, oldest are forgotten beyond this.
+MAX_PENDING_REQUESTS = 64
+
+# Inputs of requests that are not complete yet, keyed by request id. Kept across `run` calls.
+_pending_parameters = OrderedDict()
+
+
+def event_request_id(event) -> Optional[str]:
+    """The request id in the metadata of an event, None without one."""
+    return (event.get('metadata') or {}).get(REQUEST_ID_KEY)
+
+
+def receive_request_parameters(agent, parameter_names: list) -> dict:
+    """
+    Like `agent.receive_parameters`, but only combines inputs that carry the
+    same `request_id` metadata, so concurrent requests are never mixed up.
+    `agent.event` is left on an input of the returned request, which makes
+    `agent.send_output` echo that request's metadata back to the server.
+    """
+    for event in agent.node:
+        if event['type'] != 'INPUT' or event['id'] not in parameter_names:
+            continue
+        request_id = event_request_id(event)
+        if request_id not in _pending_parameters:
+            _pending_parameters[request_id] = {name: None for name in parameter_names}
+            while len(_pending_parameters) > MAX_PENDING_REQUESTS:
+                _pending_parameters.popitem(last=False)
+        parameter_data = _pending_parameters[request_id]
+        raw = event['value'][0].as_py()
+        try:
+            parameter_data[event['id']] = json.loads(raw).get('node_results')
+        except Exception:
+            parameter_data[event['id']] = raw
+        if all(value is not None for value in parameter_data.values()):
+            agent.event = event
+            return _pending_parameters.pop(request_id)
+    return {name: None for name in parameter_names}
@@ -0,0 +1,50 @@
+import json
+
+import pyarrow as pa
+
+import request_correlation
+from request_correlation import REQUEST_ID_KEY, event_request_id, receive_request_parameters
+
+
+class Agent:
+    def __init__(self, events):
+        self.node = iter(events)
+        self.event = None
+
+
+def input_event(input_id, value, request_id=None):
+    metadata = {} if request_id is None else {REQUEST_ID_KEY: request_id}
+    return {'type': 'INPUT', 'id': input_id, 'value': pa.array([value]), 'metadata': metadata}
+
+
+def test_event_request_id():
+    assert event_request_id(input_event('query', 'q', 'a')) == 'a'
+    assert event_request_id(input_event('query', 'q')) is None
+    assert event_request_id({'type': 'INPUT'}) is None
+
+
+def test_inputs_are_combined_per_request():
+    agent = Agent([
+        input_event('query', 'first query', 'a'),
+        input_event('query', 'second query', 'b'),
+        {'type': 'ERROR', 'error': 'timeout'},
+        input_event('agent_config', json.dumps({'node_results': 'second config'}), 'b'),
+        input_event('agent_config', 'first config', 'a'),
+    ])
+    assert receive_request_parameters(agent, ['query', 'agent_config']) == {
+        'query': 'second query', 'agent_config': 'second config'}
+    # agent.event carries the metadata send_output echoes back
+    assert event_request_id(agent.event) == 'b'
+    assert receive_request_parameters(agent, ['query', 'agent_config']) == {
+        'query': 'first query', 'agent_config': 'first config'}
+    assert event_request_id(agent.event) == 'a'
+
+
+def test_pending_requests_are_bounded(monkeypatch):
+    monkeypatch.setattr(request_correlation, 'MAX_PENDING_REQUESTS', 2)
+    monkeypatch.setattr(request_correlation, '_pending_parameters', type(request_correlation._pending_parameters)())
+    agent = Agent([input_event('query', f'query {i}', str(i)) for i in range(4)]
+                  + [input_event('agent_config', 'config', '0')])
+    # Request 0 was forgotten, so its late input starts over instead of completing it
+    assert receive_request_parameters(agent, ['query', 'agent_config']) == {'query': None, 'agent_config': None}
+    assert list(request_correlation._pending_parameters) == ['3', '0']
@@ -0,0 +1,19 @@
+import time
+from typing import Optional
+
+# Metadata key of the deadline the OpenAI servers put on every request, in Unix milliseconds.
+DEADLINE_KEY = 'deadline_ms'
+# Answer of an agent that skipped a request because its deadline had passed.
+TIMEOUT_RESULT = 'Request deadline passed before the agent could answer.'
+
+
+def request_deadline_ms(agent) -> Optional[float]:
+    """The deadline in the metadata of the input the agent received last, None without one."""
+    deadline_ms = ((getattr(agent, 'event', None) or {}).get('metadata') or {}).get(DEADLINE_KEY)
+    return None if deadline_ms is None else float(deadline_ms)
+
+
+def deadline_passed(agent) -> bool:
+    """The deadline of the current request has passed: the caller stopped waiting for the answer."""
+    deadline_ms = request_deadline_ms(agent)
+    return deadline_ms is not None and time.time() * 1000 > deadline_ms
@@ -0,0 +1,20 @@
+import time
+
+from request_deadline import deadline_passed, request_deadline_ms
+
+
+class Agent:
+    def __init__(self, metadata=None):
+        self.event = None if metadata is None else {'metadata': metadata}
+
+
+def test_no_deadline_never_passes():
+    assert request_deadline_ms(Agent()) is None
+    assert not deadline_passed(Agent())
+    assert not deadline_passed(Agent({}))
+
+
+def test_deadline_in_metadata():
+    now_ms = time.time() * 1000
+    assert deadline_passed(Agent({'deadline_ms': now_ms - 1000}))
+    assert not deadline_passed(Agent({'deadline_ms': str(int(now_ms + 60000))}))
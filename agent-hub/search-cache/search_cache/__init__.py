@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+# Results `search_web_with_serper` asks for when no `search_num` is given.
+DEFAULT_SEARCH_NUM = 10
+
+
+def search_key(query: str, num=None) -> str:
+    """
+    Cache key of a web search: the query with case and whitespace normalized,
+    and the result count, with None standing for the Serper default so that
+    callers passing it and callers leaving it out share entries.
+    """
+    normalized = re.sub(r"\s+", " ", str(query)).strip().lower()
+    payload = json.dumps({"q": normalized, "num": DEFAULT_SEARCH_NUM if num is None else int(num)},
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    TTL cache for web search results, with single-flight lookups.
+
+    Results are kept in an in-memory LRU of `max_entries` and, when
+    `directory` is set, as JSON files that survive restarts and are shared
+    by every agent pointing at the same directory (deep-search and
+    serper-search). Concurrent lookups of the same query call `fetch` once:
+    threads of one process wait for the first one, and other processes
+    wait on a lock file in the directory for at most `lock_timeout`
+    seconds before searching themselves. Empty results and errors are not
+    cached.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: float = 3600, max_entries: int = 1024,
+                 lock_timeout: float = 30, poll_interval: float = 0.05):
+        self.directory = directory or None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # lookups answered by a search another caller was already running
+        self._memory = OrderedDict()  # key -> (expires_at, results), least recently used first
+        self._inflight = {}  # key -> threading.Event set when the search finished
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def search(self, query: str, fetch: Callable[[], Any], num=None) -> Any:
+        """The cached results of `query`, calling `fetch()` on a miss."""
+        if self.ttl <= 0:
+            return fetch()
+        key = search_key(query, num)
+        while True:
+            results = self._get(key)
+            if results is not None:
+                self._count("hits")
+                return results
+            with self._lock:
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+            if leader:
+                break
+            event.wait(self.lock_timeout)
+            results = self._get(key)
+            if results is not None:
+                self._count("shared")
+                return results
+            # The search that was running failed or returned nothing: search again.
+        try:
+            self._count("misses")
+            with self._process_lock(key) as waited:
+                results = self._get(key) if waited else None
+                if results is not None:
+                    self._count("shared")
+                    return results
+                results = fetch()
+                if results:
+                    self._set(key, results)
+                return results
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_ratio": (self.hits + self.shared) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < now:
+            return None
+        self._remember(key, entry["expires_at"], entry["results"])
+        return entry["results"]
+
+    def _set(self, key: str, results: Any):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, results)
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "results": results}, f, ensure_ascii=False)
+            # Readers in other processes only ever see complete files.
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print("Could not write search cache entry:", e)
+
+    def _remember(self, key: str, expires_at: float, results: Any):
+        with self._lock:
+            self._memory[key] = (expires_at, results)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def _process_lock(self, key: str):
+        return _LockFile(self._path(key) + ".lock" if self.directory else None, self.lock_timeout,
+                         self.poll_interval)
+
+
+class _LockFile:
+    """
+    Exclusive lock file shared by processes. Entering waits while another
+    process holds a lock younger than `timeout`; `waited` tells whether it
+    had to, i.e. whether that process may have stored the result meanwhile.
+    """
+
+    def __init__(self, path: Optional[str], timeout: float, poll_interval: float):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.held = False
+
+    def __enter__(self) -> bool:
+        waited = False
+        if self.path is None:
+            return waited
+        give_up = time.monotonic() + self.timeout
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self.held = True
+                return waited
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(self.path) > self.timeout
+                except OSError:
+                    continue  # released meanwhile
+                if stale:
+                    # Left behind by a process that died while searching.
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+                    continue
+                if time.monotonic() > give_up:
+                    return waited
+                waited = True
+                time.sleep(self.poll_interval)
+            except OSError:
+                return waited
+
+    def __exit__(self, *exc):
+        if self.held:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+from search_cache import DEFAULT_SEARCH_NUM, SearchCache, _LockFile, search_key
+
+
+def test_search_key_normalizes_query_and_default_num():
+    assert search_key("  What is  DeepSeek ") == search_key("what is deepseek")
+    assert search_key("q") == search_key("q", DEFAULT_SEARCH_NUM) == search_key("q", str(DEFAULT_SEARCH_NUM))
+    assert search_key("q", 20) != search_key("q")
+
+
+def test_hit_miss_and_ttl():
+    cache = SearchCache(ttl=0.05)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"url": f"https://example.com/{len(calls)}"}]
+
+    first = cache.search("query", fetch)
+    assert cache.search("QUERY", fetch) == first
+    time.sleep(0.1)
+    assert cache.search("query", fetch) != first
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_empty_results_and_errors_are_not_cached():
+    cache = SearchCache()
+    assert cache.search("query", lambda: []) == []
+    try:
+        cache.search("query", lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    assert cache.search("query", lambda: ["result"]) == ["result"]
+    assert cache.stats()["misses"] == 3
+
+
+def test_zero_ttl_disables_cache():
+    cache = SearchCache(ttl=0)
+    calls = []
+    cache.search("query", lambda: calls.append(1) or ["result"])
+    cache.search("query", lambda: calls.append(1) or ["result"])
+    assert len(calls) == 2
+
+
+def test_disk_tier_is_shared(tmp_path):
+    SearchCache(str(tmp_path)).search("query", lambda: ["result"])
+    assert SearchCache(str(tmp_path)).search("query", lambda: ["other"]) == ["result"]
+
+
+def test_expired_disk_entry_is_searched_again(tmp_path):
+    SearchCache(str(tmp_path), ttl=0.05).search("query", lambda: ["old"])
+    time.sleep(0.1)
+    assert SearchCache(str(tmp_path), ttl=0.05).search("query", lambda: ["new"]) == ["new"]
+
+
+def test_concurrent_lookups_search_once():
+    cache = SearchCache()
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return ["result"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.search("query", fetch))) for _ in range(5)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [["result"]] * 5
+    assert cache.stats()["shared"] == 4
+
+
+def test_lock_file_waits_for_holder_and_is_released(tmp_path):
+    path = str(tmp_path / "key.lock")
+    with _LockFile(path, timeout=5, poll_interval=0.01) as waited:
+        assert not waited and os.path.exists(path)
+    assert not os.path.exists(path)
+
+    holder = _LockFile(path, timeout=5, poll_interval=0.01)
+    holder.__enter__()
+    threading.Timer(0.05, holder.__exit__).start()
+    with _LockFile(path, timeout=5, poll_interval=0.01) as waited:
+        assert waited
+
+
+def test_stale_lock_file_is_taken_over(tmp_path):
+    path = str(tmp_path / "key.lock")
+    open(path, "w").close()
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    started = time.monotonic()
+    with _LockFile(path, timeout=1, poll_interval=0.01) as waited:
+        assert not waited
+    assert time.monotonic() - started < 0.5
+
+
+def test_other_process_result_is_used_after_waiting(tmp_path):
+    cache = SearchCache(str(tmp_path), lock_timeout=5, poll_interval=0.01)
+    other = SearchCache(str(tmp_path))
+    key = search_key("query")
+    lock = _LockFile(os.path.join(str(tmp_path), key + ".json.lock"), 5, 0.01)
+    lock.__enter__()
+
+    def finish():
+        other._set(key, ["from other process"])  # what the process holding the lock stores
+        lock.__exit__()
+
+    threading.Timer(0.05, finish).start()
+    assert cache.search("query", lambda: ["searched again"]) == ["from other process"]
+    assert cache.stats()["shared"] == 1
@@ -4,6 +4,18 @@ from dotenv import load_dotenv
 from mofa.agent_build.base.base_agent import MofaAgent, run_agent
 from mofa.kernel.tools.web_search import search_web_with_serper
 from serper_search import agent_config_dir_path
+from search_cache import SearchCache
+
+_search_cache = None
+
+
+def search_cache() -> SearchCache:
+    # One cache per process. Results are kept for SERPER_CACHE_TTL seconds, in memory and, with
+    # SERPER_CACHE_DIR, on disk where deep-search can share them; concurrent identical queries search once.
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(os.getenv('SERPER_CACHE_DIR', ''), ttl=float(os.getenv('SERPER_CACHE_TTL', 3600)))
+    return _search_cache
 
 
 @run_agent
@@ -15,8 +27,10 @@ def run(agent: MofaAgent):
     # Receive the user query
     user_query = agent.receive_parameter('query')
 
-    # Perform web search using Serper
-    serper_result = search_web_with_serper(query=user_query, subscription_key=os.getenv("SERPER_API_KEY"),search_num=os.getenv('SEAPER_SEARCH_NUM',10))
+    # Perform web search using Serper, through the search cache
+    search_num = int(os.getenv('SEAPER_SEARCH_NUM', 10))
+    serper_result = search_cache().search(user_query, lambda: search_web_with_serper(
+        query=user_query, subscription_key=os.getenv("SERPER_API_KEY"), search_num=search_num), num=search_num)
 
     # Send the search results back to the agent
     agent.send_output(agent_output_name='serper_result', agent_result=serper_result)
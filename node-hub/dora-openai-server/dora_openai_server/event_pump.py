@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from openai_server_common.dataflow import (REQUEST_ID_KEY, DoraNodeThread, decode_reply, extract_request_id,
+                                           is_partial, parse_result, stream_chunk)
+
+
+def reply_content(result: Any) -> str:
+    """Text of a reply: the 'content' of a streaming chunk, or the whole result otherwise."""
+    if isinstance(result, dict) and "content" in result and "type" in result:
+        return result["content"] or ""
+    if result is None or isinstance(result, str):
+        return result or ""
+    return json.dumps(result, ensure_ascii=False)
+
+
+async def collect_reply(stream: "ReplyStream", started_at: float, deadline: float) -> Optional[str]:
+    """
+    The whole reply of a non-streaming request as text. A single reply is
+    returned as the agent sent it; the partial replies of a streaming agent
+    are collected until the final one and joined. The first reply must
+    arrive before the monotonic `deadline`, and two replies may be at most
+    as far apart as the request timeout. None when the agent sent nothing.
+    """
+    idle_timeout = deadline - started_at
+    wait_until = deadline
+    contents = []
+    while True:
+        item = await asyncio.wait_for(stream.queue.get(), timeout=max(0.0, wait_until - time.monotonic()))
+        if isinstance(item, Exception):
+            raise item
+        result, final = item
+        if final and result is None and not contents:
+            return None
+        contents.append(reply_content(result))
+        if final:
+            return "".join(contents)
+        wait_until = time.monotonic() + idle_timeout
+
+
+class ReplyStream:
+    """
+    The replies of one streaming request. `queue` receives a
+    `(result, final)` tuple per reply, or an exception if the dataflow stops.
+    Streaming chunks arrive decoded; any other result is the 'node_results'
+    of the reply as the agent sent it.
+    """
+
+    def __init__(self, pump: "DoraEventPump", request_id: str):
+        self.pump = pump
+        self.request_id = request_id
+        self.queue = asyncio.Queue()
+
+    def close(self):
+        """Stop receiving replies; late replies of this request are dropped."""
+        self.pump._discard(self.request_id)
+
+
+class DoraEventPump(DoraNodeThread):
+    """
+    Owns the Dora node on a single background thread (see `DoraNodeThread`).
+
+    Replies coming back from the dataflow are handed to the asyncio future of
+    the request that is waiting for them, which keeps the uvicorn event loop
+    free while the dataflow is working.
+
+    Every output carries a `request_id` in its metadata. Replies are routed by
+    that id, and only replies without one fall back to first-in-first-out.
+
+    `observe_queue_wait` and `observe_dataflow_latency` are optional callbacks
+    that receive, in seconds, how long an output waited for the pump thread
+    and how long the dataflow took to reply after it was sent.
+
+    `open_stream` subscribes to all replies of a request instead of the first
+    one: streaming chunks are decoded on the pump thread and queued until the
+    reply that completes the request.
+    """
+
+    thread_name = "dora-event-pump"
+
+    def __init__(self, node, reply_ids=("v1/chat/completions",), poll_interval: float = 0.01,
+                 observe_queue_wait: Optional[Callable[[float], None]] = None,
+                 observe_dataflow_latency: Optional[Callable[[float], None]] = None):
+        super().__init__(node, reply_ids, poll_interval)
+        self.observe_queue_wait = observe_queue_wait
+        self.observe_dataflow_latency = observe_dataflow_latency
+        self._pending = OrderedDict()  # request id -> [loop, future or ReplyStream, sent_at], oldest first
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, output_id: str, data, metadata: Optional[dict] = None,
+               request_id: Optional[str] = None) -> asyncio.Future:
+        """
+        Queue `data` for `node.send_output` and return a future that resolves
+        with the reply event. Must be called from the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._stopped.is_set():
+            future.set_exception(RuntimeError("Dora dataflow has stopped"))
+            return future
+        request_id = request_id or uuid.uuid4().hex
+        metadata = dict(metadata or {}, **{REQUEST_ID_KEY: request_id})
+        with self._lock:
+            self._pending[request_id] = [loop, future, None]
+        future.add_done_callback(lambda _: self._discard(request_id))
+        self._enqueue(output_id, data, metadata, time.monotonic())
+        return future
+
+    def open_stream(self, output_id: str, data, metadata: Optional[dict] = None,
+                    request_id: Optional[str] = None) -> ReplyStream:
+        """
+        Queue `data` for `node.send_output` and return the stream that receives
+        every reply of the request. Must be called from the running event loop.
+        """
+        stream = ReplyStream(self, request_id or uuid.uuid4().hex)
+        if self._stopped.is_set():
+            stream.queue.put_nowait(RuntimeError("Dora dataflow has stopped"))
+            return stream
+        metadata = dict(metadata or {}, **{REQUEST_ID_KEY: stream.request_id})
+        with self._lock:
+            self._pending[stream.request_id] = [asyncio.get_running_loop(), stream, None]
+        self._enqueue(output_id, data, metadata, time.monotonic())
+        return stream
+
+    def _discard(self, request_id: str):
+        with self._lock:
+            self._pending.pop(request_id, None)
+
+    def _sent(self, metadata: Optional[dict], enqueued_at: float):
+        sent_at = time.monotonic()
+        with self._lock:
+            waiter = self._pending.get((metadata or {}).get(REQUEST_ID_KEY))
+            if waiter is not None:
+                waiter[2] = sent_at
+        if self.observe_queue_wait is not None:
+            self.observe_queue_wait(sent_at - enqueued_at)
+
+    def _send_failed(self, metadata: Optional[dict], enqueued_at: float, error: Exception):
+        with self._lock:
+            waiter = self._pending.pop((metadata or {}).get(REQUEST_ID_KEY), None)
+        if waiter is not None:
+            self._fail(waiter, RuntimeError(f"Could not send the request into the dataflow: {error}"))
+
+    def _dispatch(self, event):
+        result = decode_reply(event)
+        request_id = extract_request_id(event, parse_result(result))
+        with self._lock:
+            if request_id is None and self._pending:
+                # Agents that drop the metadata answer requests in the order
+                # they were sent, so the reply belongs to the oldest request.
+                request_id = next(iter(self._pending))
+            waiter = self._pending.get(request_id)
+        if waiter is None:
+            # The request already timed out or was cancelled.
+            print("Dropping dataflow reply without a waiting request:", event["id"], request_id)
+            return
+        loop, target, sent_at = waiter
+        if isinstance(target, ReplyStream):
+            chunk = stream_chunk(result)
+            if chunk is not None:
+                result = chunk
+            final = not is_partial(result)
+            loop.call_soon_threadsafe(target.queue.put_nowait, (result, final))
+        else:
+            final = True
+            loop.call_soon_threadsafe(_resolve, target, event)
+        if final:
+            self._discard(request_id)
+            if self.observe_dataflow_latency is not None and sent_at is not None:
+                self.observe_dataflow_latency(time.monotonic() - sent_at)
+
+    def _close(self):
+        self._fail_pending(RuntimeError("Dora dataflow has stopped"))
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for waiter in pending:
+            self._fail(waiter, error)
+
+    @staticmethod
+    def _fail(waiter, error: Exception):
+        loop, target, _ = waiter
+        if loop.is_closed():
+            return
+        if isinstance(target, ReplyStream):
+            loop.call_soon_threadsafe(target.queue.put_nowait, error)
+        else:
+            loop.call_soon_threadsafe(_reject, target, error)
+
+
+def _resolve(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _reject(future: asyncio.Future, error: Exception):
+    if not future.done():
+        future.set_exception(error)
@@ -1,10 +1,17 @@
 import json
 import os
+import signal
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware  # 需要导入 CORSMiddleware
 from pydantic import BaseModel  # Pydantic is used for request and response validation
-from typing import List, Optional  # Type hinting for request and response data
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Any, AsyncGenerator, Callable, List, Optional  # Type hinting for request and response data
 import uvicorn  # Uvicorn for running ASGI servers
 from dora import Node  # Dora for node communication in a dataflow system
 import asyncio  # Asynchronous I/O operations
@@ -12,10 +19,78 @@ import pyarrow as pa  # PyArrow for data serialization and transfer
 import ast  # Abstract Syntax Trees for evaluating user input
 from datetime import datetime
 
-# Timeout duration for waiting on responses from Dora nodes
-DORA_RESPONSE_TIMEOUT = 180
+from openai_server_common.admission import (DEADLINE_KEY, AdmissionController, AdmissionRejected, parse_weights,
+                                           request_deadline, wall_clock_deadline)
+from openai_server_common.broker import BROKER_CONNECT_ENV, DoraBroker, RemoteNode
+from openai_server_common.cache import ResponseCache, cache_key
+from openai_server_common.metrics import MetricsRegistry
+from openai_server_common.tokens import usage_block
 
-app = FastAPI()
+from dora_openai_server.event_pump import DoraEventPump, ReplyStream, collect_reply, reply_content
+
+# Default deadline of a request, in seconds, covering the wait for a free slot and for the dataflow reply.
+# Clients may ask for another one with the X-Request-Timeout header, up to MAX_REQUEST_TIMEOUT.
+DORA_RESPONSE_TIMEOUT = float(os.getenv('DORA_RESPONSE_TIMEOUT', 180))
+MAX_REQUEST_TIMEOUT = float(os.getenv('MAX_REQUEST_TIMEOUT', 600))
+
+# Admission control: requests beyond the in-flight limit wait in a bounded queue, the rest get 429.
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv('MAX_IN_FLIGHT_REQUESTS', 8))  # 0 disables the limit
+MAX_QUEUED_REQUESTS = int(os.getenv('MAX_QUEUED_REQUESTS', 32))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))  # Seconds sent in the Retry-After header
+# Waiting requests are queued per class, picked with the X-Priority (or X-Tenant) header, and share
+# freed slots by weighted fair queuing. Unknown or missing classes use DEFAULT_PRIORITY.
+PRIORITY_WEIGHTS = parse_weights(os.getenv('PRIORITY_WEIGHTS', 'interactive=4,default=2,batch=1'))
+DEFAULT_PRIORITY = os.getenv('DEFAULT_PRIORITY', 'default')
+
+# Multi-worker mode: with HTTP_WORKERS above 1, uvicorn runs that many worker processes and this
+# process becomes a broker that owns the Dora node. Workers reach it over a Unix socket
+# (DORA_BROKER_SOCKET, a temporary path by default). Admission limits, the in-memory cache and
+# metrics are per worker.
+HTTP_WORKERS = int(os.getenv('HTTP_WORKERS', 1))
+DORA_BROKER_SOCKET = os.getenv('DORA_BROKER_SOCKET', '')
+
+# Optional response cache: identical requests are answered without running the dataflow again.
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))  # Entries kept in memory
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))  # Seconds an entry stays valid
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '')  # On-disk tier, disabled when empty
+# Limits of the on-disk tier, least recently used files are removed beyond them; 0 disables a limit
+RESPONSE_CACHE_DISK_ENTRIES = int(os.getenv('RESPONSE_CACHE_DISK_ENTRIES', 10000))
+RESPONSE_CACHE_DISK_MB = float(os.getenv('RESPONSE_CACHE_DISK_MB', 256))
+
+# Metrics exposed in the Prometheus text format on GET /metrics
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter("dora_openai_server_requests_total", "Chat completion requests by outcome", ["status"])
+IN_FLIGHT = metrics.gauge("dora_openai_server_in_flight_requests", "Requests waiting for a dataflow reply")
+QUEUED = metrics.gauge("dora_openai_server_queued_requests", "Requests waiting for an admission slot", ["priority"])
+QUEUE_WAIT = metrics.histogram("dora_openai_server_queue_wait_seconds", "Time requests waited for an admission slot",
+                               ["priority"])
+SEND_DELAY = metrics.histogram("dora_openai_server_send_delay_seconds",
+                               "Time between submitting a request and the pump thread sending it into the dataflow")
+DATAFLOW_LATENCY = metrics.histogram("dora_openai_server_dataflow_latency_seconds",
+                                     "Time between sending a request into the dataflow and receiving its reply")
+TIME_TO_FIRST_TOKEN = metrics.histogram("dora_openai_server_time_to_first_token_seconds",
+                                        "Time between accepting a streaming request and sending its first content", ["cache"])
+REQUEST_LATENCY = metrics.histogram("dora_openai_server_request_latency_seconds",
+                                    "End-to-end time to answer a chat completion request", ["cache"])
+TOKENS = metrics.counter("dora_openai_server_tokens_total", "Prompt and completion tokens served", ["kind"])
+CACHE_LOOKUPS = metrics.counter("dora_openai_server_cache_lookups_total", "Response cache lookups", ["result"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uvicorn starts worker processes without run_fastapi, so they start and stop their pump here
+    worker = isinstance(node, RemoteNode)
+    if worker:
+        pump.start()
+    try:
+        yield
+    finally:
+        if worker:
+            pump.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "*",  # Allow all origins (be careful with this in production)
@@ -45,6 +120,7 @@ class ChatCompletionRequest(BaseModel):
     messages: List[ChatCompletionMessage]  # List of chat messages
     temperature: Optional[float] = 1.0  # Optional: Sampling temperature (defaults to 1.0)
     max_tokens: Optional[int] = 100  # Optional: Maximum number of tokens (defaults to 100)
+    stream: Optional[bool] = False  # Optional: Send the reply as chat.completion.chunk server-sent events
 
 
 class ChatCompletionResponse(BaseModel):
@@ -56,7 +132,17 @@ class ChatCompletionResponse(BaseModel):
     usage: dict  # Usage statistics (e.g., prompt_tokens, completion_tokens, total_tokens)
 
 
-node = Node()
+# Worker processes of the multi-worker mode reach the node of the broker process through a RemoteNode.
+node = RemoteNode(os.environ[BROKER_CONNECT_ENV]) if os.getenv(BROKER_CONNECT_ENV) else Node()
+# The pump thread is the only place that touches `node` once the server runs.
+pump = DoraEventPump(node, reply_ids=("v1/chat/completions",),
+                     observe_queue_wait=SEND_DELAY.observe, observe_dataflow_latency=DATAFLOW_LATENCY.observe)
+admission = AdmissionController(max_in_flight=MAX_IN_FLIGHT_REQUESTS, max_queued=MAX_QUEUED_REQUESTS,
+                                retry_after=ADMISSION_RETRY_AFTER, weights=PRIORITY_WEIGHTS,
+                                default_class=DEFAULT_PRIORITY)
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, disk_dir=RESPONSE_CACHE_DIR,
+                               disk_max_entries=RESPONSE_CACHE_DISK_ENTRIES,
+                               disk_max_bytes=int(RESPONSE_CACHE_DISK_MB * 1024 * 1024)) if RESPONSE_CACHE_ENABLED else None
 
 
 def clean_string(input_string: str):
@@ -65,14 +151,20 @@ def clean_string(input_string: str):
 
 # Defines a POST endpoint /v1/chat/completions to handle chat completion requests.
 @app.post("/v1/chat/completions")
-async def create_chat_completion(request: ChatCompletionRequest):
+async def create_chat_completion(request: ChatCompletionRequest, response: Response,
+                                 x_request_timeout: Optional[str] = Header(None),
+                                 x_priority: Optional[str] = Header(None), x_tenant: Optional[str] = Header(None)):
     """
     - Accepts a ChatCompletionRequest as input.
+    - Answers from the response cache when an identical request was already completed.
+    - Waits for an admission slot in the queue of its priority class, or rejects the request with 429 when the queue is full.
     - Extracts user messages and converts them to a suitable PyArrow format.
     - Sends the message to a Dora node for processing.
     - Waits for a response and returns it in a structured format (with token usage and completion).
+    - With `stream: true`, forwards partial replies as chat.completion.chunk server-sent events instead.
     """
 
+    started_at = time.monotonic()
     # Extracts the user's message from the list of messages and converts it into a PyArrow array for efficient serialization.
     data = next(
         (msg.content for msg in request.messages if msg.role == "user"),
@@ -81,42 +173,98 @@ async def create_chat_completion(request: ChatCompletionRequest):
 
     # Convert the data into a PyArrow array for efficient data processing
     data = pa.array([clean_string(data)])
+    request_id = uuid.uuid4().hex
+
+    key = None
+    if response_cache is not None:
+        key = cache_key(request.model, [msg.model_dump() for msg in request.messages],
+                        request.temperature, request.max_tokens)
+        cached = await response_cache.lookup(key)
+        response.headers["X-Cache"] = "MISS" if cached is None else "HIT"
+        CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            if request.stream:
+                return StreamingResponse(stream_cached_completion(request, request_id, cached, started_at),
+                                         media_type="text/event-stream", headers={"X-Cache": "HIT"})
+            REQUESTS.inc(status="ok")
+            REQUEST_LATENCY.observe(time.monotonic() - started_at, cache="hit")
+            return build_completion_response(request, request_id, cached)
+
     now = datetime.now()
     formatted_time = now.strftime("%Y-%m-%d %H:%M:%S")
 
     print(formatted_time,'      received data:', data, )
-    # The message is then sent to the next node in the dataflow system with the output label 'v1/chat/completions'
-    node.send_output("v1/chat/completions", data)
-    print('发送完毕')
-    # Dora Node Event Loop: Wait for response from the next node in the dataflow system.
-    while True:
-        # Get the next event from the node (with a timeout)
-        event = node.next(timeout=DORA_RESPONSE_TIMEOUT)
-        # Check if the event is an error or an input event for chat completions
-        # if event["type"] == "ERROR":
-        #     response_str = "No response received. Err: "
-        #     break
-        # If the event is an input event with the expected ID, process the response
-        if  event["type"] == "INPUT" and event["id"] == "v1/chat/completions":
-            response = event["value"]
-            # Extract the first element of the response or set a default message if no response is received
-            response_str = response[0].as_py() if response else "No response received"
-            if "No response received" != response_str:
-                try:
-                    response_str = json.loads(response_str)
-                    response_str = response_str['node_results']
-                except Exception as e :
-                    pass
-
-            break
-        else:
-            pass
+    # Every request gets its own deadline for queueing and for the dataflow reply
+    deadline = request_deadline(started_at, x_request_timeout, DORA_RESPONSE_TIMEOUT, MAX_REQUEST_TIMEOUT)
+    priority = admission.request_class(x_priority or x_tenant)
+    try:
+        QUEUE_WAIT.observe(await admission.acquire(deadline, priority), priority=priority)
+    except AdmissionRejected as e:
+        REQUESTS.inc(status="rejected")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        REQUESTS.inc(status="timeout")
+        raise HTTPException(status_code=504, detail="Request deadline passed while waiting for an admission slot")
+
+    # Agents skip the request once its deadline for the first reply has passed, so it travels along as well.
+    metadata = {DEADLINE_KEY: wall_clock_deadline(deadline)}
+    IN_FLIGHT.inc()
+    if request.stream:
+        # Partial replies are forwarded as they arrive. The admission slot is released when the stream
+        # ends, or by the background task when the client disconnects before the body was started.
+        try:
+            stream = pump.open_stream("v1/chat/completions", data, metadata, request_id=request_id)
+        except BaseException:
+            IN_FLIGHT.dec()
+            admission.release()
+            raise
+        finish = stream_finisher(stream, started_at, "miss" if key is not None else "off")
+        return StreamingResponse(stream_completion(request, request_id, stream, started_at, deadline, key, finish),
+                                 media_type="text/event-stream",
+                                 headers={"X-Cache": "MISS"} if key is not None else None,
+                                 background=BackgroundTask(finish))
 
+    stream = None
+    # The message is then sent to the next node in the dataflow system with the output label 'v1/chat/completions'.
+    # The pump thread performs the actual send and queues every reply of the request.
+    # The request id travels in the output metadata so the replies can be matched with this request.
+    try:
+        stream = pump.open_stream("v1/chat/completions", data, metadata, request_id=request_id)
+        print('发送完毕', request_id)
+        response_str = await collect_reply(stream, started_at, deadline)
+    except asyncio.TimeoutError:
+        REQUESTS.inc(status="timeout")
+        raise HTTPException(status_code=504, detail="No response received from the dataflow")
+    except RuntimeError as e:
+        REQUESTS.inc(status="unavailable")
+        raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        if stream is not None:
+            stream.close()
+        IN_FLIGHT.dec()
+        admission.release()
+
+    if response_str is None:
+        response_str = "No response received"
+    elif key is not None:
+        # Only complete replies get here, partial ones of a streaming agent were joined with the final one.
+        await response_cache.store(key, response_str)
+
+    REQUESTS.inc(status="ok")
+    REQUEST_LATENCY.observe(time.monotonic() - started_at, cache="miss" if key is not None else "off")
+    return build_completion_response(request, request_id, response_str)
+
+
+def build_completion_response(request: ChatCompletionRequest, request_id: str, response_str):
+    # Count prompt and completion tokens with the tokenizer of the requested model
+    usage = usage_block([msg.model_dump() for msg in request.messages], response_str, request.model)
+    TOKENS.inc(usage["prompt_tokens"], kind="prompt")
+    TOKENS.inc(usage["completion_tokens"], kind="completion")
     # Return the chat completion response with the processed response message and token usage statistics
     return ChatCompletionResponse(
-        id="chatcmpl-1234",  # Unique identifier for the completion response, sample value
+        id=f"chatcmpl-{request_id}",  # Unique identifier for the completion response
         object="chat.completion",  # Object type
-        created=1234567890,  # Timestamp of creation, sample value
+        created=int(time.time()),  # Timestamp of creation
         model=request.model,  # Model used for response
         choices=[
             {
@@ -126,14 +274,115 @@ async def create_chat_completion(request: ChatCompletionRequest):
             }
         ],
         # Provide token usage stats for the prompt and completion
-        usage={
-            "prompt_tokens": len(data),  # Number of tokens in the prompt
-            "completion_tokens": len(response_str),  # Number of tokens in the completion
-            "total_tokens": len(data) + len(response_str),  # Total number of tokens
-        },
+        usage=usage,
     )
 
 
+def completion_chunk(request: ChatCompletionRequest, request_id: str, created: int, delta: dict,
+                     finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> str:
+    chunk = {
+        "id": f"chatcmpl-{request_id}",
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": request.model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        chunk["usage"] = usage
+    return "data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n"
+
+
+def final_chunks(request: ChatCompletionRequest, request_id: str, created: int, completion: str) -> str:
+    """The closing frame with finish_reason and token usage, followed by [DONE]."""
+    usage = usage_block([msg.model_dump() for msg in request.messages], completion, request.model)
+    TOKENS.inc(usage["prompt_tokens"], kind="prompt")
+    TOKENS.inc(usage["completion_tokens"], kind="completion")
+    return completion_chunk(request, request_id, created, {}, "stop", usage) + "data: [DONE]\n\n"
+
+
+def stream_finisher(stream: ReplyStream, started_at: float, cache_label: str) -> Callable[..., None]:
+    """
+    The cleanup of a streaming request: closes the reply stream, releases the
+    admission slot and records the outcome. Only the first call has an
+    effect, so both the stream generator and the response's background task
+    can call it.
+    """
+    finished = False
+
+    def finish(status: str = "disconnected"):
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        stream.close()
+        IN_FLIGHT.dec()
+        admission.release()
+        REQUESTS.inc(status=status)
+        REQUEST_LATENCY.observe(time.monotonic() - started_at, cache=cache_label)
+
+    return finish
+
+
+async def stream_completion(request: ChatCompletionRequest, request_id: str, stream: ReplyStream,
+                            started_at: float, deadline: float, key: Optional[str],
+                            finish: Callable[..., None]) -> AsyncGenerator[str, None]:
+    """
+    Forward the replies of a streaming request as chat.completion.chunk events.
+    The first reply must arrive before the request deadline; after that, two
+    replies may be at most as far apart as the request timeout.
+    """
+    created = int(time.time())
+    idle_timeout = deadline - started_at
+    wait_until = deadline
+    contents = []
+    cache_label = "miss" if key is not None else "off"
+    status = "disconnected"
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(stream.queue.get(), timeout=max(0.0, wait_until - time.monotonic()))
+            except asyncio.TimeoutError:
+                status = "timeout"
+                yield "data: " + json.dumps({"error": {"message": "No response received from the dataflow",
+                                                        "type": "timeout"}}) + "\n\n"
+                return
+            if isinstance(item, Exception):
+                status = "unavailable"
+                yield "data: " + json.dumps({"error": {"message": str(item), "type": "unavailable"}}) + "\n\n"
+                return
+            result, final = item
+            content = reply_content(result)
+            if content:
+                delta = {"content": content}
+                if not contents:
+                    delta["role"] = "assistant"
+                    TIME_TO_FIRST_TOKEN.observe(time.monotonic() - started_at, cache=cache_label)
+                contents.append(content)
+                yield completion_chunk(request, request_id, created, delta)
+            if final:
+                break
+            wait_until = time.monotonic() + idle_timeout
+
+        completion = "".join(contents)
+        if key is not None:
+            await response_cache.store(key, completion)
+        yield final_chunks(request, request_id, created, completion)
+        status = "ok"
+    finally:
+        finish(status)
+
+
+async def stream_cached_completion(request: ChatCompletionRequest, request_id: str, cached: Any,
+                                   started_at: float) -> AsyncGenerator[str, None]:
+    created = int(time.time())
+    completion = reply_content(cached)
+    TIME_TO_FIRST_TOKEN.observe(time.monotonic() - started_at, cache="hit")
+    yield completion_chunk(request, request_id, created, {"role": "assistant", "content": completion})
+    yield final_chunks(request, request_id, created, completion)
+    REQUESTS.inc(status="ok")
+    REQUEST_LATENCY.observe(time.monotonic() - started_at, cache="hit")
+
+
 # List Models Endpoint: Provides a simple GET endpoint /v1/models that returns a static list of models (e.g., "gpt-3.5-turbo").
 @app.get("/v1/models")
 async def list_models():
@@ -148,9 +397,29 @@ async def list_models():
             }
         ],
     }
+
+
+# Cache Statistics Endpoint: Reports response cache hits and misses.
+@app.get("/v1/cache/stats")
+async def cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+
+# Metrics Endpoint: Latency histograms and counters in the Prometheus text exposition format.
+@app.get("/metrics")
+async def metrics_endpoint():
+    for priority, queued in admission.queued_by_class().items():
+        QUEUED.set(queued, priority=priority)
+    return Response(content=metrics.render(), media_type=metrics.content_type)
+
+
 @app.get("/v1/hello")
 async def hello():
     return "Hello World"
+
+
 # Starts the FastAPI server asynchronously using Uvicorn and also processes the events from the Dora node concurrently.
 async def run_fastapi():
     # Configure the Uvicorn server with host, port, and log level settings
@@ -159,23 +428,38 @@ async def run_fastapi():
     config = uvicorn.Config(app, host="0.0.0.0", port=os.getenv('SERVER_PROT',8005), log_level="info")
     server = uvicorn.Server(config)
 
-    # Start the Uvicorn server and run it asynchronously
-    server = asyncio.gather(server.serve())
-    # Keep checking for Dora node events while the server is running
-    while True:
-        # Sleep for 1 second between checks to avoid blocking the event loop
-        await asyncio.sleep(1)
-        # Called repeatedly to keep checking for any incoming events in the Dora dataflow system.
-        event = node.next(0.001)
-        # If a stop event is received, exit the loop and stop the server
-        if event["type"] == "STOP":
-            break
+    # The pump thread reads Dora events for the whole lifetime of the server and
+    # asks uvicorn to shut down once the dataflow sends a STOP event.
+    loop = asyncio.get_running_loop()
+    pump.start(on_stop=lambda: loop.call_soon_threadsafe(setattr, server, "should_exit", True))
+    try:
+        await server.serve()
+    finally:
+        pump.stop()
+
+
+# Runs HTTP_WORKERS uvicorn worker processes while this process owns the Dora node as their broker.
+def run_workers():
+    socket_path = DORA_BROKER_SOCKET or os.path.join(tempfile.mkdtemp(prefix="dora-openai-server-"), "broker.sock")
+    broker = DoraBroker(node, socket_path, reply_ids=("v1/chat/completions",), request_ttl=MAX_REQUEST_TIMEOUT)
+    # Once the dataflow sends STOP, SIGTERM makes the uvicorn supervisor shut down its workers.
+    broker.start(on_stop=lambda: os.kill(os.getpid(), signal.SIGTERM))
+    os.environ[BROKER_CONNECT_ENV] = socket_path
+    print(f"Dora broker listening on {socket_path} for {HTTP_WORKERS} HTTP workers")
+    try:
+        uvicorn.run("dora_openai_server.main:app", host="0.0.0.0", port=int(os.getenv('SERVER_PROT', 8005)),
+                    log_level="info", workers=HTTP_WORKERS)
+    finally:
+        broker.stop()
 
 
 # Starts the FastAPI server and runs the event loop to handle incoming requests and dataflow events.
 def main():
-    # Run the FastAPI server asynchronously
-    asyncio.run(run_fastapi())
+    if HTTP_WORKERS > 1:
+        run_workers()
+    else:
+        # Run the FastAPI server asynchronously
+        asyncio.run(run_fastapi())
 
 
 # If the script is run directly, start the FastAPI server and event loop
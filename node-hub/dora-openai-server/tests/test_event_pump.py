@@ -0,0 +1,101 @@
+import asyncio
+import json
+import queue
+import time
+
+import pyarrow as pa
+
+from dora_openai_server.event_pump import REQUEST_ID_KEY, DoraEventPump, collect_reply
+
+
+class Node:
+    """Answers every output with the given MofaAgent results, in order."""
+
+    def __init__(self, *results):
+        self.results = results
+        self.events = queue.Queue()
+
+    def send_output(self, output_id, data, metadata=None):
+        for result in self.results:
+            envelope = json.dumps({"node_results": result})
+            self.events.put({"type": "INPUT", "id": "v1/chat/completions", "value": pa.array([envelope]),
+                             "metadata": {REQUEST_ID_KEY: metadata[REQUEST_ID_KEY]}})
+
+    def next(self, timeout=None):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return {"type": "ERROR", "error": "timeout"}
+
+
+def complete(*results):
+    """The reply a non-streaming request gets when the agent sends `results`."""
+
+    async def scenario():
+        pump = DoraEventPump(Node(*results))
+        pump.start()
+        try:
+            stream = pump.open_stream("v1/chat/completions", pa.array(["question"]))
+            started_at = time.monotonic()
+            try:
+                return await collect_reply(stream, started_at, started_at + 5)
+            finally:
+                stream.close()
+        finally:
+            pump.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_dict_result_is_returned_as_the_agent_sent_it():
+    # MofaAgent json.dumps a dict result into node_results
+    sent = json.dumps({"answer": "DeepSeek", "sources": 3})
+    content = complete(sent)
+    assert isinstance(content, str)
+    assert content == sent
+
+
+def test_number_result_stays_text():
+    content = complete("42")
+    assert isinstance(content, str)
+    assert content == "42"
+
+
+def test_streaming_chunks_are_joined():
+    chunks = [json.dumps({"type": "content", "content": text, "end": end})
+              for text, end in (("Deep", None), ("Seek", None), ("!", "yes"))]
+    assert complete(*chunks) == "DeepSeek!"
+
+
+class FailingNode(Node):
+    """Fails to send the outputs whose data is "fail"."""
+
+    def send_output(self, output_id, data, metadata=None):
+        if data[0].as_py() == "fail":
+            raise RuntimeError("send failed")
+        super().send_output(output_id, data, metadata)
+
+
+def test_failed_send_only_fails_its_request():
+    async def scenario():
+        pump = DoraEventPump(FailingNode("answer"))
+        pump.start()
+        try:
+            failing = pump.open_stream("v1/chat/completions", pa.array(["fail"]))
+            working = pump.open_stream("v1/chat/completions", pa.array(["question"]))
+            started_at = time.monotonic()
+            try:
+                await collect_reply(failing, started_at, started_at + 5)
+            except RuntimeError as e:
+                error = e
+            reply = await collect_reply(working, started_at, started_at + 5)
+            working.close()
+            return error, reply, pump.in_flight
+        finally:
+            pump.stop()
+
+    error, reply, in_flight = asyncio.run(scenario())
+    assert "send failed" in str(error)
+    # The pump thread survived and answered the other request
+    assert reply == "answer"
+    assert in_flight == 0
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+DEFAULT_CLASS = "default"
+
+# Metadata key of the request deadline sent into the dataflow, in Unix milliseconds.
+DEADLINE_KEY = "deadline_ms"
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many requests, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Class weights written as `interactive=8,default=4,batch=1`; malformed entries are skipped."""
+    weights = {}
+    for item in (value or "").split(","):
+        name, _, weight = item.partition("=")
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            continue
+    return {name: weight for name, weight in weights.items() if name and weight > 0}
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests the dataflow works on at the same time.
+
+    Up to `max_in_flight` requests hold a slot; up to `max_queued` more wait
+    for one, and anything beyond that is rejected straight away so an
+    overloaded server answers quickly instead of piling up work. A value of
+    0 for `max_in_flight` disables the limit. Must be used from a single
+    event loop.
+
+    Waiting requests are queued per class (e.g. a priority or a tenant) and
+    freed slots go to the classes by weighted fair queuing: each request is
+    tagged with a virtual finish time of `max(virtual clock, previous tag of
+    its class) + 1 / weight`, and the waiting request with the smallest tag
+    goes next. A class of weight 4 thus gets four slots for every slot of a
+    class of weight 1 while both have requests waiting, and an idle class
+    does not bank credit. Within a class requests keep their arrival order.
+    Classes missing from `weights` count as `default_class`.
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queued: int = 32, retry_after: int = 5,
+                 weights: Optional[Dict[str, float]] = None, default_class: str = DEFAULT_CLASS):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.weights = dict(weights or {})
+        self.weights.setdefault(default_class, 1.0)
+        self.default_class = default_class
+        self.in_flight = 0
+        self._waiters = {name: deque() for name in self.weights}  # class -> (finish tag, future), oldest first
+        self._finish_tags = {name: 0.0 for name in self.weights}  # class -> tag of its latest request
+        self._virtual_time = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def queued_by_class(self) -> Dict[str, int]:
+        return {name: len(waiters) for name, waiters in self._waiters.items()}
+
+    def request_class(self, name: Optional[str]) -> str:
+        """The class a request asking for `name` is queued in."""
+        name = (name or "").strip()
+        return name if name in self.weights else self.default_class
+
+    async def acquire(self, deadline: float, request_class: Optional[str] = None) -> float:
+        """
+        Wait for a slot until the monotonic `deadline` and return the time
+        spent waiting. Raises `AdmissionRejected` when the queue is full and
+        `asyncio.TimeoutError` when the deadline passes while queued.
+        """
+        request_class = self.request_class(request_class)
+        tag = max(self._virtual_time, self._finish_tags[request_class]) + 1.0 / self.weights[request_class]
+        if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self.queued):
+            self._finish_tags[request_class] = self._virtual_time = tag
+            self.in_flight += 1
+            return 0.0
+        if self.queued >= self.max_queued:
+            raise AdmissionRejected(self.retry_after)
+        self._finish_tags[request_class] = tag
+        queued_at = time.monotonic()
+        entry = (tag, asyncio.get_running_loop().create_future())
+        waiters = self._waiters[request_class]
+        waiters.append(entry)
+        try:
+            await asyncio.wait_for(entry[1], timeout=max(0.0, deadline - queued_at))
+        except BaseException:
+            if entry[1].done() and not entry[1].cancelled():
+                # The slot was handed over just as the wait ended: pass it on.
+                self.release()
+            elif entry in waiters:
+                waiters.remove(entry)
+            raise
+        return time.monotonic() - queued_at
+
+    def release(self):
+        """Free a slot, handing it straight to the waiting request with the smallest finish tag."""
+        while True:
+            heads = [waiters for waiters in self._waiters.values() if waiters]
+            if not heads:
+                break
+            tag, waiter = min(heads, key=lambda waiters: waiters[0][0]).popleft()
+            if not waiter.done():
+                self._virtual_time = max(self._virtual_time, tag)
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+def request_deadline(started_at: float, requested_timeout: Optional[str], default_timeout: float,
+                     max_timeout: float) -> float:
+    """
+    Monotonic deadline of a request. Clients may ask for their own timeout
+    (e.g. through an `X-Request-Timeout` header), capped at `max_timeout`.
+    """
+    timeout = default_timeout
+    if requested_timeout:
+        try:
+            timeout = float(requested_timeout)
+        except ValueError:
+            pass
+    return started_at + min(max(timeout, 0.0), max_timeout)
+
+
+def wall_clock_deadline(deadline: float) -> int:
+    """The monotonic `deadline` as Unix milliseconds, which agents in other processes can compare with."""
+    return int((time.time() + deadline - time.monotonic()) * 1000)
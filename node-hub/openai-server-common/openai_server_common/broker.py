@@ -0,0 +1,275 @@
+import json
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import pyarrow as pa
+
+from openai_server_common.dataflow import REQUEST_ID_KEY, decode_reply, extract_request_id, is_partial, parse_result
+
+# Environment variable through which the broker process hands its socket to the HTTP workers.
+BROKER_CONNECT_ENV = "DORA_BROKER_CONNECT"
+
+_FRAME_HEADER = struct.Struct("!II")
+
+
+def encode_frame(header: dict, value=None) -> bytes:
+    """A JSON header and an optional Arrow array, written as one Arrow IPC stream."""
+    payload = b""
+    if value is not None:
+        if not isinstance(value, pa.Array):
+            value = pa.array(value)
+        batch = pa.RecordBatch.from_arrays([value], names=["value"])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        payload = sink.getvalue().to_pybytes()
+    raw_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return _FRAME_HEADER.pack(len(raw_header), len(payload)) + raw_header + payload
+
+
+def decode_frame(raw_header: bytes, payload: bytes):
+    header = json.loads(raw_header)
+    value = pa.ipc.open_stream(payload).read_next_batch().column(0) if payload else None
+    return header, value
+
+
+class FrameReader:
+    """Splits the bytes read from a connection into frames."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= _FRAME_HEADER.size:
+            header_size, payload_size = _FRAME_HEADER.unpack_from(self._buffer)
+            end = _FRAME_HEADER.size + header_size + payload_size
+            if len(self._buffer) < end:
+                break
+            raw = bytes(self._buffer[_FRAME_HEADER.size:end])
+            del self._buffer[:end]
+            frames.append(decode_frame(raw[:header_size], raw[header_size:]))
+        return frames
+
+
+class DoraBroker:
+    """
+    Owns the Dora node for several HTTP worker processes.
+
+    Workers connect to a Unix socket and use a `RemoteNode` in place of the
+    Dora `Node`. Their outputs are forwarded to the dataflow unchanged, and
+    every reply goes back to the worker that sent the request with the same
+    `request_id`. Replies without an id go to the worker of the oldest
+    request that has not received its final reply, and STOP goes to all
+    workers.
+
+    Like the routers in the workers, the broker only touches the node from
+    one thread: connections are read on a second thread and their outputs
+    are queued until the node thread sends them between two `node.next`
+    calls. Requests without a final reply are forgotten after
+    `request_ttl` seconds.
+    """
+
+    def __init__(self, node, socket_path: str, reply_ids=("v3/chat/completions",), poll_interval: float = 0.01,
+                 request_ttl: float = 600):
+        self.node = node
+        self.socket_path = socket_path
+        self.reply_ids = set(reply_ids)
+        self.poll_interval = poll_interval
+        self.request_ttl = request_ttl
+        self._outbox = queue.Queue()
+        self._owners = OrderedDict()  # request id -> [connection, last activity], oldest first
+        self._connections = {}  # connection -> FrameReader
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._threads = []
+        self._stopped = threading.Event()
+        self._on_stop = None
+
+    def start(self, on_stop: Optional[Callable[[], None]] = None):
+        """Listen on the socket and start the node and connection threads."""
+        self._on_stop = on_stop
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._threads = [threading.Thread(target=self._run_node, name="dora-broker-node", daemon=True),
+                         threading.Thread(target=self._run_connections, name="dora-broker-io", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    @property
+    def workers(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def _run_connections(self):
+        while not self._stopped.is_set():
+            for key, _ in self._selector.select(timeout=self.poll_interval):
+                if key.fileobj is self._listener:
+                    conn, _ = self._listener.accept()
+                    conn.setblocking(True)
+                    with self._lock:
+                        self._connections[conn] = FrameReader()
+                    self._selector.register(conn, selectors.EVENT_READ)
+                    continue
+                conn = key.fileobj
+                try:
+                    data = conn.recv(65536)
+                except OSError:
+                    data = b""
+                if not data:
+                    self._drop(conn)
+                    continue
+                for header, value in self._connections[conn].feed(data):
+                    self._outbox.put((conn, header, value))
+        self._selector.close()
+        self._listener.close()
+
+    def _drop(self, conn):
+        self._selector.unregister(conn)
+        with self._lock:
+            self._connections.pop(conn, None)
+            for request_id in [r for r, (owner, _) in self._owners.items() if owner is conn]:
+                del self._owners[request_id]
+        conn.close()
+
+    def _flush_outbox(self):
+        while True:
+            try:
+                conn, header, value = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            metadata = header.get("metadata")
+            request_id = (metadata or {}).get(REQUEST_ID_KEY)
+            if request_id:
+                with self._lock:
+                    self._owners[str(request_id)] = [conn, time.monotonic()]
+            try:
+                if metadata:
+                    self.node.send_output(header["id"], value, metadata)
+                else:
+                    self.node.send_output(header["id"], value)
+            except Exception as e:
+                # Only this request fails; its worker times it out.
+                print("Could not send output to the dataflow:", header["id"], e)
+                if request_id:
+                    with self._lock:
+                        self._owners.pop(str(request_id), None)
+
+    def _run_node(self):
+        try:
+            while not self._stopped.is_set():
+                self._flush_outbox()
+                event = self.node.next(timeout=self.poll_interval)
+                if event is None or event["type"] == "STOP":
+                    break
+                if event["type"] == "INPUT" and event["id"] in self.reply_ids:
+                    self._dispatch(event)
+                else:
+                    # ERROR events are timeouts of `node.next`.
+                    self._prune()
+        finally:
+            self._stopped.set()
+            with self._lock:
+                connections = list(self._connections)
+            for conn in connections:
+                self._send(conn, encode_frame({"type": "STOP"}))
+            if self._on_stop is not None:
+                self._on_stop()
+
+    def _dispatch(self, event):
+        result = parse_result(decode_reply(event))
+        request_id = extract_request_id(event, result)
+        with self._lock:
+            if request_id is None:
+                # Agents that drop the metadata answer requests in the order they were sent.
+                request_id = next(iter(self._owners), None)
+            owner = self._owners.get(request_id)
+            if owner is None:
+                print("Dropping dataflow reply without a waiting worker:", event["id"], request_id)
+                return
+            owner[1] = time.monotonic()
+            if not is_partial(result):
+                del self._owners[request_id]
+        header = {"type": "INPUT", "id": event["id"], "metadata": event.get("metadata") or {}}
+        self._send(owner[0], encode_frame(header, event["value"]))
+
+    def _send(self, conn, frame: bytes):
+        try:
+            conn.sendall(frame)
+        except OSError:
+            # The worker is gone; the connection thread drops it.
+            pass
+
+    def _prune(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [r for r, (_, last) in self._owners.items() if now - last > self.request_ttl]
+            for request_id in expired:
+                del self._owners[request_id]
+
+
+class RemoteNode:
+    """
+    Stands in for the Dora `Node` in an HTTP worker process: `send_output`
+    and `next` go through the broker that owns the real node. Like `Node`,
+    it is meant to be used from a single thread.
+    """
+
+    def __init__(self, socket_path: str):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._events = queue.Queue()
+        self._closed = False
+        threading.Thread(target=self._read, name="dora-broker-client", daemon=True).start()
+
+    def send_output(self, output_id: str, data, metadata: Optional[dict] = None):
+        self._sock.sendall(encode_frame({"id": output_id, "metadata": metadata or {}}, data))
+
+    def next(self, timeout: Optional[float] = None):
+        """The next event, an ERROR event on timeout, None once the broker is gone."""
+        if self._closed and self._events.empty():
+            return None
+        try:
+            event = self._events.get(timeout=timeout)
+        except queue.Empty:
+            return {"type": "ERROR", "error": "timeout"}
+        if event is None:
+            self._closed = True
+        return event
+
+    def _read(self):
+        reader = FrameReader()
+        try:
+            while True:
+                data = self._sock.recv(65536)
+                if not data:
+                    break
+                for header, value in reader.feed(data):
+                    self._events.put(dict(header, value=value))
+        except OSError:
+            pass
+        finally:
+            self._events.put(None)
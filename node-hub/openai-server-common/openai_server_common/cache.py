@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+
+def cache_key(model: str, messages: List[dict], temperature: Optional[float], max_tokens: Optional[int]) -> str:
+    """
+    Content address of a chat completion request. Messages are reduced to
+    role and stripped content and the JSON is dumped with sorted keys, so
+    requests that only differ in formatting share one entry.
+    """
+    normalized = {
+        "model": model.strip().lower(),
+        "messages": [{"role": m["role"].strip().lower(), "content": m["content"].strip()} for m in messages],
+        "temperature": None if temperature is None else round(float(temperature), 3),
+        "max_tokens": max_tokens,
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU with TTL in front of an
+    optional directory of JSON files, which survives restarts and can be
+    shared by several server processes.
+
+    The directory holds at most `disk_max_entries` files and
+    `disk_max_bytes` bytes (0 for no limit). Hits refresh the modification
+    time of their file, and once a limit is passed the least recently used
+    files are removed until the directory is back under 90% of it.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, disk_dir: Optional[str] = None,
+                 disk_max_entries: int = 10000, disk_max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        # Estimated size of the directory, recounted on every prune since other processes write to it too
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_prune()
+
+    async def lookup(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        if value is None and self.disk_dir:
+            entry = await asyncio.to_thread(self._disk_get, key)
+            if entry is not None:
+                expires_at, value = entry
+                self._memory_set(key, value, expires_at)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    async def store(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_entries,
+            }
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _disk_get(self, key: str):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # the file was used, keep it over older ones
+        except OSError:
+            pass
+        return entry["expires_at"], entry["value"]
+
+    def _disk_set(self, key: str, value: Any, expires_at: float):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            # Readers in other processes only ever see complete files.
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print("Could not write response cache entry:", e)
+            return
+        with self._lock:
+            self._disk_entries += 1
+            self._disk_bytes += size
+            over = self._disk_over(self._disk_entries, self._disk_bytes, 1.0)
+        if over:
+            self._disk_prune()
+
+    def _disk_over(self, entries: int, size: int, fraction: float) -> bool:
+        return ((self.disk_max_entries > 0 and entries > self.disk_max_entries * fraction)
+                or (self.disk_max_bytes > 0 and size > self.disk_max_bytes * fraction))
+
+    def _disk_prune(self):
+        """Count the files of the directory and remove the least recently used ones beyond the limits."""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed by another process meanwhile
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        entries, size = len(files), sum(f[1] for f in files)
+        if self._disk_over(entries, size, 1.0):
+            files.sort()
+            for _, file_size, path in files:
+                if not self._disk_over(entries, size, 0.9):
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                entries -= 1
+                size -= file_size
+        with self._lock:
+            self._disk_entries = entries
+            self._disk_bytes = size
@@ -0,0 +1,154 @@
+import json
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+# Metadata key that correlates an output with the replies to it.
+REQUEST_ID_KEY = "request_id"
+
+
+def decode_reply(event) -> Any:
+    """Unwrap the MofaAgent envelope of a reply: its result, as the agent sent it, is in 'node_results'."""
+    value = event["value"][0].as_py() if event["value"] else None
+    try:
+        return json.loads(value)["node_results"]
+    except Exception:
+        return value
+
+
+def parse_result(result, loads: Callable[[Any], Any] = json.loads) -> Any:
+    """The JSON value a result encodes; results that are not JSON text are returned unchanged."""
+    if isinstance(result, (str, bytes)):
+        try:
+            return loads(result)
+        except ValueError:
+            return result
+    return result
+
+
+def stream_chunk(result, loads: Callable[[Any], Any] = json.loads) -> Optional[dict]:
+    """
+    The streaming chunk a reply carries: a dict with 'type' and 'content',
+    like the ones deep-search emits, usually JSON-encoded in 'node_results'.
+    None for any other reply.
+    """
+    result = parse_result(result, loads)
+    if isinstance(result, dict) and "type" in result and "content" in result:
+        return result
+    return None
+
+
+def is_partial(result) -> bool:
+    """A partial reply is a streaming chunk without the 'end' marker. Any other reply completes its request."""
+    return isinstance(result, dict) and "type" in result and "content" in result and result.get("end") is None
+
+
+def extract_request_id(event, result=None) -> Optional[str]:
+    """
+    The request id of a reply. MofaAgent forwards the metadata of the input
+    it answers, so the id is normally in the event metadata; agents may also
+    echo it in their decoded `result`.
+    """
+    request_id = (event.get("metadata") or {}).get(REQUEST_ID_KEY)
+    if not request_id and isinstance(result, dict):
+        request_id = result.get(REQUEST_ID_KEY)
+    return str(request_id) if request_id else None
+
+
+class DoraNodeThread:
+    """
+    Owns the Dora node on a single background thread.
+
+    The Dora `Node` must not be used from several threads at once, so every
+    `send_output` is queued with `_enqueue` and performed by the node thread
+    between two `node.next` calls. Subclasses decide what happens with the
+    replies:
+
+    - `_dispatch(event)` receives the INPUT events listed in `reply_ids`,
+    - `_idle()` runs whenever `node.next` timed out or brought another event,
+    - `_sent(metadata, target)` and `_send_failed(metadata, target, error)`
+      follow every queued output, `target` being what was queued with it,
+    - `_close()` runs once the dataflow stopped or the thread was stopped.
+
+    A failed `send_output` only fails the output that caused it; the thread
+    keeps serving the other requests.
+    """
+
+    thread_name = "dora-node"
+
+    def __init__(self, node, reply_ids, poll_interval: float = 0.01):
+        self.node = node
+        self.reply_ids = set(reply_ids)
+        self.poll_interval = poll_interval
+        self._outbox = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._on_stop = None
+
+    def start(self, on_stop: Optional[Callable[[], None]] = None):
+        """Start the node thread. `on_stop` is called once the dataflow sends STOP."""
+        self._on_stop = on_stop
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def _enqueue(self, output_id: str, data, metadata: Optional[dict] = None, target=None):
+        self._outbox.put((output_id, data, metadata, target))
+
+    def _flush_outbox(self):
+        while True:
+            try:
+                output_id, data, metadata, target = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if metadata:
+                    self.node.send_output(output_id, data, metadata)
+                else:
+                    self.node.send_output(output_id, data)
+            except Exception as e:
+                print("Could not send output to the dataflow:", output_id, e)
+                self._send_failed(metadata, target, e)
+                continue
+            self._sent(metadata, target)
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self._flush_outbox()
+                event = self.node.next(timeout=self.poll_interval)
+                if event is None:
+                    # The event stream is closed, nothing will ever arrive again.
+                    break
+                if event["type"] == "STOP":
+                    break
+                if event["type"] == "INPUT" and event["id"] in self.reply_ids:
+                    self._dispatch(event)
+                else:
+                    # ERROR events are timeouts of `node.next`.
+                    self._idle()
+        finally:
+            self._stopped.set()
+            self._close()
+            if self._on_stop is not None:
+                self._on_stop()
+
+    def _dispatch(self, event):
+        raise NotImplementedError
+
+    def _idle(self):
+        pass
+
+    def _sent(self, metadata: Optional[dict], target):
+        pass
+
+    def _send_failed(self, metadata: Optional[dict], target, error: Exception):
+        pass
+
+    def _close(self):
+        pass
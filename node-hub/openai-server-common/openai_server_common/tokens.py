@@ -0,0 +1,82 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, List
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, fall back to an approximation
+    tiktoken = None
+
+# Words, numbers and single punctuation marks; CJK characters count one token each.
+_APPROXIMATE_TOKEN = re.compile(r"[\u3400-\u9fff]|[A-Za-z]+|\d+|[^\sA-Za-z\d\u3400-\u9fff]")
+
+# Tokens OpenAI adds around every chat message.
+TOKENS_PER_MESSAGE = 3
+
+# Marks where a text was cut by `truncate_tokens`.
+TRUNCATION_MARK = " …"
+
+
+@lru_cache(maxsize=32)
+def get_encoding(model: str):
+    """Load the tiktoken encoding of `model` once; unknown models use cl100k_base."""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. the BPE file cannot be downloaded on an offline host
+        print("Falling back to approximate token counts:", e)
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_text_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Tokens of `text`; cached, since the same snippets and outputs are often counted several times."""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(_APPROXIMATE_TOKEN.findall(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: Any, model: str = "gpt-4o") -> int:
+    """Tokens of `text`; anything but a string is counted as its JSON."""
+    if text is None:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False)
+    return count_text_tokens(text, model)
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """The start of `text` that fits in `max_tokens`, marked when something was cut."""
+    if count_text_tokens(text, model) <= max_tokens:
+        return text
+    keep = max_tokens - count_text_tokens(TRUNCATION_MARK, model)
+    if keep <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        matches = list(_APPROXIMATE_TOKEN.finditer(text))
+        return text[:matches[keep - 1].end()] + TRUNCATION_MARK
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARK
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-4o") -> int:
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"], model) for m in messages) + TOKENS_PER_MESSAGE
+
+
+def usage_block(messages: List[dict], completion: Any, model: str = "gpt-4o") -> dict:
+    prompt_tokens = count_message_tokens(messages, model)
+    completion_tokens = count_tokens(completion, model)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
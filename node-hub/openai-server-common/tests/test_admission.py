@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from openai_server_common.admission import AdmissionController, AdmissionRejected, parse_weights
+
+
+async def settle():
+    """Let queued tasks and handed-over slots run."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def queue_request(admission, admitted, label, request_class=None, timeout=5.0):
+    """Start a request that records `label` in `admitted` once it holds a slot."""
+
+    async def request():
+        await admission.acquire(time.monotonic() + timeout, request_class)
+        admitted.append(label)
+
+    task = asyncio.create_task(request())
+    await settle()
+    return task
+
+
+def test_requests_beyond_the_queue_are_rejected_with_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queued=1, retry_after=7)
+        admitted = []
+        assert await admission.acquire(time.monotonic() + 5) == 0.0
+        waiting = await queue_request(admission, admitted, "queued")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire(time.monotonic() + 5)
+        # A rejected request neither waits nor takes a slot
+        assert admission.in_flight == 1 and admission.queued == 1
+        admission.release()
+        await waiting
+        return rejected.value, admitted, admission
+
+    rejected, admitted, admission = asyncio.run(scenario())
+    assert rejected.retry_after == 7
+    assert "retry after 7s" in str(rejected)
+    # The slot went straight to the queued request
+    assert admitted == ["queued"]
+    assert admission.in_flight == 1 and admission.queued == 0
+
+
+def test_queued_request_times_out_and_leaves_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queued=4)
+        await admission.acquire(time.monotonic() + 5)
+        with pytest.raises(asyncio.TimeoutError):
+            await admission.acquire(time.monotonic() + 0.02)
+        assert admission.queued == 0
+        admission.release()
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.in_flight == 0
+
+
+def test_no_limit_admits_everything():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=0, max_queued=0)
+        for _ in range(10):
+            assert await admission.acquire(time.monotonic() + 1) == 0.0
+        return admission
+
+    assert asyncio.run(scenario()).queued == 0
+
+
+def test_parse_weights_skips_malformed_entries():
+    assert parse_weights("interactive=8, default=4,batch=1") == {"interactive": 8.0, "default": 4.0, "batch": 1.0}
+    assert parse_weights("a=x,b=0,=3,c=-1,d=2") == {"d": 2.0}
+    assert parse_weights("") == {}
+
+
+def test_unknown_classes_use_the_default_class():
+    admission = AdmissionController(weights={"interactive": 4}, default_class="default")
+    assert admission.request_class(" interactive ") == "interactive"
+    assert admission.request_class("vip") == "default"
+    assert admission.request_class(None) == "default"
+    assert admission.queued_by_class() == {"interactive": 0, "default": 0}
+
+
+def test_freed_slots_follow_the_class_weights():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queued=16, weights={"a": 4, "b": 1})
+        admitted = []
+        await admission.acquire(time.monotonic() + 5)
+        tasks = [await queue_request(admission, admitted, f"b{i}", "b") for i in range(4)]
+        tasks += [await queue_request(admission, admitted, f"a{i}", "a") for i in range(4)]
+        assert admission.queued_by_class() == {"a": 4, "b": 4, "default": 0}
+        for _ in tasks:
+            admission.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        return admitted
+
+    admitted = asyncio.run(scenario())
+    # Class a gets four slots for every slot of class b, although b queued first
+    assert sorted(admitted[:5]) == ["a0", "a1", "a2", "a3", "b0"]
+    # Within a class requests keep their arrival order
+    assert [label for label in admitted if label.startswith("b")] == ["b0", "b1", "b2", "b3"]
+
+
+def test_idle_class_does_not_bank_credit():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queued=16, weights={"a": 1, "b": 1})
+        admitted = []
+        # b runs alone for a while, a is idle
+        for _ in range(5):
+            await admission.acquire(time.monotonic() + 5, "b")
+            admission.release()
+        await admission.acquire(time.monotonic() + 5, "b")
+        tasks = [await queue_request(admission, admitted, f"b{i}", "b") for i in range(2)]
+        tasks += [await queue_request(admission, admitted, f"a{i}", "a") for i in range(2)]
+        for _ in tasks:
+            admission.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        return admitted
+
+    admitted = asyncio.run(scenario())
+    # Equal weights alternate: a does not catch up on the slots b used while a was idle
+    assert sorted(admitted[:2]) == ["a0", "b0"]
+    assert sorted(admitted[2:]) == ["a1", "b1"]
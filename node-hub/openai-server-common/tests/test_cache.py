@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+
+from openai_server_common.cache import ResponseCache, cache_key
+
+
+def test_cache_key_ignores_formatting():
+    a = cache_key("GPT-4o", [{"role": "user", "content": " hello "}], 1.0, 100)
+    b = cache_key("gpt-4o", [{"role": "User", "content": "hello"}], 1.0000001, 100)
+    assert a == b
+    assert a != cache_key("gpt-4o", [{"role": "user", "content": "hello"}], 1.0, 200)
+
+
+def test_memory_hit_miss_and_ttl():
+    async def scenario():
+        cache = ResponseCache(max_entries=2, ttl=0.05)
+        assert await cache.lookup("a") is None
+        await cache.store("a", "answer")
+        assert await cache.lookup("a") == "answer"
+        await asyncio.sleep(0.1)
+        assert await cache.lookup("a") is None
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_memory_tier_is_lru():
+    async def scenario():
+        cache = ResponseCache(max_entries=2)
+        await cache.store("a", 1)
+        await cache.store("b", 2)
+        await cache.lookup("a")
+        await cache.store("c", 3)
+        return [await cache.lookup(key) for key in "abc"]
+
+    assert asyncio.run(scenario()) == [1, None, 3]
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    asyncio.run(ResponseCache(disk_dir=str(tmp_path)).store("a", {"content": "answer"}))
+    assert asyncio.run(ResponseCache(disk_dir=str(tmp_path)).lookup("a")) == {"content": "answer"}
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    async def scenario():
+        cache = ResponseCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=10)
+        for i in range(10):
+            await cache.store(f"k{i}", "x" * 100)
+            os.utime(tmp_path / f"k{i}.json", (time.time() - 100 + i, time.time() - 100 + i))
+        await cache.lookup("k0")  # a disk hit makes k0 the most recently used file
+        await cache.store("k10", "x" * 100)
+        return cache
+
+    cache = asyncio.run(scenario())
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert len(names) <= 9
+    assert "k0.json" in names and "k10.json" in names and "k1.json" not in names
+    assert cache.stats()["disk_entries"] == len(names)
+
+
+def test_disk_tier_size_limit(tmp_path):
+    async def scenario():
+        cache = ResponseCache(disk_dir=str(tmp_path), disk_max_entries=0, disk_max_bytes=2000)
+        for i in range(20):
+            await cache.store(f"k{i}", "x" * 200)
+
+    asyncio.run(scenario())
+    assert sum(p.stat().st_size for p in tmp_path.iterdir()) <= 2000
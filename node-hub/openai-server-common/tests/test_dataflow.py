@@ -0,0 +1,33 @@
+import json
+
+import pyarrow as pa
+
+from openai_server_common.dataflow import (REQUEST_ID_KEY, decode_reply, extract_request_id, is_partial,
+                                           stream_chunk)
+
+
+def reply(node_results, **metadata):
+    return {"type": "INPUT", "id": "v3/chat/completions", "metadata": metadata,
+            "value": pa.array([json.dumps({"node_results": node_results})])}
+
+
+def test_decode_reply_keeps_the_result_as_sent():
+    assert decode_reply(reply("42")) == "42"
+    assert decode_reply(reply('{"answer": 1}')) == '{"answer": 1}'
+    assert decode_reply({"value": pa.array(["not an envelope"])}) == "not an envelope"
+
+
+def test_stream_chunk_and_is_partial():
+    chunk = {"type": "content", "content": "a"}
+    assert stream_chunk(json.dumps(chunk)) == chunk
+    assert stream_chunk(chunk) == chunk
+    assert stream_chunk("42") is None and stream_chunk('{"answer": 1}') is None and stream_chunk("text") is None
+    assert is_partial(chunk)
+    assert not is_partial(dict(chunk, end="yes"))
+    assert not is_partial("42")
+
+
+def test_extract_request_id_from_metadata_or_result():
+    assert extract_request_id(reply("x", **{REQUEST_ID_KEY: "a"})) == "a"
+    assert extract_request_id(reply("x"), {REQUEST_ID_KEY: 7}) == "7"
+    assert extract_request_id(reply("x"), "42") is None
@@ -0,0 +1,137 @@
+"""
+Drives concurrent SSE clients against openai-server-stream and reports time
+to first frame, end-to-end latency percentiles and frame rates.
+
+    python -m openai_server_stream.local_server        # server with the mock dataflow
+    python -m openai_server_stream.benchmark --clients 32 --requests 256
+
+Needs the `benchmark` extra (httpx).
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+try:
+    import httpx
+except ImportError:  # httpx is optional, only the benchmark needs it
+    httpx = None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, `q` between 0 and 100."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class StreamResult:
+    def __init__(self):
+        self.status = None
+        self.first_frame = None  # seconds from sending the request to the first frame
+        self.latency = None  # seconds from sending the request to the end of the stream
+        self.frames = 0
+        self.bytes = 0
+        self.error = None
+
+
+async def run_stream(client, url: str, body: dict, headers: dict) -> StreamResult:
+    result = StreamResult()
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", url, json=body, headers=headers) as response:
+            result.status = response.status_code
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                if result.first_frame is None:
+                    result.first_frame = time.perf_counter() - started
+                result.frames += 1
+                result.bytes += len(line)
+    except Exception as e:
+        result.error = repr(e)
+    result.latency = time.perf_counter() - started
+    return result
+
+
+async def benchmark(url: str, clients: int, requests: int, model: str, prompt: str, distinct: bool,
+                    headers: dict, timeout: float) -> dict:
+    results = []
+    counter = iter(range(requests))
+
+    async def client_loop(client):
+        for i in counter:
+            content = f"{prompt} #{i}" if distinct else prompt
+            body = {"model": model, "messages": [{"role": "user", "content": content}]}
+            results.append(await run_stream(client, url, body, headers))
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return summarize(results, elapsed, clients)
+
+
+def summarize(results: List[StreamResult], elapsed: float, clients: int) -> dict:
+    ok = [r for r in results if r.error is None and r.status == 200]
+    first_frames = [r.first_frame for r in ok if r.first_frame is not None]
+    latencies = [r.latency for r in ok]
+    rates = [r.frames / r.latency for r in ok if r.latency]
+    frames = sum(r.frames for r in ok)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "clients": clients,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "status_codes": {str(code): sum(1 for r in results if r.status == code)
+                         for code in sorted({r.status for r in results}, key=str)},
+        "elapsed_s": round(elapsed, 3),
+        "ttft_ms": {"p50": ms(percentile(first_frames, 50)), "p99": ms(percentile(first_frames, 99))},
+        "latency_ms": {"p50": ms(percentile(latencies, 50)), "p99": ms(percentile(latencies, 99))},
+        "frames": frames,
+        "frames_per_s": round(frames / elapsed, 1) if elapsed else None,
+        "stream_frames_per_s": {"p50": round(percentile(rates, 50), 1) if rates else None},
+        "bytes": sum(r.bytes for r in ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/v3/chat/completions")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent SSE clients")
+    parser.add_argument("--requests", type=int, default=64, help="requests in total")
+    parser.add_argument("--model", default="deep-search")
+    parser.add_argument("--prompt", default="What is DeepSeek?")
+    parser.add_argument("--same-prompt", action="store_true",
+                        help="send the same prompt every time, so single-flight and the cache can kick in")
+    parser.add_argument("--header", action="append", default=[], metavar="NAME:VALUE",
+                        help="extra request header, e.g. X-Priority:batch")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if httpx is None:
+        parser.error("the benchmark needs httpx: pip install -e .[benchmark]")
+    headers = dict(h.split(":", 1) for h in args.header)
+    report = asyncio.run(benchmark(args.url, args.clients, args.requests, args.model, args.prompt,
+                                   not args.same_prompt, headers, args.timeout))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['ok']}/{report['requests']} streams ok with {report['clients']} clients "
+          f"in {report['elapsed_s']} s, status codes {report['status_codes']}")
+    print(f"time to first frame  p50 {report['ttft_ms']['p50']} ms  p99 {report['ttft_ms']['p99']} ms")
+    print(f"end-to-end latency   p50 {report['latency_ms']['p50']} ms  p99 {report['latency_ms']['p99']} ms")
+    print(f"frames               {report['frames']} total, {report['frames_per_s']} /s, "
+          f"{report['stream_frames_per_s']['p50']} /s per stream (p50)")
+
+
+if __name__ == "__main__":
+    main()
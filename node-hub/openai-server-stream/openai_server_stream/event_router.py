@@ -0,0 +1,186 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from openai_server_common.dataflow import REQUEST_ID_KEY, DoraNodeThread, decode_reply, extract_request_id
+
+from openai_server_stream.sse import loads
+
+
+def decode_chunk(event) -> dict:
+    """The chunk of a reply event: the JSON string in the 'node_results' of its MofaAgent envelope."""
+    chunk = decode_reply(event)
+    if isinstance(chunk, str):
+        chunk = loads(chunk)
+    if not isinstance(chunk, dict):
+        raise ValueError(f"expected a JSON object, got {type(chunk).__name__}")
+    return chunk
+
+
+class StreamSubscription:
+    """One SSE client waiting for the chunks of its dataflow run."""
+
+    def __init__(self, key: str, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.key = key
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.finished = False  # the dataflow sent the final chunk of this run
+        self.closed = False  # no more chunks will be queued
+        self.abandoned = False  # the client is gone, remaining chunks are dropped
+        self.overflowed = False  # the client was too slow and lost chunks
+        self.error = None  # why the request could not be sent into the dataflow
+        self.created_at = time.monotonic()
+        self.sent_at = None  # when the router thread sent the request into the dataflow
+        self.last_event_at = self.created_at
+
+
+class DoraEventRouter(DoraNodeThread):
+    """
+    Reads Dora events on a background thread and demultiplexes them into
+    bounded per-stream `asyncio.Queue`s.
+
+    The Dora `Node` is only ever touched by the router thread (see
+    `DoraNodeThread`). Chunks are decoded on the router thread as well, so
+    the event loop only has to encode SSE frames.
+
+    Every output carries a `request_id` in its metadata and chunks are routed
+    by that id. Chunks without one fall back to the oldest unfinished stream.
+
+    `observe_queue_wait` is an optional callback that receives, in seconds,
+    how long an output waited for the router thread before it was sent.
+    """
+
+    thread_name = "dora-event-router"
+
+    def __init__(self, node, reply_ids=("v3/chat/completions",), queue_size: int = 256,
+                 poll_interval: float = 0.01, abandon_timeout: float = 180,
+                 observe_queue_wait: Optional[Callable[[float], None]] = None):
+        super().__init__(node, reply_ids, poll_interval)
+        self.queue_size = queue_size
+        self.abandon_timeout = abandon_timeout
+        self.observe_queue_wait = observe_queue_wait
+        self._streams = OrderedDict()  # request id -> StreamSubscription, oldest first
+
+    @property
+    def active_streams(self) -> int:
+        with self._lock:
+            return sum(1 for sub in self._streams.values() if not sub.abandoned)
+
+    def open_stream(self, output_id: str, data, metadata: Optional[dict] = None,
+                    request_id: Optional[str] = None) -> StreamSubscription:
+        """
+        Queue `data` for `node.send_output` and return the subscription that
+        will receive the decoded reply chunks. Must be called from the event loop.
+        """
+        sub = StreamSubscription(request_id or uuid.uuid4().hex, asyncio.get_running_loop(), self.queue_size)
+        if self._stopped.is_set():
+            sub.closed = True
+            sub.queue.put_nowait(None)
+            return sub
+        with self._lock:
+            self._streams[sub.key] = sub
+        metadata = dict(metadata or {}, **{REQUEST_ID_KEY: sub.key})
+        self._enqueue(output_id, data, metadata, sub)
+        return sub
+
+    def send(self, output_id: str, data, metadata: Optional[dict] = None):
+        """Queue an output that expects no reply, e.g. the cancellation of a request."""
+        if not self._stopped.is_set():
+            self._enqueue(output_id, data, metadata)
+
+    def close_stream(self, sub: StreamSubscription):
+        """
+        Release a subscription once its consumer is done. An unfinished run
+        keeps its slot so its remaining chunks are not handed to another stream.
+        """
+        sub.abandoned = True
+        if sub.finished or sub.closed:
+            with self._lock:
+                self._streams.pop(sub.key, None)
+
+    def _sent(self, metadata: Optional[dict], sub: Optional[StreamSubscription]):
+        if sub is None:
+            return
+        sub.sent_at = time.monotonic()
+        if self.observe_queue_wait is not None:
+            self.observe_queue_wait(sub.sent_at - sub.created_at)
+
+    def _send_failed(self, metadata: Optional[dict], sub: Optional[StreamSubscription], error: Exception):
+        if sub is None:
+            return
+        with self._lock:
+            self._streams.pop(sub.key, None)
+        sub.error = error
+        if not sub.loop.is_closed():
+            sub.loop.call_soon_threadsafe(_close, sub)
+
+    def _dispatch(self, event):
+        try:
+            chunk = decode_chunk(event)
+        except Exception as e:
+            print("Dropping undecodable dataflow chunk:", e)
+            return
+        with self._lock:
+            sub = self._route(event, chunk)
+            if sub is None:
+                # The stream already ended, e.g. it was abandoned and expired.
+                print("Dropping dataflow chunk without a waiting stream:", event["id"])
+                return
+            sub.last_event_at = time.monotonic()
+            if chunk.get("end", None) is not None:
+                sub.finished = True
+                if sub.abandoned:
+                    self._streams.pop(sub.key, None)
+        if not sub.abandoned:
+            sub.loop.call_soon_threadsafe(self._offer, sub, chunk)
+
+    def _route(self, event, chunk) -> Optional[StreamSubscription]:
+        request_id = extract_request_id(event, chunk)
+        if request_id is not None:
+            return self._streams.get(request_id)
+        # Agents that drop the metadata answer one query after the other,
+        # so the chunk belongs to the oldest run that has not finished yet.
+        for sub in self._streams.values():
+            if not sub.finished:
+                return sub
+        return None
+
+    def _offer(self, sub: StreamSubscription, chunk):
+        # Runs on the event loop of the subscription.
+        if sub.abandoned or sub.closed:
+            return
+        try:
+            sub.queue.put_nowait(chunk)
+        except asyncio.QueueFull:
+            # Never block the router for a slow client: drop the client instead.
+            sub.overflowed = True
+            self.close_stream(sub)
+
+    def _idle(self):
+        self._prune_abandoned()
+
+    def _prune_abandoned(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, sub in self._streams.items()
+                       if sub.abandoned and now - sub.last_event_at > self.abandon_timeout]
+            for key in expired:
+                del self._streams[key]
+
+    def _close(self):
+        with self._lock:
+            subs = list(self._streams.values())
+            self._streams.clear()
+        for sub in subs:
+            if not sub.loop.is_closed():
+                sub.loop.call_soon_threadsafe(_close, sub)
+
+
+def _close(sub: StreamSubscription):
+    sub.closed = True
+    try:
+        sub.queue.put_nowait(None)
+    except asyncio.QueueFull:
+        pass
@@ -153,15 +153,17 @@
 #     asyncio.run(run_fastapi())
 
 
-import json
 import time
 import uuid
 import os
 import asyncio
+import signal
+import tempfile
 from typing import AsyncGenerator
 import traceback
+from contextlib import asynccontextmanager
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
@@ -171,11 +173,122 @@ from typing import List, Optional
 
 from dora import Node  # Dora 节点，用于节点间通信
 
+from openai_server_common.admission import (DEADLINE_KEY, AdmissionController, AdmissionRejected, parse_weights,
+                                           request_deadline, wall_clock_deadline)
+from openai_server_common.broker import BROKER_CONNECT_ENV, DoraBroker, RemoteNode
+from openai_server_common.cache import ResponseCache, cache_key
+from openai_server_common.dataflow import REQUEST_ID_KEY
+from openai_server_common.metrics import MetricsRegistry
+from openai_server_common.tokens import usage_block
+
+from openai_server_stream.event_router import DoraEventRouter, StreamSubscription
+from openai_server_stream.mock_dataflow import MockDataflowNode
+from openai_server_stream.resumable import SEQ_KEY, ReplayUnavailable, StreamRegistry, StreamRun, parse_event_id
+from openai_server_stream.sse import ARTICLES_TYPE, JSON_BACKEND, DeltaCoalescer, SSEEncoder, collect_articles
+
 # 加载环境变量
 load_dotenv('.env.secret')
-DORA_RESPONSE_TIMEOUT = 180  # 等待节点响应的超时时间
+# 请求的默认截止时间（秒），覆盖排队和等待首个数据块；之后作为两个数据块之间允许的最长间隔。
+# 客户端可以通过 X-Request-Timeout 请求头指定自己的超时时间，最大为 MAX_REQUEST_TIMEOUT。
+DORA_RESPONSE_TIMEOUT = float(os.getenv('DORA_RESPONSE_TIMEOUT', 180))
+MAX_REQUEST_TIMEOUT = float(os.getenv('MAX_REQUEST_TIMEOUT', 600))
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 256))  # 每个流最多缓存的块数
+DISCONNECT_CHECK_INTERVAL = 1.0  # 等待数据块时检查客户端断开的间隔（秒）
+
+# 断点续传：每次运行的数据块保存在环形缓冲区中，客户端重连时通过 Last-Event-ID 补发
+STREAM_REPLAY_BUFFER = int(os.getenv('STREAM_REPLAY_BUFFER', 4096))  # 每次运行保留的数据块数
+STREAM_RESUME_TTL = float(os.getenv('STREAM_RESUME_TTL', 300))  # 运行结束后仍可续传的时间（秒）
+
+# 合并相同请求：相同的请求同时到达时共享一次数据流运行，每个客户端都收到完整的数据块
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# 取消无人读取的运行：最后一个客户端断开超过该时间（秒）且没有重连时，通过 v3/chat/cancel
+# 输出通知数据流停止该请求。宽限期内客户端仍可续传，负数表示不取消。
+CANCEL_ABANDONED_AFTER = float(os.getenv('CANCEL_ABANDONED_AFTER', 15))
+# 运行没有完整结束时，发给客户端的错误帧中的说明
+RUN_STOPPED_MESSAGES = {
+    "cancelled": "The run was cancelled because no client read it",
+    "timeout": "No response received from the dataflow before the deadline",
+    "overflowed": "The run's stream queue overflowed",
+    "stopped": "The dataflow stopped before the run finished",
+    "disconnected": "The request was cancelled while queued",
+    "error": "The run failed",
+}
+
+# 增量合并：同一阶段连续的增量合并为一个 SSE 帧，减少每个流的编码和写入次数
+SSE_COALESCE_BYTES = int(os.getenv('SSE_COALESCE_BYTES', 4096))  # 合并帧的最大内容字节数，0 表示不合并
+SSE_COALESCE_MS = float(os.getenv('SSE_COALESCE_MS', 0))  # 增量最多等待后续增量的毫秒数，0 表示只合并已到达的增量
+
+# 文章表模式：文章只在首次引用时发送一次，之后的增量只带文章 ID，元数据只在变化时发送。
+# 请求可以通过 article_refs 字段选择是否使用，未指定时使用该默认值；关闭时保持旧的格式。
+ARTICLE_REFS_DEFAULT = os.getenv('ARTICLE_REFS_DEFAULT', 'false').lower() in ('1', 'true', 'yes')
+
+# 准入控制：超过并发上限的请求进入有界队列等待，队列已满时直接返回 429
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv('MAX_IN_FLIGHT_REQUESTS', 8))  # 同时运行的流数，0 表示不限制
+MAX_QUEUED_REQUESTS = int(os.getenv('MAX_QUEUED_REQUESTS', 32))  # 最多排队的请求数
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))  # Retry-After 响应头中的秒数
+# 排队的请求按类别（X-Priority 或 X-Tenant 请求头）分队列，空出的槽位按权重公平分配；未知或未指定的类别使用 DEFAULT_PRIORITY
+PRIORITY_WEIGHTS = parse_weights(os.getenv('PRIORITY_WEIGHTS', 'interactive=4,default=2,batch=1'))
+DEFAULT_PRIORITY = os.getenv('DEFAULT_PRIORITY', 'default')
+
+# 多进程模式：HTTP_WORKERS 大于 1 时启动多个 uvicorn worker 进程处理 HTTP 请求，
+# 主进程作为 broker 独占 Dora 节点，worker 通过 Unix 套接字（DORA_BROKER_SOCKET，默认在临时目录中）与它通信。
+# 准入控制、断点续传、相同请求合并和指标都按 worker 进程分别计算。
+HTTP_WORKERS = int(os.getenv('HTTP_WORKERS', 1))
+DORA_BROKER_SOCKET = os.getenv('DORA_BROKER_SOCKET', '')
+
+# 模拟数据流：用 mock_dataflow 代替 Dora 节点，用于本地运行和压测（见 local_server.py）
+MOCK_DATAFLOW = os.getenv('MOCK_DATAFLOW', 'false').lower() in ('1', 'true', 'yes')
+
+# 可选的响应缓存：相同请求直接回放已缓存的数据块，不再重新运行数据流
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))  # 内存中保留的条目数
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))  # 条目有效期（秒）
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '')  # 磁盘缓存目录，为空时不启用
+# 磁盘缓存的上限，超过后删除最久未使用的条目；0 表示不限制
+RESPONSE_CACHE_DISK_ENTRIES = int(os.getenv('RESPONSE_CACHE_DISK_ENTRIES', 10000))
+RESPONSE_CACHE_DISK_MB = float(os.getenv('RESPONSE_CACHE_DISK_MB', 256))
+
+# 指标，以 Prometheus 文本格式在 GET /metrics 暴露
+metrics = MetricsRegistry()
+STREAMS = metrics.counter("openai_server_stream_streams_total", "SSE streams by outcome", ["status"])
+IN_FLIGHT_STREAMS = metrics.gauge("openai_server_stream_in_flight_streams", "SSE streams currently open")
+QUEUED = metrics.gauge("openai_server_stream_queued_requests", "Requests waiting for an admission slot", ["priority"])
+QUEUE_WAIT = metrics.histogram("openai_server_stream_queue_wait_seconds", "Time requests waited for an admission slot",
+                               ["priority"])
+SEND_DELAY = metrics.histogram("openai_server_stream_send_delay_seconds",
+                               "Time between opening a stream and the router thread sending it into the dataflow")
+TIME_TO_FIRST_CHUNK = metrics.histogram("openai_server_stream_time_to_first_chunk_seconds",
+                                        "Time between accepting a request and sending its first SSE frame", ["cache"])
+DATAFLOW_LATENCY = metrics.histogram("openai_server_stream_dataflow_latency_seconds",
+                                     "Time between sending a request into the dataflow and its final chunk")
+STREAM_DURATION = metrics.histogram("openai_server_stream_stream_duration_seconds",
+                                    "Time between accepting a request and closing its stream", ["cache"])
+CHUNKS = metrics.counter("openai_server_stream_chunks_total", "SSE frames sent to clients", ["cache"])
+CHUNK_RATE = metrics.histogram("openai_server_stream_chunks_per_second", "Per-stream rate of SSE frames",
+                               buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+TOKENS = metrics.counter("openai_server_stream_tokens_total", "Prompt and completion tokens served", ["kind"])
+CACHE_LOOKUPS = metrics.counter("openai_server_stream_cache_lookups_total", "Response cache lookups", ["result"])
+RUNS = metrics.counter("openai_server_stream_runs_total", "Dataflow runs by outcome", ["status"])
+SINGLE_FLIGHT = metrics.counter("openai_server_stream_single_flight_total",
+                                "Requests that joined an identical run already in flight")
+RESUMES = metrics.counter("openai_server_stream_resumes_total", "Reconnections with Last-Event-ID", ["result"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # worker 进程由 uvicorn 直接启动，不经过 run_fastapi，在这里启动和停止路由线程
+    worker = isinstance(node, RemoteNode)
+    if worker:
+        router.start()
+    try:
+        yield
+    finally:
+        if worker:
+            router.stop()
 
-app = FastAPI(title="Dora Streaming API with Dora Integration")
+
+app = FastAPI(title="Dora Streaming API with Dora Integration", lifespan=lifespan)
 
 origins = ["*"]
 app.add_middleware(
@@ -199,6 +312,7 @@ class ChatCompletionRequest(BaseModel):
     messages: List[ChatCompletionMessage]
     temperature: Optional[float] = 1.0
     max_tokens: Optional[int] = 100
+    article_refs: Optional[bool] = None  # 文章表模式，未指定时使用 ARTICLE_REFS_DEFAULT
 
 
 # 定义响应结构（仅供参考）
@@ -211,77 +325,355 @@ class ChatCompletionResponse(BaseModel):
     usage: dict
 
 
-# 初始化 Dora 节点
-node = Node()
+# 初始化 Dora 节点，服务运行后只有路由线程会访问它。
+# 多进程模式下的 worker 进程使用连接 broker 的 RemoteNode，只有 broker 进程持有真正的 Node。
+if os.getenv(BROKER_CONNECT_ENV):
+    node = RemoteNode(os.environ[BROKER_CONNECT_ENV])
+elif MOCK_DATAFLOW:
+    node = MockDataflowNode.from_env()
+else:
+    node = Node()
+router = DoraEventRouter(node, reply_ids=("v3/chat/completions",), queue_size=STREAM_QUEUE_SIZE,
+                         abandon_timeout=MAX_REQUEST_TIMEOUT, observe_queue_wait=SEND_DELAY.observe)
+admission = AdmissionController(max_in_flight=MAX_IN_FLIGHT_REQUESTS, max_queued=MAX_QUEUED_REQUESTS,
+                                retry_after=ADMISSION_RETRY_AFTER, weights=PRIORITY_WEIGHTS,
+                                default_class=DEFAULT_PRIORITY)
+runs = StreamRegistry(ttl=STREAM_RESUME_TTL)
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, disk_dir=RESPONSE_CACHE_DIR,
+                               disk_max_entries=RESPONSE_CACHE_DISK_ENTRIES,
+                               disk_max_bytes=int(RESPONSE_CACHE_DISK_MB * 1024 * 1024)) if RESPONSE_CACHE_ENABLED else None
 
 
 def clean_string(input_string: str) -> str:
     return input_string.encode('utf-8', 'replace').decode('utf-8')
 
 
-# 改造后的流式数据生成函数，支持客户端断开检测
-async def dora_event_stream(request_model: str, request: Request) -> AsyncGenerator[str, None]:
+class StreamRecorder:
+    """记录单个客户端流的首块延迟、帧数和持续时间"""
+
+    def __init__(self, started_at: float, cache: str):
+        self.started_at = started_at
+        self.cache = cache
+        self.first_chunk_at = None
+        self.chunks = 0
+        IN_FLIGHT_STREAMS.inc()
+
+    def chunk(self):
+        """记录发送的一帧"""
+        now = time.monotonic()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+            TIME_TO_FIRST_CHUNK.observe(now - self.started_at, cache=self.cache)
+        self.chunks += 1
+        CHUNKS.inc(cache=self.cache)
+
+    def close(self, status: str):
+        duration = time.monotonic() - self.started_at
+        IN_FLIGHT_STREAMS.dec()
+        STREAMS.inc(status=status)
+        STREAM_DURATION.observe(duration, cache=self.cache)
+        if self.first_chunk_at is not None and self.chunks > 1:
+            CHUNK_RATE.observe(self.chunks / max(time.monotonic() - self.first_chunk_at, 1e-6))
+
+
+def count_usage(request_model: str, messages: List[dict], chunks: List[dict]) -> dict:
+    """统计一次完整回答的 prompt 和 completion token"""
+    usage = usage_block(messages, "".join(c.get("content") or "" for c in chunks), request_model)
+    TOKENS.inc(usage["prompt_tokens"], kind="prompt")
+    TOKENS.inc(usage["completion_tokens"], kind="completion")
+    return usage
+
+
+# 队列暂时没有数据块
+NO_CHUNK = object()
+
+
+async def next_chunk(chunks: asyncio.Queue, timeout: float):
+    """先不等待地取数据块，队列为空时最多等待 timeout 秒，超时返回 NO_CHUNK"""
+    try:
+        return chunks.get_nowait()
+    except asyncio.QueueEmpty:
+        pass
+    if timeout <= 0:
+        return NO_CHUNK
+    try:
+        return await asyncio.wait_for(chunks.get(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return NO_CHUNK
+
+
+# 数据流运行任务：把本次运行的数据块写入可续传的缓冲区，与客户端连接无关
+async def feed_run(run: StreamRun, stream: StreamSubscription, request_model: str, messages: List[dict],
+                   started_at: float, deadline: float, response_cache_key: Optional[str] = None):
     """
-    持续轮询 Dora 节点返回的事件，
-    支持检测客户端断开连接，优雅退出。
+    从路由线程分发到本流的队列中读取 Dora 返回的数据块并追加到 `run`，
+    客户端断开后运行仍会继续，重连的客户端可以从缓冲区续传。
+    首个数据块必须在请求截止时间 `deadline` 之前到达，之后两个数据块之间
+    最多间隔同样长的时间。运行结束时释放准入槽位，完整结束的运行会写入响应缓存。
+    超过 CANCEL_ABANDONED_AFTER 秒没有客户端读取时取消运行。
     """
+    idle_timeout = deadline - started_at
+    idle_since = None
+    received = []  # 本次运行的全部数据块，用于 usage 统计和写入缓存
+    status = "stopped"
     try:
         while True:
-            # 客户端断开检测
-            if await request.is_disconnected():
-                print("Client disconnected, stopping stream.")
+            if run.abandoned(CANCEL_ABANDONED_AFTER):
+                print("No client reads the stream any more, cancelling the run.")
+                router.send("v3/chat/cancel", pa.array([run.id]), {REQUEST_ID_KEY: run.id})
+                status = "cancelled"
+                break
+            now = time.monotonic()
+            expires_at = deadline if idle_since is None else idle_since + idle_timeout
+            parsed = await next_chunk(stream.queue, min(expires_at - now, DISCONNECT_CHECK_INTERVAL))
+            if parsed is NO_CHUNK:
+                if stream.overflowed:
+                    print("Stream queue overflowed.")
+                    status = "overflowed"
+                elif time.monotonic() < expires_at:
+                    continue
+                else:
+                    print("No response received from the dataflow, stopping stream.")
+                    status = "timeout"
                 break
+            if parsed is None:
+                # 数据流已停止，或请求没能发送到数据流
+                if stream.error is not None:
+                    status = "error"
+                break
+            idle_since = time.monotonic()
+
+            parsed.pop(REQUEST_ID_KEY, None)
+            collect_articles(run.articles, parsed)
+            received.append(parsed)
+            if parsed.get("end", None) is not None:
+                run.usage = count_usage(request_model, messages, received)
+                run.append(parsed)
+                status = "ok"
+                if stream.sent_at is not None:
+                    DATAFLOW_LATENCY.observe(time.monotonic() - stream.sent_at)
+                if response_cache_key is not None:
+                    await response_cache.store(response_cache_key, received)
+                break
+            run.append(parsed)
+    except Exception as e:
+        # 可以根据需要自定义日志或监控
+        status = "error"
+        print("Stream run error:", traceback.format_exc())
+    finally:
+        router.close_stream(stream)
+        admission.release()
+        runs.finish(run)
+        run.finish(status)
+        RUNS.inc(status=status)
+
 
-            event = node.next(timeout=DORA_RESPONSE_TIMEOUT)
-            if event["type"] == "INPUT" and event["id"] == "v3/chat/completions":
-                response_val = event["value"][0].as_py()
-                parsed = json.loads(response_val)
-                parsed = json.loads(parsed['node_results'])
-                finish_reason = ''
-                if parsed.get("end", None) is not None:
-                    finish_reason = "stop"
-
-                stream_chunk = {
-                    "id": str(uuid.uuid4()),
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": request_model,
-                    "choices": [{
-                        "delta": {
-                            "content": parsed.get("content", ""),
-                            "articles": parsed.get("articles", []),
-                            "metadata": parsed.get("metadata", {}),
-                            "type": parsed.get("type", "content"),
-                            "id": parsed.get("id", 0),
-                        },
-                        "index": 0,
-                        "finish_reason": finish_reason
-                    }]
-                }
-                yield "data: " + json.dumps(stream_chunk) + "\n\n"
-                if finish_reason == "stop":
+# 流式数据生成函数：从运行的缓冲区读取数据块，支持客户端断开检测和断点续传
+async def dora_event_stream(request_model: str, request: Request, run: StreamRun, recorder: StreamRecorder,
+                            after_seq: int = 0, article_refs: bool = False) -> AsyncGenerator[bytes, None]:
+    """
+    发送 `run` 中序号大于 `after_seq` 的数据块，然后继续接收新的数据块。
+    每帧带有 `id: <运行 ID>:<序号>`，客户端重连时通过 Last-Event-ID 续传。
+    等待期间不会阻塞事件循环，因此多个客户端可以并行接收数据，
+    同时支持检测客户端断开连接，优雅退出。
+    同一阶段连续的增量按 SSE_COALESCE_BYTES / SSE_COALESCE_MS 合并为一帧。
+    `article_refs` 为 False 时不发送文章表数据块，文章引用展开为完整的文章。
+    """
+    checked_at = time.monotonic()
+    cursor = after_seq
+    status = "disconnected"
+    encoder = SSEEncoder(request_model, completion_id=run.id, article_refs=article_refs, articles=run.articles)
+    coalescer = DeltaCoalescer(SSE_COALESCE_BYTES)
+
+    def frame(chunk: dict) -> bytes:
+        recorder.chunk()
+        usage = run.usage if chunk.get("end", None) is not None else None
+        return encoder.encode(chunk, usage, event_id=run.event_id(chunk[SEQ_KEY]))
+
+    run.subscribe()
+    try:
+        while True:
+            now = time.monotonic()
+            # 客户端断开检测，每个检查间隔最多一次
+            if now - checked_at >= DISCONNECT_CHECK_INTERVAL:
+                checked_at = now
+                if await request.is_disconnected():
+                    print("Client disconnected, stopping stream.")
+                    status = "disconnected"
                     break
-            else:
-                await asyncio.sleep(0.1)
+
+            try:
+                chunks = run.replay(cursor)
+            except ReplayUnavailable:
+                print("Client too slow, replay buffer overflowed.")
+                status = "overflowed"
+                break
+            for cursor, parsed in chunks:
+                if not article_refs and parsed.get("type") == ARTICLES_TYPE:
+                    continue
+                for ready in coalescer.push(parsed):
+                    yield frame(ready)
+            if run.finished and cursor >= run.last_seq:
+                if coalescer.pending is not None:
+                    yield frame(coalescer.flush())
+                status = run.status
+                if status != "ok":
+                    # 运行没有以最终数据块结束（取消、超时、出错），发送错误帧和 [DONE]，
+                    # 仍在读取或之后重连的客户端都不会把它当作完整的回答
+                    recorder.chunk()
+                    yield encoder.error(RUN_STOPPED_MESSAGES.get(status, "The run stopped early"), status,
+                                        event_id=run.event_id(run.last_seq))
+                break
+
+            if coalescer.pending is None:
+                await run.wait(cursor, DISCONNECT_CHECK_INTERVAL)
+            elif not await run.wait(cursor, coalescer.pending_since + SSE_COALESCE_MS / 1000 - now):
+                # 合并窗口结束仍没有新的增量，发送已合并的增量
+                yield frame(coalescer.flush())
     except Exception as e:
-        # 可以根据需要自定义日志或监控
+        status = "error"
         print("Stream generator error:", traceback.format_exc())
     finally:
+        run.unsubscribe()
+        recorder.close(status)
         print("Stream generator exited.")
 
 
+# 缓存命中时回放已缓存的数据块
+async def cached_event_stream(request_model: str, messages: List[dict], chunks: List[dict],
+                              recorder: StreamRecorder, article_refs: bool = False) -> AsyncGenerator[bytes, None]:
+    status = "disconnected"
+    articles = {}
+    for parsed in chunks:
+        collect_articles(articles, parsed)
+    encoder = SSEEncoder(request_model, article_refs=article_refs, articles=articles)
+    coalescer = DeltaCoalescer(SSE_COALESCE_BYTES)
+
+    def frame(chunk: dict) -> bytes:
+        recorder.chunk()
+        usage = count_usage(request_model, messages, chunks) if chunk.get("end", None) is not None else None
+        return encoder.encode(chunk, usage)
+
+    try:
+        for parsed in chunks:
+            if not article_refs and parsed.get("type") == ARTICLES_TYPE:
+                continue
+            for ready in coalescer.push(parsed):
+                yield frame(ready)
+        if coalescer.pending is not None:
+            yield frame(coalescer.flush())
+        status = "ok"
+    finally:
+        recorder.close(status)
+
+
 @app.post("/v3/chat/completions")
-async def create_chat_completion(request: Request, body: ChatCompletionRequest):
+async def create_chat_completion(request: Request, body: ChatCompletionRequest,
+                                 x_request_timeout: Optional[str] = Header(None),
+                                 last_event_id: Optional[str] = Header(None),
+                                 x_priority: Optional[str] = Header(None), x_tenant: Optional[str] = Header(None)):
+    started_at = time.monotonic()
     user_query = next((msg.content for msg in body.messages if msg.role == "user"), "")
     if not user_query:
         raise HTTPException(status_code=400, detail="No user query provided")
+    messages = [msg.model_dump() for msg in body.messages]
+    article_refs = ARTICLE_REFS_DEFAULT if body.article_refs is None else body.article_refs
+
+    # 断点续传：Last-Event-ID 指向仍在缓冲区中的运行时，补发缺失的数据块后继续接收
+    resume = parse_event_id(last_event_id)
+    if resume is not None:
+        run_id, after_seq = resume
+        run = runs.get(run_id)
+        if run is None:
+            RESUMES.inc(result="unknown")
+        else:
+            try:
+                run.replay(after_seq)
+            except ReplayUnavailable as e:
+                RESUMES.inc(result="gone")
+                raise HTTPException(status_code=410, detail=str(e))
+            RESUMES.inc(result="resumed")
+            recorder = StreamRecorder(started_at, cache="resume")
+            return StreamingResponse(
+                dora_event_stream(body.model, request, run, recorder, after_seq, article_refs),
+                media_type="text/event-stream",
+                headers={"X-Stream-Id": run.id}
+            )
+
+    request_key = cache_key(body.model, messages, body.temperature, body.max_tokens)
+    key = None
+    if response_cache is not None:
+        key = request_key
+        cached = await response_cache.lookup(key)
+        CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            recorder = StreamRecorder(started_at, cache="hit")
+            return StreamingResponse(
+                cached_event_stream(body.model, messages, cached, recorder, article_refs),
+                media_type="text/event-stream",
+                headers={"X-Cache": "HIT"}
+            )
+
+    # 相同的请求正在运行（或排队）时直接订阅该运行，从头接收全部数据块，不再重复运行数据流
+    if SINGLE_FLIGHT_ENABLED:
+        run = runs.in_flight(request_key)
+        if run is not None:
+            error = await asyncio.shield(run.admitted)
+            if error is not None:
+                STREAMS.inc(status="rejected" if error.status_code == 429 else "timeout")
+                raise error
+            SINGLE_FLIGHT.inc()
+            recorder = StreamRecorder(started_at, cache="shared")
+            return StreamingResponse(
+                dora_event_stream(body.model, request, run, recorder, article_refs=article_refs),
+                media_type="text/event-stream",
+                headers={"X-Stream-Id": run.id, "X-Single-Flight": "HIT"}
+            )
+
+    # 先登记运行，排队期间到达的相同请求也能订阅它
+    run = StreamRun(uuid.uuid4().hex, STREAM_REPLAY_BUFFER, key=request_key if SINGLE_FLIGHT_ENABLED else None)
+    runs.add(run)
+
+    # 每个请求都有自己的截止时间，覆盖排队和等待首个数据块
+    deadline = request_deadline(started_at, x_request_timeout, DORA_RESPONSE_TIMEOUT, MAX_REQUEST_TIMEOUT)
+    priority = admission.request_class(x_priority or x_tenant)
+    error = None
+    try:
+        QUEUE_WAIT.observe(await admission.acquire(deadline, priority), priority=priority)
+    except AdmissionRejected as e:
+        STREAMS.inc(status="rejected")
+        error = HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        STREAMS.inc(status="timeout")
+        error = HTTPException(status_code=504, detail="Request deadline passed while waiting for an admission slot")
+    except BaseException:
+        # 客户端在排队期间断开
+        runs.finish(run)
+        run.finish("disconnected")
+        run.admitted.set_result(HTTPException(status_code=503, detail="Request was cancelled while queued"))
+        raise
+    run.admitted.set_result(error)
+    if error is not None:
+        runs.finish(run)
+        run.finish("rejected" if error.status_code == 429 else "timeout")
+        raise error
+    run.start()
 
     data = pa.array([clean_string(user_query)])
-    node.send_output("v3/chat/completions", data)
-
+    # 运行 ID 作为请求 ID 随输出的 metadata 进入数据流，返回的数据块据此路由回本次运行；
+    # 截止时间（Unix 毫秒）也随 metadata 传递，超过截止时间仍未开始的请求会被智能体跳过
+    stream = router.open_stream("v3/chat/completions", data, {DEADLINE_KEY: wall_clock_deadline(deadline)},
+                                request_id=run.id)
+    run.task = asyncio.create_task(feed_run(run, stream, body.model, messages, started_at, deadline, key))
+
+    recorder = StreamRecorder(started_at, cache="miss" if key is not None else "off")
+    headers = {"X-Stream-Id": run.id}
+    if key is not None:
+        headers["X-Cache"] = "MISS"
     return StreamingResponse(
-        dora_event_stream(body.model, request),
-        media_type="text/event-stream"
+        dora_event_stream(body.model, request, run, recorder, article_refs=article_refs),
+        media_type="text/event-stream",
+        headers=headers
     )
 
 
@@ -300,6 +692,20 @@ async def list_models():
     }
 
 
+@app.get("/v3/cache/stats")
+async def cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    for priority, queued in admission.queued_by_class().items():
+        QUEUED.set(queued, priority=priority)
+    return Response(content=metrics.render(), media_type=metrics.content_type)
+
+
 @app.get("/v3/hello")
 async def hello():
     return "Hello World"
@@ -309,20 +715,37 @@ async def run_fastapi():
     config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info")
     server = uvicorn.Server(config)
 
-    server_task = asyncio.create_task(server.serve())
+    # 路由线程在整个服务期间读取 Dora 事件，收到 STOP 后通知 uvicorn 退出
+    loop = asyncio.get_running_loop()
+    print("SSE JSON backend:", JSON_BACKEND)
+    router.start(on_stop=lambda: loop.call_soon_threadsafe(setattr, server, "should_exit", True))
     try:
-        while True:
-            await asyncio.sleep(1)
-            event = node.next(0.001)
-            if event.get("type") == "STOP":
-                break
+        await server.serve()
+    finally:
+        router.stop()
+
+
+def run_workers():
+    """多进程模式：当前进程作为 broker 持有 Dora 节点，uvicorn 启动 HTTP_WORKERS 个 worker 进程"""
+    socket_path = DORA_BROKER_SOCKET or os.path.join(tempfile.mkdtemp(prefix="openai-server-stream-"), "broker.sock")
+    broker = DoraBroker(node, socket_path, reply_ids=("v3/chat/completions",), request_ttl=MAX_REQUEST_TIMEOUT)
+    # 数据流发送 STOP 后向自身发送 SIGTERM，uvicorn 主进程随之停止所有 worker
+    broker.start(on_stop=lambda: os.kill(os.getpid(), signal.SIGTERM))
+    os.environ[BROKER_CONNECT_ENV] = socket_path
+    print("SSE JSON backend:", JSON_BACKEND)
+    print(f"Dora broker listening on {socket_path} for {HTTP_WORKERS} HTTP workers")
+    try:
+        uvicorn.run("openai_server_stream.main:app", host="0.0.0.0", port=8000, log_level="info",
+                    workers=HTTP_WORKERS)
     finally:
-        server.should_exit = True
-        await server_task
+        broker.stop()
 
 
 def main():
-    asyncio.run(run_fastapi())
+    if HTTP_WORKERS > 1:
+        run_workers()
+    else:
+        asyncio.run(run_fastapi())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+# Key of the sequence number a run adds to each of its buffered chunks.
+SEQ_KEY = "seq"
+
+
+class ReplayUnavailable(Exception):
+    """The chunks after the requested event id already left the replay buffer."""
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split a `Last-Event-ID` of the form `<run id>:<sequence number>`."""
+    if not value:
+        return None
+    run_id, _, seq = value.strip().rpartition(":")
+    if not run_id or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+class StreamRun:
+    """
+    The chunks of one dataflow run, independent of the clients reading them.
+
+    Chunks are numbered from 1 and kept in a bounded ring buffer, so a client
+    can attach, drop and resume from any event id the buffer still holds
+    while the run goes on. There is one producer and any number of readers,
+    all on the same event loop.
+    """
+
+    def __init__(self, run_id: str, buffer_size: int, key: Optional[str] = None):
+        self.id = run_id
+        self.key = key  # normalized request, lets identical requests share the run
+        self.buffer = deque(maxlen=buffer_size)  # (sequence number, chunk), oldest first
+        self.last_seq = 0
+        self.finished = False
+        self.status = None
+        self.usage = None  # token usage of the whole run, set before the final chunk is appended
+        self.articles = {}  # article id -> article, from the articles table chunk of the run
+        self.finished_at = None
+        self.task = None  # the producer task, referenced here while the run goes on
+        self.subscribers = 0
+        # Since when nobody reads the run; the clock only starts once the run was admitted,
+        # so time spent queued never counts as abandoned.
+        self.unsubscribed_at = None
+        loop = asyncio.get_running_loop()
+        # Resolves with None once the run was admitted, or with the error that kept it from starting.
+        self.admitted = loop.create_future()
+        self._wakeup = loop.create_future()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def append(self, chunk: dict) -> int:
+        self.last_seq += 1
+        self.buffer.append((self.last_seq, dict(chunk, **{SEQ_KEY: self.last_seq})))
+        self._notify()
+        return self.last_seq
+
+    def finish(self, status: str):
+        self.finished = True
+        self.status = status
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def start(self):
+        """Mark the run admitted; from now on it counts as abandoned while nobody reads it."""
+        if not self.subscribers:
+            self.unsubscribed_at = time.monotonic()
+
+    def subscribe(self):
+        self.subscribers += 1
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+        if self.subscribers == 0:
+            self.unsubscribed_at = time.monotonic()
+
+    def abandoned_for(self) -> float:
+        """Seconds since the last reader left the started run, 0 while somebody reads it."""
+        if self.subscribers or self.unsubscribed_at is None:
+            return 0.0
+        return time.monotonic() - self.unsubscribed_at
+
+    def abandoned(self, grace: float) -> bool:
+        """Whether nobody has read the started run for longer than `grace` seconds; a negative grace never expires."""
+        return 0 <= grace < self.abandoned_for()
+
+    def replay(self, after_seq: int) -> List[Tuple[int, dict]]:
+        """
+        The buffered chunks after `after_seq`. Raises `ReplayUnavailable` when
+        some of them were already evicted, i.e. the reader fell too far behind.
+        """
+        if after_seq >= self.last_seq:
+            return []
+        first_seq = self.buffer[0][0] if self.buffer else self.last_seq + 1
+        if after_seq + 1 < first_seq:
+            raise ReplayUnavailable(f"Chunks after {self.event_id(after_seq)} are no longer buffered")
+        return list(itertools.islice(self.buffer, after_seq + 1 - first_seq, None))
+
+    async def wait(self, after_seq: int, timeout: float) -> bool:
+        """Wait until there is a chunk after `after_seq` or the run finishes; False on timeout."""
+        if self.last_seq > after_seq or self.finished:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._wakeup), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.get_running_loop().create_future()
+        wakeup.set_result(None)
+
+
+class StreamRegistry:
+    """
+    Runs by id, and unfinished runs by request key. Finished runs stay
+    resumable for `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._runs = OrderedDict()
+        self._in_flight = {}  # request key -> unfinished run
+
+    def add(self, run: StreamRun):
+        self.prune()
+        self._runs[run.id] = run
+        if run.key is not None:
+            self._in_flight[run.key] = run
+
+    def in_flight(self, key: str) -> Optional[StreamRun]:
+        """
+        The unfinished run of an identical request, as long as its buffer
+        still holds the whole run so that a new subscriber can read it from
+        the start.
+        """
+        run = self._in_flight.get(key)
+        if run is None or run.finished:
+            return None
+        if run.buffer and run.buffer[0][0] != 1:
+            return None
+        return run
+
+    def finish(self, run: StreamRun):
+        """Stop handing `run` to new identical requests; it stays resumable."""
+        if run.key is not None and self._in_flight.get(run.key) is run:
+            del self._in_flight[run.key]
+
+    def get(self, run_id: str) -> Optional[StreamRun]:
+        self.prune()
+        return self._runs.get(run_id)
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def prune(self):
+        now = time.monotonic()
+        expired = [run_id for run_id, run in self._runs.items()
+                   if run.finished and now - run.finished_at > self.ttl]
+        for run_id in expired:
+            del self._runs[run_id]
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# Type of the chunk that carries the articles table of a run; its articles have an "id".
+ARTICLES_TYPE = "articles"
+
+
+def loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def article_ref(article: dict) -> str:
+    """Stable id of an article that was sent without one."""
+    return hashlib.sha1((article.get("url") or article.get("title") or "").encode("utf-8")).hexdigest()[:12]
+
+
+def collect_articles(table: dict, chunk: dict):
+    """Add the articles of an articles table chunk to `table` (article id -> article)."""
+    if chunk.get("type") == ARTICLES_TYPE:
+        for article in chunk.get("articles") or []:
+            table[article.get("id") or article_ref(article)] = article
+
+
+class SSEEncoder:
+    """
+    Encodes the chunks of one stream as `chat.completion.chunk` SSE frames.
+
+    Everything around the delta (id, created, model, index, finish_reason)
+    is serialized once per stream, so a frame costs a single `dumps` of the
+    delta and two byte concatenations.
+
+    Chunks refer to articles either inline (`articles`) or by id
+    (`article_ids`, resolved through the `articles` table of the run). With
+    `article_refs`, every article is sent once, in the `articles` of the
+    first delta that needs it, deltas only carry `article_ids`, and
+    `metadata` is only sent when it changes. Otherwise every delta carries
+    full `articles` and `metadata`, as clients without support expect.
+    """
+
+    def __init__(self, model: str, completion_id: Optional[str] = None, created: Optional[int] = None,
+                 article_refs: bool = False, articles: Optional[dict] = None):
+        self.article_refs = article_refs
+        self.articles = {} if articles is None else articles  # article id -> article
+        self._sent_articles = set()
+        self._metadata = None
+        header = {
+            "id": completion_id or str(uuid.uuid4()),
+            "object": "chat.completion.chunk",
+            "created": int(time.time()) if created is None else created,
+            "model": model,
+        }
+        self._prefix = b'data: ' + dumps(header)[:-1] + b',"choices":[{"delta":'
+        self._suffix = b',"index":0,"finish_reason":""}]}\n\n'
+        self._last_suffix = b',"index":0,"finish_reason":"stop"}]'
+
+    def encode(self, chunk: dict, usage: Optional[dict] = None, event_id: Optional[str] = None) -> bytes:
+        collect_articles(self.articles, chunk)
+        delta = dumps(self._compact_delta(chunk) if self.article_refs else self._full_delta(chunk))
+        prefix = self._prefix if event_id is None else b'id: ' + event_id.encode() + b'\n' + self._prefix
+        if chunk.get("end", None) is None:
+            return prefix + delta + self._suffix
+        tail = b'}\n\n' if usage is None else b',"usage":' + dumps(usage) + b'}\n\n'
+        return prefix + delta + self._last_suffix + tail
+
+    def error(self, message: str, code: str, event_id: Optional[str] = None) -> bytes:
+        """
+        The frames ending a stream whose run stopped without a final chunk:
+        an OpenAI-style `error` event followed by `[DONE]`, so that clients
+        do not mistake the stream for a complete answer.
+        """
+        prefix = b'' if event_id is None else b'id: ' + event_id.encode() + b'\n'
+        error = dumps({"error": {"message": message, "type": "stream_error", "code": code}})
+        return prefix + b'data: ' + error + b'\n\ndata: [DONE]\n\n'
+
+    def _full_delta(self, chunk: dict) -> dict:
+        articles = chunk.get("articles") or []
+        if not articles and chunk.get("article_ids"):
+            articles = [self.articles[i] for i in chunk["article_ids"] if i in self.articles]
+        return {
+            "content": chunk.get("content", ""),
+            "articles": articles,
+            "metadata": chunk.get("metadata", {}),
+            "type": chunk.get("type", "content"),
+            "id": chunk.get("id", 0),
+        }
+
+    def _compact_delta(self, chunk: dict) -> dict:
+        delta = {
+            "content": chunk.get("content", ""),
+            "type": chunk.get("type", "content"),
+            "id": chunk.get("id", 0),
+        }
+        metadata = chunk.get("metadata", {})
+        if metadata != self._metadata:
+            delta["metadata"] = self._metadata = metadata
+        article_ids = chunk.get("article_ids")
+        new_articles = []
+        if chunk.get("articles"):
+            # Inline articles, e.g. from a producer without an articles table
+            refs = []
+            for article in chunk["articles"]:
+                article_id = article.get("id") or article_ref(article)
+                refs.append(article_id)
+                if article_id not in self._sent_articles:
+                    self._sent_articles.add(article_id)
+                    new_articles.append(dict(article, id=article_id))
+            if article_ids is None and chunk.get("type") != ARTICLES_TYPE:
+                article_ids = refs
+        elif article_ids:
+            # Referenced articles this client has not received yet, e.g. after resuming past the table
+            for article_id in article_ids:
+                if article_id not in self._sent_articles and article_id in self.articles:
+                    self._sent_articles.add(article_id)
+                    new_articles.append(dict(self.articles[article_id], id=article_id))
+        if new_articles:
+            delta["articles"] = new_articles
+        if article_ids:
+            delta["article_ids"] = article_ids
+        return delta
+
+
+def can_merge(pending: dict, chunk: dict) -> bool:
+    """
+    Consecutive deltas merge when they belong to the same stage and type and
+    the later one carries no articles of its own. Final chunks never merge.
+    """
+    return (pending.get("end", None) is None and chunk.get("end", None) is None
+            and not chunk.get("articles") and not chunk.get("article_ids")
+            and pending.get("type") == chunk.get("type")
+            and pending.get("metadata") == chunk.get("metadata")
+            and isinstance(pending.get("content"), str) and isinstance(chunk.get("content"), str))
+
+
+def merge(pending: dict, chunk: dict) -> dict:
+    """Append `chunk` to `pending`; the merged delta keeps the id of the last chunk."""
+    merged = dict(chunk)
+    merged["content"] = pending["content"] + chunk["content"]
+    merged["articles"] = pending.get("articles", [])
+    if "article_ids" in pending:
+        merged["article_ids"] = pending["article_ids"]
+    return merged
+
+
+class DeltaCoalescer:
+    """
+    Holds back the latest delta so that following deltas of the same stage
+    can be appended to it, until it reaches `max_bytes` of content. The
+    caller decides how long a delta may wait (see `pending_since`) and sends
+    it with `flush`. `max_bytes` of 0 disables merging.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.pending = None
+        self.pending_since = None
+        self._size = 0
+
+    def push(self, chunk: dict) -> List[dict]:
+        """Add a chunk and return the deltas that are ready to be sent, in order."""
+        if self.pending is not None and can_merge(self.pending, chunk):
+            self.pending = merge(self.pending, chunk)
+            self._size += len(chunk["content"].encode("utf-8"))
+            return [self.flush()] if self._size >= self.max_bytes else []
+        ready = [] if self.pending is None else [self.flush()]
+        if self.max_bytes <= 0 or chunk.get("end", None) is not None:
+            ready.append(chunk)
+        else:
+            self.pending = chunk
+            self.pending_since = time.monotonic()
+            self._size = len((chunk.get("content") or "").encode("utf-8"))
+        return ready
+
+    def flush(self) -> Optional[dict]:
+        pending, self.pending, self.pending_since = self.pending, None, None
+        return pending
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import queue
+
+import pyarrow as pa
+
+from openai_server_stream.event_router import DoraEventRouter
+
+
+class Node:
+    """Answers every output with one final chunk, and fails to send the outputs whose data is "fail"."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def send_output(self, output_id, data, metadata=None):
+        if data[0].as_py() == "fail":
+            raise RuntimeError("send failed")
+        chunk = {"type": "content", "content": data[0].as_py(), "end": "yes"}
+        self.events.put({"type": "INPUT", "id": "v3/chat/completions", "metadata": dict(metadata),
+                         "value": pa.array([json.dumps({"node_results": json.dumps(chunk)})])})
+
+    def next(self, timeout=None):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return {"type": "ERROR", "error": "timeout"}
+
+
+def test_failed_send_only_closes_its_stream():
+    async def scenario():
+        router = DoraEventRouter(Node())
+        router.start()
+        try:
+            failing = router.open_stream("v3/chat/completions", pa.array(["fail"]))
+            working = router.open_stream("v3/chat/completions", pa.array(["question"]))
+            closed = await asyncio.wait_for(failing.queue.get(), 5)
+            chunk = await asyncio.wait_for(working.queue.get(), 5)
+            return failing, closed, chunk, router.active_streams
+        finally:
+            router.stop()
+
+    failing, closed, chunk, active = asyncio.run(scenario())
+    # The failed stream ends with the closing sentinel and the reason
+    assert closed is None and failing.closed
+    assert "send failed" in str(failing.error)
+    # The router thread survived and served the other stream
+    assert chunk["content"] == "question"
+    assert active == 1
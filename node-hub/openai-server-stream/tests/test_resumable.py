@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from openai_server_stream.resumable import SEQ_KEY, ReplayUnavailable, StreamRegistry, StreamRun, parse_event_id
+
+
+def run_async(coroutine):
+    return asyncio.run(coroutine)
+
+
+GRACE = 0.02  # stands in for CANCEL_ABANDONED_AFTER
+
+
+def test_queued_run_is_not_abandoned():
+    async def scenario():
+        run = StreamRun("run", 8)
+        await asyncio.sleep(2 * GRACE)
+        return run
+
+    run = run_async(scenario())
+    # Waiting for admission never counts, however long it takes
+    assert run.abandoned_for() == 0.0
+    assert not run.abandoned(GRACE)
+
+
+def test_run_without_reader_is_abandoned_after_the_grace_period():
+    async def scenario():
+        run = StreamRun("run", 8)
+        run.start()
+        assert not run.abandoned(GRACE)
+        await asyncio.sleep(2 * GRACE)
+        return run
+
+    run = run_async(scenario())
+    assert run.abandoned_for() > GRACE
+    assert run.abandoned(GRACE)
+    # A negative grace period disables cancellation
+    assert not run.abandoned(-1)
+
+
+def test_subscribed_run_is_never_abandoned():
+    async def scenario():
+        run = StreamRun("run", 8)
+        run.subscribe()
+        run.start()
+        await asyncio.sleep(2 * GRACE)
+        return run
+
+    run = run_async(scenario())
+    assert run.unsubscribed_at is None
+    assert run.abandoned_for() == 0.0
+    assert not run.abandoned(GRACE)
+
+
+def test_abandonment_clock_starts_when_last_reader_leaves():
+    async def scenario():
+        run = StreamRun("run", 8)
+        run.subscribe()
+        run.subscribe()
+        run.start()
+        await asyncio.sleep(2 * GRACE)
+        run.unsubscribe()
+        # One reader is left
+        assert run.abandoned_for() == 0.0
+        run.unsubscribe()
+        # The time spent with readers does not count
+        assert run.abandoned_for() < GRACE
+        await asyncio.sleep(2 * GRACE)
+        assert run.abandoned(GRACE)
+        # A reconnecting client stops the clock again
+        run.subscribe()
+        assert run.abandoned_for() == 0.0
+        return run
+
+    run = run_async(scenario())
+    assert not run.abandoned(GRACE)
+
+
+def test_abandoned_run_is_cancelled_and_evicted():
+    async def scenario():
+        registry = StreamRegistry(ttl=GRACE)
+        run = StreamRun("run", 8, key="request")
+        registry.add(run)
+        run.subscribe()
+        run.start()
+        run.unsubscribe()
+        await asyncio.sleep(2 * GRACE)
+        # What feed_run does once nobody read the run for longer than CANCEL_ABANDONED_AFTER
+        assert run.abandoned(GRACE)
+        registry.finish(run)
+        run.finish("cancelled")
+        assert registry.in_flight("request") is None
+        assert registry.get("run").status == "cancelled"
+        await asyncio.sleep(2 * GRACE)
+        return registry
+
+    registry = run_async(scenario())
+    assert registry.get("run") is None
+    assert len(registry) == 0
+
+
+def test_parse_event_id():
+    assert parse_event_id("chatcmpl-1:2:15") == ("chatcmpl-1:2", 15)
+    assert parse_event_id(" run:0 ") == ("run", 0)
+    for value in (None, "", "run", ":3", "run:", "run:-1", "run:x"):
+        assert parse_event_id(value) is None
+
+
+def test_replay_after_last_event_id():
+    async def scenario():
+        run = StreamRun("run", 8)
+        for i in range(5):
+            run.append({"content": str(i)})
+        return run
+
+    run = run_async(scenario())
+    assert run.event_id(run.last_seq) == "run:5"
+    # A client that saw event 3 gets 4 and 5, numbered as before
+    assert [(seq, chunk["content"], chunk[SEQ_KEY]) for seq, chunk in run.replay(3)] == [(4, "3", 4), (5, "4", 5)]
+    assert [seq for seq, _ in run.replay(0)] == [1, 2, 3, 4, 5]
+    assert run.replay(5) == []
+
+
+def test_replay_fails_once_chunks_were_evicted():
+    async def scenario():
+        run = StreamRun("run", 3)
+        for i in range(6):
+            run.append({"content": str(i)})
+        return run
+
+    run = run_async(scenario())
+    assert [seq for seq, _ in run.replay(3)] == [4, 5, 6]
+    with pytest.raises(ReplayUnavailable):
+        run.replay(2)
+
+
+def test_wait_wakes_up_on_append_and_finish():
+    async def scenario():
+        run = StreamRun("run", 8)
+        assert not await run.wait(0, 0.01)
+        asyncio.get_running_loop().call_soon(run.append, {"content": "a"})
+        assert await run.wait(0, 1)
+        asyncio.get_running_loop().call_soon(run.finish, "ok")
+        assert await run.wait(1, 1)
+        return run
+
+    run = run_async(scenario())
+    assert run.finished and run.status == "ok"
+
+
+def test_registry_shares_unfinished_runs_and_expires_finished_ones():
+    async def scenario():
+        registry = StreamRegistry(ttl=0.01)
+        run = StreamRun("run", 2, key="request")
+        registry.add(run)
+        assert registry.in_flight("request") is run
+        run.append({})
+        run.append({})
+        run.append({})
+        # The start of the run left the buffer, so a new subscriber could not read it whole
+        assert registry.in_flight("request") is None
+        run.finish("ok")
+        registry.finish(run)
+        assert registry.get("run") is run
+        await asyncio.sleep(0.02)
+        return registry
+
+    registry = run_async(scenario())
+    assert registry.get("run") is None
+    assert len(registry) == 0
@@ -0,0 +1,60 @@
+import json
+
+from openai_server_stream.sse import DeltaCoalescer, SSEEncoder
+
+
+def events(frames: bytes):
+    return [line[len(b"data: "):] for line in frames.split(b"\n") if line.startswith(b"data: ")]
+
+
+def test_error_ends_stream_with_done():
+    frames = SSEEncoder("gpt-4o", completion_id="run").error("cancelled", "cancelled", event_id="run:7")
+    assert frames.startswith(b"id: run:7\n")
+    error, done = events(frames)
+    assert json.loads(error)["error"]["code"] == "cancelled"
+    assert done == b"[DONE]"
+
+
+def delta(content, stage="s", **extra):
+    return dict({"type": "content", "content": content, "metadata": {"stage": stage}}, **extra)
+
+
+def test_coalescer_merges_deltas_of_a_stage():
+    coalescer = DeltaCoalescer(max_bytes=100)
+    assert coalescer.push(delta("a", id=1)) == []
+    assert coalescer.pending_since is not None
+    assert coalescer.push(delta("b", id=2)) == []
+    merged = coalescer.flush()
+    # The merged delta keeps the id of the last chunk
+    assert merged["content"] == "ab" and merged["id"] == 2
+    assert coalescer.pending is None and coalescer.pending_since is None
+    assert coalescer.flush() is None
+
+
+def test_coalescer_flushes_at_max_bytes():
+    coalescer = DeltaCoalescer(max_bytes=4)
+    assert coalescer.push(delta("ab")) == []
+    assert [d["content"] for d in coalescer.push(delta("cd"))] == ["abcd"]
+    assert coalescer.pending is None
+
+
+def test_coalescer_flushes_before_a_stage_change_and_the_final_chunk():
+    coalescer = DeltaCoalescer(max_bytes=100)
+    coalescer.push(delta("a"))
+    ready = coalescer.push(delta("b", stage="other"))
+    assert [d["content"] for d in ready] == ["a"]
+    # Chunks with articles start a new delta
+    ready = coalescer.push(delta("c", stage="other", articles=[{"url": "u"}]))
+    assert [d["content"] for d in ready] == ["b"]
+    final = delta("", stage="other", end="yes")
+    ready = coalescer.push(final)
+    # The pending delta goes first, the final chunk is never held back
+    assert [d["content"] for d in ready] == ["c", ""] and ready[-1] is final
+    assert coalescer.pending is None
+
+
+def test_coalescer_without_max_bytes_passes_chunks_through():
+    coalescer = DeltaCoalescer(max_bytes=0)
+    chunks = [delta("a"), delta("b")]
+    assert [coalescer.push(chunk) for chunk in chunks] == [[chunks[0]], [chunks[1]]]
+    assert coalescer.pending is None